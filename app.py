@@ -1,3 +1,5 @@
+import argparse
+
 import pygame
 import const
 
@@ -10,6 +12,12 @@ import ui.elements as elements
 import ui.sprites as sprites
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shows a grid of profit/loss by starting hand.")
+    parser.add_argument("--follow", action="store_true",
+                        help=f"keep checking {const.LOG_DIR} for new hands (e.g. during a live session)")
+    parser.add_argument("--poll-secs", type=float, default=10., help="how often to check for new hands (default: 10)")
+    args = parser.parse_args()
+
     pygame.init()
     screen = pygame.display.set_mode(const.GAME_DIMS, flags=pygame.RESIZABLE)
     # screen = utils.make_fancy_scaled_display(
@@ -21,7 +29,12 @@ if __name__ == "__main__":
     pygame.display.set_caption(const.NAME_OF_GAME)
 
     sprites.Sprites.initialize(utils.res_path("assets/fonts/m6x11.ttf"))
+    follower = None
+    if args.follow:
+        follower = scraping.LogFollower(const.HERO_ID, const.LOG_DOWNLOADER_ID)
+        follower.poll_directory(const.LOG_DIR, skip=True)  # the hands that are already finished get scraped below
     all_hands = scraping.scrape_directory(const.HERO_ID, const.LOG_DOWNLOADER_ID, const.LOG_DIR)
+    seen_hands = set(all_hands.hands)
 
     grid_res = (500, 500)
     grid = elements.CardGrid([20, screen.get_height() / 2 - grid_res[1] / 2, grid_res[0], grid_res[1]], all_hands)
@@ -30,6 +43,7 @@ if __name__ == "__main__":
 
     clock = pygame.time.Clock()
     dt = 0
+    time_since_poll = 0
 
     scene_manager = scenes.SceneManager(scenes.Scene())
 
@@ -61,6 +75,14 @@ if __name__ == "__main__":
             elif e.type == pygame.WINDOWLEAVE:
                 const.MOUSE_XY = None
 
+        time_since_poll += dt
+        if follower is not None and time_since_poll >= args.poll_secs * 1000:
+            time_since_poll = 0
+            new_hands = [h for h in follower.poll_directory(const.LOG_DIR) if h not in seen_hands]
+            if len(new_hands) > 0:
+                seen_hands.update(new_hands)
+                grid.add_hands(new_hands)
+
         dims = screen.get_size()
 
         leng = int(min(dims) * 0.9)
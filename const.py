@@ -6,6 +6,8 @@ NAME_OF_GAME = "Ghast Poker Analyzer"
 GAME_DIMS = (960, 960)
 THRESH = 0.0001
 EQUITY_CALC_N_ITERS = 1000
+EQUITY_CALC_TOLERANCE = 0.01      # all-in equities are sampled until their standard error is below this...
+EQUITY_CALC_MAX_ITERS = 20000     # ...or this many run-outs have been sampled.
 
 HERO_ID = 'Ghast @ k-xm91OpZ6'              # ID of the player to track.
 # HERO_ID = 'M1sf1re @ TNLfj8hFbJ'            # (for debug) M1sf1re
@@ -20,8 +22,12 @@ LOG_DOWNLOADER_ID = 'k-xm91OpZ6'    # ID of the player who downloaded the logs.
 
 LOG_DIR = "C:\\Users\\david\\Desktop\\Poker Notes\\logs"
 # LOG_DIR = "testdata"
-EQUITY_DB = "assets\\preflop_equities_n1000.txt"
+EQUITY_DB = os.path.join("assets", "preflop_equities_n1000.txt")
+EQUITY_DB_BIN = os.path.join("assets", "preflop_equities_n1000.bin")  # built from EQUITY_DB (see preflop_db.py)
+EQUITY_MATRIX = os.path.join("assets", "preflop_cardcode_matrix.bin")  # built from EQUITY_DB_BIN
 ALIAS_FILENAME = "player_aliases.json"
+HAND_CACHE_DIR = os.path.join(".cache", "hands")  # parsed hands are cached here (see poker/hand_cache.py)
+EQUITY_CACHE_DB = os.path.join(".cache", "equities.sqlite3")  # equity results are cached here (see poker/equity_cache.py)
 
 IS_DEV = os.path.exists(".gitignore")
 
@@ -3,8 +3,10 @@
 import typing
 import locale
 import json
+import argparse
+import time
 
-from poker import filters, actions, hands, scraping, preflop_db, cardutils
+from poker import filters, actions, hands, scraping, preflop_db, cardutils, stats
 
 import const
 
@@ -17,10 +19,132 @@ def load_aliases_from_disk(fname):
         return {}
 
 
+def print_situational_breakdowns(results: typing.List[hands.HandGroup], results_stats: typing.Dict[str, stats.StatsRecord]):
+    results.sort(key=lambda x: results_stats[x.desc].avg_bbs_per_play(), reverse=True)
+    for res in results:
+        if len(res) > 0:  # skip categories with zero hands
+            print(res.summary(stats=results_stats[res.desc]))
+            # if res.desc == "Middle 33%":
+            #     for h in res:
+            #         print(f"  {h}")
+    print()
+
+
+def print_hero_summary(hero_hands: hands.HandGroup, hero_stats: stats.StatsRecord):
+    n_hands = hero_stats.hands_played()
+    print(f"-- Summary of {const.HERO_ID} --")
+    print(f"Hands:        {n_hands} (in {hero_hands.session_count()} sessions)")
+    if n_hands == 0:
+        print()
+        return
+
+    # When analyzing another player as the hero, a good chunk of their cards will be unknown.
+    n_unknown = len(hero_hands.filter(filters.HeroCardsKnown(counts=0)))
+    n_one_known = len(hero_hands.filter(filters.HeroCardsKnown(counts=1)))
+    if n_unknown > 0 or n_one_known > 0:
+        pcnt = (n_hands - n_unknown - n_one_known / 2) / n_hands
+        print(f"Known Cards:  {pcnt * 100.:.2f}%")
+
+    net = hero_stats.net_gain()
+    sign = '+' if net > 0 else ''
+    print(f"Saw Flop:     {hero_stats.n_saw_flop} time(s) ({hero_stats.saw_flop_pcnt() * 100.:.2f}%)")
+    print(f"VPIP:         {hero_stats.vpip_pcnt() * 100:.2f}%")
+    print(f"3BET%:        {hero_stats.three_bet_pcnt() * 100:.2f}%")
+    print(f"Net Gain:     {locale.currency(net)}")
+    print(f"Edge:         {sign}{hero_stats.avg_bbs_per_play():.2f}bb per hand, "
+                        f"{sign}{locale.currency(net / hero_hands.total_duration() * 3600.)} "
+                        f"per hour (in {round(hero_hands.total_duration() / 3600.)} hours)")
+    print()
+
+
+def print_player_breakdowns(all_hands: hands.HandGroup, player_stats: typing.Dict[str, stats.StatsRecord]):
+    sess_dates = all_hands.dates(first_hand_per_sess_only=True)
+    if len(sess_dates) > 0:
+        daterange_str = f"{sess_dates[0]} to {sess_dates[-1]}" if len(sess_dates) > 1 else f"{sess_dates[0]}"
+    else:
+        daterange_str = "---"
+
+    print(f"-- Player Breakdowns ({all_hands.session_count()} session(s): {daterange_str}) --")
+    for pid in sorted(player_stats, key=lambda x: player_stats[x].net_gain(), reverse=True):
+        print(all_hands.summary(player_id=pid, stats=player_stats[pid]))
+    print()
+
+
+def add_new_players(all_hands: hands.HandGroup, new_hands: typing.Sequence[hands.Hand],
+                    player_stats: typing.Dict[str, stats.StatsRecord]):
+    """adds records for the players who first show up in new_hands (which are already in all_hands)."""
+    known_ids = {pid.split(" @ ")[-1] for pid in player_stats}
+    new_players = [pid for pid in hands.HandGroup(new_hands).players() if pid.split(" @ ")[-1] not in known_ids]
+    if len(new_players) > 0:
+        old_hands = hands.HandGroup(all_hands.hands[:len(all_hands) - len(new_hands)])
+        player_stats.update(stats.calc_stats_by_player(old_hands, new_players))
+
+
+def add_per_hand_stats(per_hand_stats: typing.Dict[str, hands.HandGroup], hero_hands: typing.Iterable[hands.Hand]):
+    """adds each hand the hero won or lost money in to the group of the hero's card code."""
+    for h in hero_hands:
+        p = h.get_hero()
+        if p.net() != 0:
+            cc = p.get_card_code()
+            if cc is not None:
+                if cc not in per_hand_stats:
+                    per_hand_stats[cc] = hands.HandGroup([], desc=cc)
+                per_hand_stats[cc].append(h)
+
+
+def print_per_hand_stats(per_hand_stats: typing.Dict[str, hands.HandGroup]):
+    ents = [v for v in per_hand_stats.values() if len(v) >= 3]
+    ents.sort(key=lambda x: x.avg_gain_per_play(), reverse=True)
+
+    for ent in ents:
+        avg = f"{ent.avg_bbs_per_play():.1f}bb"
+        tot = locale.currency(ent.net_gain())
+        print(f"{ent.desc:<12}{avg:<12}{tot: <10} in {len(ent)} hand(s)")
+    print()
+
+    print("-- Per-Hand Profit Table --")
+    cards = ["A", "K", "Q", "J", "T", "9", "8", "7", "6", "5", "4", "3", "2"]
+    print(" " * 12 + "".join(f"{c:<12}" for c in cards))
+    for c1 in cards:
+        line = f"{c1:<12}"
+        for c2 in cards:
+            if c1 == c2:
+                hand = c1 + c2
+            elif cards.index(c1) < cards.index(c2):
+                hand = c1 + c2 + "s"
+            else:
+                hand = c2 + c1 + "o"
+            cnt = len(per_hand_stats[hand]) if hand in per_hand_stats else 0
+            avg = per_hand_stats[hand].avg_bbs_per_play() if hand in per_hand_stats else 0
+            text = f"{avg:.1f} ({cnt})"
+            line += f"{text:<12}"
+        print(line)
+    print()
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parses Pokernow logs and prints profit/loss breakdowns.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes to parse log files with (default: 1)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"re-parse every log and re-calculate all-in equities instead of using the hands "
+                             f"and equities cached in {const.HAND_CACHE_DIR} and {const.EQUITY_CACHE_DB}")
+    parser.add_argument("--follow", action="store_true",
+                        help=f"after the report, keep checking {const.LOG_DIR} for new hands and print updated "
+                             f"breakdowns (e.g. during a live session)")
+    parser.add_argument("--poll-secs", type=float, default=10., help="how often to check for new hands (default: 10)")
+    args = parser.parse_args()
+
     preflop_db.load_from_disk()
     aliases = load_aliases_from_disk(const.ALIAS_FILENAME)
-    all_hands = scraping.scrape_directory(const.HERO_ID, const.LOG_DOWNLOADER_ID, const.LOG_DIR, aliases=aliases)
+    follower = None
+    if args.follow:
+        follower = scraping.LogFollower(const.HERO_ID, const.LOG_DOWNLOADER_ID, aliases=aliases)
+        follower.poll_directory(const.LOG_DIR, skip=True)  # the hands that are already finished get scraped below
+    all_hands = scraping.scrape_directory(const.HERO_ID, const.LOG_DOWNLOADER_ID, const.LOG_DIR, aliases=aliases,
+                                          workers=args.workers, cache_dir=None if args.no_cache else const.HAND_CACHE_DIR,
+                                          equity_cache_db=None if args.no_cache else const.EQUITY_CACHE_DB)
+    seen_hands = set(all_hands.hands)
 
     for h in all_hands:
         payouts = cardutils.calc_payouts(h)
@@ -47,41 +171,11 @@ if __name__ == "__main__":
         print()
 
     hero_hands = all_hands.filter(filters.HeroPlayed())
+    hero_stats = stats.calc_stats(hero_hands)
+    print_hero_summary(hero_hands, hero_stats)
 
-    print(f"-- Summary of {const.HERO_ID} --")
-    print(f"Hands:        {len(hero_hands)} (in {hero_hands.session_count()} sessions)")
-
-    # When analyzing another player as the hero, a good chunk of their cards will be unknown.
-    unknown_card_hands = hero_hands.filter(filters.HeroCardsKnown(counts=0))
-    one_known_card_hands = hero_hands.filter(filters.HeroCardsKnown(counts=1))
-    if len(unknown_card_hands) > 0 or len(one_known_card_hands) > 0:
-        pcnt = (len(hero_hands) - len(unknown_card_hands) - len(one_known_card_hands) / 2) / len(hero_hands)
-        print(f"Known Cards:  {pcnt * 100.:.2f}%")
-
-    saw_flop_filter = filters.HeroSawStreet(actions.FLOP)
-    saw_flop_hands = hero_hands.filter(saw_flop_filter, desc="Saw Flop")
-    sign = '+' if hero_hands.net_gain() > 0 else ''
-    print(f"Saw Flop:     {len(saw_flop_hands)} time(s) ({len(saw_flop_hands) / len(hero_hands) * 100.:.2f}%)")
-    print(f"VPIP:         {hero_hands.vpip_pcnt() * 100:.2f}%")
-    print(f"3BET%:        {hero_hands.get_3bet_pcnt() * 100:.2f}%")
-    print(f"Net Gain:     {locale.currency(hero_hands.net_gain())}")
-    print(f"Edge:         {sign}{hero_hands.net_bbs() / len(hero_hands):.2f}bb per hand, "
-                        f"{sign}{locale.currency(hero_hands.net_gain() / hero_hands.total_duration() * 3600.)} "
-                        f"per hour (in {round(hero_hands.total_duration() / 3600.)} hours)")
-    print()
-
-    sess_dates = all_hands.dates(first_hand_per_sess_only=True)
-    if len(sess_dates) > 0:
-        daterange_str = f"{sess_dates[0]} to {sess_dates[-1]}" if len(sess_dates) > 1 else f"{sess_dates[0]}"
-    else:
-        daterange_str = "---"
-
-    print(f"-- Player Breakdowns ({all_hands.session_count()} session(s): {daterange_str}) --")
-    known_players = all_hands.players()
-    known_players.sort(key=lambda pid: all_hands.net_gain(player_id=pid), reverse=True)
-    for pid in known_players:
-        print(all_hands.summary(player_id=pid))
-    print()
+    player_stats = stats.calc_stats_by_player(all_hands, all_hands.players())
+    print_player_breakdowns(all_hands, player_stats)
 
     print(f"-- Situational Breakdowns for {const.HERO_ID} --")
 
@@ -141,50 +235,52 @@ if __name__ == "__main__":
     }
 
     custom_results = [hero_hands.filter(custom_filters[f], desc=f) for f in custom_filters]
-    custom_results.sort(key=lambda x: x.avg_bbs_per_play(), reverse=True)
-
-    for res in custom_results:
-        if len(res) > 0:  # skip categories with zero hands
-            print(res.summary())
-            # if res.desc == "Middle 33%":
-            #     for h in res:
-            #         print(f"  {h}")
-    print()
+    custom_stats = {res.desc: stats.calc_stats(res) for res in custom_results}
+    print_situational_breakdowns(custom_results, custom_stats)
 
     print(f"-- Per-Hand Stats for {const.HERO_ID} --")
     my_per_hand_stats: typing.Dict[str, hands.HandGroup] = {}
-    for h in hero_hands:
-        p = h.get_hero()
-        if p.net() != 0:
-            cc = p.get_card_code()
-            if cc is not None:
-                if cc not in my_per_hand_stats:
-                    my_per_hand_stats[cc] = hands.HandGroup([], desc=cc)
-                my_per_hand_stats[cc].append(h)
-
-    ents = [v for v in my_per_hand_stats.values() if len(v) >= 3]
-    ents.sort(key=lambda x: x.avg_gain_per_play(), reverse=True)
-
-    for ent in ents:
-        avg = f"{ent.avg_bbs_per_play():.1f}bb"
-        tot = locale.currency(ent.net_gain())
-        print(f"{ent.desc:<12}{avg:<12}{tot: <10} in {len(ent)} hand(s)")
-    print()
-
-    print("-- Per-Hand Profit Table --")
-    cards = ["A", "K", "Q", "J", "T", "9", "8", "7", "6", "5", "4", "3", "2"]
-    print(" " * 12 + "".join(f"{c:<12}" for c in cards))
-    for c1 in cards:
-        line = f"{c1:<12}"
-        for c2 in cards:
-            if c1 == c2:
-                hand = c1 + c2
-            elif cards.index(c1) < cards.index(c2):
-                hand = c1 + c2 + "s"
-            else:
-                hand = c2 + c1 + "o"
-            cnt = len(my_per_hand_stats[hand]) if hand in my_per_hand_stats else 0
-            avg = my_per_hand_stats[hand].avg_bbs_per_play() if hand in my_per_hand_stats else 0
-            text = f"{avg:.1f} ({cnt})"
-            line += f"{text:<12}"
-        print(line)
+    add_per_hand_stats(my_per_hand_stats, hero_hands)
+    print_per_hand_stats(my_per_hand_stats)
+
+    if follower is not None:
+        print(f"-- Following {const.LOG_DIR} for new hands (Ctrl+C to stop) --")
+        hero_played = filters.HeroPlayed()
+        results_by_desc = {res.desc: res for res in custom_results}
+        try:
+            while True:
+                time.sleep(args.poll_secs)
+                new_hands = [h for h in follower.poll_directory(const.LOG_DIR) if h not in seen_hands]
+                if len(new_hands) == 0:
+                    continue
+                seen_hands.update(new_hands)
+                all_hands.extend(new_hands)
+
+                # only the new hands need to be added to the stats
+                add_new_players(all_hands, new_hands, player_stats)
+                for h in new_hands:
+                    for record in player_stats.values():
+                        record.add_group_hand(h)
+                new_hero_hands = hands.HandGroup(new_hands).filter(hero_played)
+                hero_hands.extend(new_hero_hands.hands)
+                for h in new_hero_hands:
+                    hero_stats.add_group_hand(h)
+                for desc, f in custom_filters.items():
+                    matches = new_hero_hands.filter(f).hands
+                    results_by_desc[desc].extend(matches)
+                    for h in matches:
+                        custom_stats[desc].add_group_hand(h)
+                add_per_hand_stats(my_per_hand_stats, new_hero_hands)
+
+                print(f"** {len(new_hands)} new hand(s) **")
+                for h in sorted(new_hands, key=lambda x: x.timestamp):
+                    print(f"  {h}")
+                print()
+                print_hero_summary(hero_hands, hero_stats)
+                print_player_breakdowns(all_hands, player_stats)
+                print(f"-- Situational Breakdowns for {const.HERO_ID} --")
+                print_situational_breakdowns(custom_results, custom_stats)
+                print(f"-- Per-Hand Stats for {const.HERO_ID} --")
+                print_per_hand_stats(my_per_hand_stats)
+        except KeyboardInterrupt:
+            pass
@@ -1,5 +1,7 @@
 import typing
 
+from poker import players
+
 # Streets
 PRE_FLOP = "pre-flop"
 FLOP = "flop"
@@ -90,11 +92,21 @@ class Action:
 
     def __init__(self, player_id, amount, action_type, street, all_in=False):
         self.player_id = player_id
+        self.player_idx = players.intern(player_id)
         self.amount = amount
         self.action_type = action_type
         self.street = street
         self.all_in = all_in
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["player_idx"]  # only valid in this process
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.player_idx = players.intern(self.player_id)
+
     def is_vpip(self):
         return self.action_type in (CALL, OPEN, RAISE)
 
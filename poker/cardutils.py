@@ -1,13 +1,16 @@
 import collections
 import math
 import random
-import re
 import typing
 import functools
 import itertools
+import time
 
 import poker.hands
 import poker.actions
+import poker.evaluator as evaluator
+import poker.enumeration as enumeration
+import poker.equity_cache as equity_cache
 import profiling
 import const
 
@@ -170,79 +173,12 @@ def get_best_preflop_card_codes(min_pcnt, max_pcnt=1.):
 
 
 def cards_match_pattern(cards, pattern_code: str):
-    patterns = re.split(r'[ ,]+', pattern_code.strip())
-    for pattern in patterns:
-        code = to_card_code(cards)
-        if "%" in pattern:
-            # "33%" (means best 33% of pre-flop hands)
-            # "60-20%" (means best 60-20% of pre-flop hands)
-            pattern = pattern.replace('%', '')
-            if "-" in pattern:
-                min_pcnt = 1 - float(pattern.split("-")[0]) / 100.
-                max_pcnt = 1 - float(pattern.split("-")[1]) / 100.
-            else:
-                min_pcnt = 1 - float(pattern) / 100.
-                max_pcnt = 1.0
-            return code in get_best_preflop_card_codes(min_pcnt, max_pcnt=max_pcnt)
-
-        elif "+" not in pattern and "-" not in pattern:
-            if code == pattern:
-                return True  # exact match
-            if (not pattern.endswith("s") and not pattern.endswith("o")
-                    and (code.endswith("s") or code.endswith("o"))
-                    and code[:2] == pattern):
-                return True  # AKo and AKs should match AK
-        elif "+" in pattern:
-            if pattern[0] == pattern[1]:  # a 66+ type pattern
-                idx = RANKS.index(pattern[0])
-                for r in RANKS[0:idx+1]:
-                    if cards_match_pattern(cards, f"{r}{r}"):
-                        return True
-            else:
-                # an A5+ style pattern (meaning A5, A6, ... AK)
-                r1 = pattern[0]
-                r2 = pattern[1]
-                p = f"{r1}X"
-                if pattern[2] in ("s", "o"):
-                    p += pattern[2]
-                for idx in range(RANKS.index(r2), RANKS.index(r1)):
-                    if cards_match_pattern(cards, p):
-                        return True
-        elif "-" in pattern:
-            p1, p2 = pattern.split("-")
-            if (p1.endswith("s") and p2.endswith("o")) or (p1.endswith("o") and p2.endswith("s")):
-                raise ValueError(f"Non-uniform suitedness codes in range-based pattern: {pattern}")
-            suit = "o" if (p1.endswith("o") or p2.endswith("o")) else ("s" if (p1.endswith("s") or p2.endswith("s")) else "")
-            if p1[0] == p1[1]:
-                if p2[0] != p2[1]:
-                    raise ValueError(f"Invalid range-based pattern: {pattern}")
-                # 66-TT type pattern (pairs)
-                idx1 = RANKS.index(p1[0])
-                idx2 = RANKS.index(p2[0])
-                for i in range(min(idx1, idx2), max(idx1, idx2) + 1):
-                    if cards_match_pattern(cards, f"{RANKS[i]}{RANKS[i]}"):
-                        return True
-            elif p1[0] == p2[0]:
-                # A5-A9 type range (kickers)
-                idx1 = RANKS.index(p1[1])
-                idx2 = RANKS.index(p2[1])
-                for i in range(min(idx1, idx2), max(idx1, idx2) + 1):
-                    if cards_match_pattern(cards, f"{p1[0]}{RANKS[i]}{suit}"):
-                        return True
-            else:
-                # JTs-87s type range (gappers)
-                p1_idx1 = RANKS.index(p1[0])
-                p1_idx2 = RANKS.index(p1[1])
-                p2_idx1 = RANKS.index(p2[0])
-                p2_idx2 = RANKS.index(p2[1])
-                if p1_idx1 - p1_idx2 != p2_idx1 - p2_idx2:
-                    raise ValueError(f"Invalid range-based pattern: {pattern}")
-                gap = p1_idx1 - p1_idx2
-
-                for i in range(min(p1_idx1, p2_idx1), max(p1_idx1, p2_idx1) + 1):
-                    if cards_match_pattern(cards, f"{RANKS[i]}{RANKS[i-gap]}{suit}"):
-                        return True
-    return False
+    """
+    :param cards: hole cards, e.g. ('Ah', 'Kh').
+    :param pattern_code: comma or space-separated list of patterns, e.g. "JJ+, AQ+", "T9-76s", "A5-A2o", "66-33%".
+    """
+    import poker.ranges as ranges
+    return ranges.Range.parse(pattern_code).contains_cards(cards)
 
 
 def all_cards(ignore=()) -> typing.Generator[str, None, None]:
@@ -311,33 +247,37 @@ class EvalHand:
     def __init__(self, hole_cards, board):
         self.hole_cards = tuple(hole_cards)
         self.board = tuple(board)
+        self.strength = evaluator.evaluate_strs(self.hole_cards + self.board)
+        self._made = None  # (HAND_TYPE, cards, kicker(s)), only needed for display
+
+    def _get_made(self):
+        if self._made is None:
+            self._made = EvalHand._calc_hand(list(self.hole_cards) + list(self.board))
+        return self._made
 
-        made = EvalHand._calc_hand(list(hole_cards) + list(board))
-        self.made_type = made[0]
-        self.made_cards = made[1]
-        self.made_kickers = made[2]
+    @property
+    def made_type(self):
+        return HandTypes.ORDERED_BY_STRENGTH[evaluator.category(self.strength)]
+
+    @property
+    def made_cards(self):
+        return self._get_made()[1]
+
+    @property
+    def made_kickers(self):
+        return self._get_made()[2]
 
     def is_complete(self):
         return len(self.board) >= 5
 
     def __lt__(self, other: 'EvalHand'):
-        my_str = HandTypes.ORDERED_BY_STRENGTH.index(self.made_type)
-        other_str = HandTypes.ORDERED_BY_STRENGTH.index(other.made_type)
-        if my_str != other_str:
-            return my_str < other_str
-
-        cmp = compare_by_ranks(self.made_cards, other.made_cards)
-        if cmp != 0:
-            return cmp < 0
-
-        cmp = compare_by_ranks(self.made_kickers, other.made_kickers)
-        return cmp < 0
+        return self.strength < other.strength
 
     def __eq__(self, other: 'EvalHand'):
-        return not (self < other) and not (other < self)
+        return self.strength == other.strength
 
     def __hash__(self):
-        return hash((self.made_type, get_ranks(self.made_cards), get_ranks(self.made_kickers)))
+        return hash(self.strength)
 
     def __repr__(self):
         return str(self)
@@ -351,6 +291,7 @@ class EvalHand:
     @staticmethod
     def _calc_hand(cards):
         """returns: (HAND_TYPE, cards, kicker(s))
+        note: this is the slow, string-based version, used to describe hands (see evaluator.evaluate for ranking them)
         """
         cards = sort_by_rank(cards)
         by_suit = split_by_suits(cards)
@@ -433,250 +374,608 @@ class EvalHand:
         return HandTypes.HIGH_CARD, [cards[0]], cards[1:5]
 
 
-def calc_equities(h_list, board, limit=float('inf')) -> typing.List[float]:
+def calc_equities(h_list, board, limit=float('inf'), tolerance=None, time_budget=None) -> typing.List[float]:
     """
     :param h_list: list of hands [('Ad', 'Ks'), ('Qh', 'Qs'), ...].
     :param board: list of cards on board ['4h', '4d', 'Jd'].
     :param limit: how many run-outs to simulate (or inf, to simulate them all).
+    :param tolerance: if given, run-outs are sampled until every equity's standard error is below it (or limit
+                      or time_budget is reached) instead of simulating exactly `limit` of them. Use
+                      estimate_equities to get the standard errors too.
     :return: list of each hand's equity.
     """
-    if len(h_list) == 2 and len(board) == 0:
+    if tolerance is not None:
+        return estimate_equities(h_list, board, tolerance=tolerance, time_budget=time_budget,
+                                 max_runouts=_max_runouts(limit)).equities
+    elif len(h_list) == 2 and len(board) == 0:
         # if it's a H2H pre-flop lookup, use cache
         import poker.preflop_db as db
         eq = db.get_equity(h_list[0], h_list[1])
         return [eq, 1 - eq]
     else:
-        if len(board) == 0:
-            # multi-way equities pre-flop are very costly to calculate, always need to limit this
-            limit = min(limit, const.EQUITY_CALC_N_ITERS)
-
+        cache = equity_cache.get_cache()
+        key, order = _equities_cache_key(h_list, board, limit)
+        cached = cache.get(key)
+        if cached is not None:
+            return [cached[idx] for idx in order]
         wins = calc_wins(h_list, board, limit=limit)
         denom = sum(wins)
-        return [w / denom for w in wins]
+        res = [w / denom for w in wins]
+        cache.put(key, _to_canonical_order(res, order))
+        return res
 
 
-def generate_possible_runouts(board, cards_in_deck, draw_to=5, limit=float('inf')) \
-        -> typing.Generator[typing.List[str], None, None]:
+EquityEstimate = collections.namedtuple("EquityEstimate", ["equities", "std_errors", "n_runouts", "exact"])
 
-    to_draw = draw_to - len(board)
 
-    n_possible_outcomes = 1
-    for i in range(to_draw):
-        n_possible_outcomes *= (len(cards_in_deck) - i)
-    n_possible_outcomes /= math.factorial(to_draw)  # order of draws doesn't matter
+# defaults for adaptive sampling (see estimate_equities)
+MIN_RUNOUTS = 200
+EXACT_THRESHOLD = 2000
+
+# how run-outs are picked when there are too many to enumerate (see generate_possible_runouts). a fixed number
+# of them are sampled without repeats, while adaptive sampling deals an open-ended stream of balanced decks
+# (so a run-out can come up more than once). both are part of the equity cache keys.
+SAMPLING = "shuffled"
+ADAPTIVE_SAMPLING = "balanced"
+
+
+def estimate_equities(h_list, board, tolerance=0.01, time_budget=None, min_runouts=MIN_RUNOUTS,
+                      max_runouts=const.EQUITY_CALC_MAX_ITERS, exact_threshold=EXACT_THRESHOLD, batch_size=100,
+                      rng=None) -> EquityEstimate:
+    """
+    Samples random run-outs until the standard error of every hand's equity is below the tolerance, so
+    lopsided spots stop early and close spots get more samples. Spots with at most exact_threshold possible
+    run-outs are enumerated exactly instead (with zero error). Run-outs are dealt from balanced decks (see
+    ADAPTIVE_SAMPLING), so they can repeat.
+    :param time_budget: if given, stops sampling after this many seconds (even if the tolerance isn't met).
+    :param min_runouts: samples to take before checking the errors (so that e.g. a 5% shot that hasn't hit
+                        yet isn't mistaken for a 0% one).
+    :param max_runouts: stops sampling after this many run-outs (even if the tolerance isn't met).
+    :raises ValueError: if the tolerance isn't positive.
+    :return: EquityEstimate(each hand's equity, their standard errors, run-outs used, whether it's exact).
+    """
+    used_cards = set(board).union(*h_list)
+    cards_in_deck = evaluator.to_ints(all_cards(ignore=used_cards))
+    to_draw = 5 - len(board)
+    n_possible = enumeration.count_runouts(len(cards_in_deck), to_draw)
+    if _is_exact(n_possible, max_runouts, tolerance, min_runouts=min_runouts, exact_threshold=exact_threshold):
+        wins = enumeration.calc_exact_wins(h_list, board)
+        denom = sum(wins)
+        return EquityEstimate([w / denom for w in wins], [0.] * len(h_list), n_possible, True)
+
+    cache = equity_cache.get_cache()
+    canonical, order = equity_cache.canonicalize([evaluator.to_ints(h) for h in h_list], evaluator.to_ints(board))
+    sampling = _sampling_param(len(cards_in_deck), to_draw, max_runouts, tolerance, min_runouts=min_runouts,
+                               exact_threshold=exact_threshold)
+    key = equity_cache.spot_key("estimate", canonical, sampling, f"min={min_runouts}")
+    cached = cache.get(key)
+    n_hands = len(h_list)
+    if cached is not None and cached[-1] <= max_runouts:
+        return EquityEstimate([cached[i] for i in order], [cached[n_hands + i] for i in order], int(cached[-1]), False)
+
+    known = evaluator.to_ints(board)
+    partials = [evaluator.PartialHand(evaluator.to_ints(h) + known) for h in h_list]
+
+    def pot_shares(draws):
+        strengths = evaluator.evaluate_runout(partials, draws)
+        best = max(strengths)
+        n_winners = strengths.count(best)
+        return [1 / n_winners if st == best else 0. for st in strengths]
+
+    runouts = _balanced_runouts(cards_in_deck, to_draw, rng if rng is not None else random)
+    sums, sums_sq, n, met_tolerance = _sample_until(runouts, pot_shares, n_hands, tolerance, time_budget=time_budget,
+                                                    min_runouts=min_runouts, max_runouts=max_runouts,
+                                                    batch_size=batch_size)
+    equities = [total / n for total in sums]
+    errors = _std_errors(sums, sums_sq, n)
+    if met_tolerance:
+        # (results cut short by max_runouts or the time budget aren't as accurate as the key says)
+        cache.put(key, _to_canonical_order(equities, order) + _to_canonical_order(errors, order) + [n])
+    return EquityEstimate(equities, errors, n, False)
+
+
+def _sample_until(runouts, score, n_values, tolerance, time_budget=None, min_runouts=MIN_RUNOUTS,
+                  max_runouts=float('inf'), batch_size=100) -> typing.Tuple[typing.List[float], typing.List[float], int, bool]:
+    """
+    Averages score(run-out) (a list of n_values numbers) over run-outs drawn from the given iterator, until every
+    average's standard error is at most the tolerance (or max_runouts or the time budget is reached).
+    :return: (sum of each value, sum of each value squared, number of run-outs, whether the tolerance was met)
+    """
+    _check_tolerance(tolerance)
+    sums = [0.] * n_values
+    sums_sq = [0.] * n_values
+    n = 0
+    start_time = time.perf_counter()
+    while n < max_runouts:
+        for _ in range(int(min(batch_size, max_runouts - n))):
+            for idx, value in enumerate(score(next(runouts))):
+                sums[idx] += value
+                sums_sq[idx] += value * value
+            n += 1
+        if n >= min_runouts and max(_std_errors(sums, sums_sq, n)) <= tolerance:
+            return sums, sums_sq, n, True
+        if time_budget is not None and time.perf_counter() - start_time >= time_budget:
+            break
+    return sums, sums_sq, n, False
+
+
+def _check_tolerance(tolerance):
+    if not tolerance > 0:
+        raise ValueError(f"tolerance must be positive: {tolerance}")
+
+
+def _max_runouts(limit) -> float:
+    """returns: the most run-outs to sample until a tolerance is met (limit, or a default cap if it's inf)."""
+    return limit if limit < float('inf') else const.EQUITY_CALC_MAX_ITERS
+
+
+def _is_exact(n_possible, limit, tolerance, min_runouts=MIN_RUNOUTS, exact_threshold=EXACT_THRESHOLD) -> bool:
+    """returns: whether a spot with n_possible run-outs is enumerated instead of sampled."""
+    if tolerance is None:
+        return limit >= n_possible
+    return n_possible <= max(exact_threshold, min_runouts) and n_possible <= limit
+
+
+def _std_errors(sums, sums_sq, n) -> typing.List[float]:
+    """returns: standard error of the mean of each per-run-out value (e.g. each hand's pot share)."""
+    if n < 2:
+        return [float('inf')] * len(sums)
+    res = []
+    for total, total_sq in zip(sums, sums_sq):
+        mean = total / n
+        variance = max(0., (total_sq - n * mean * mean) / (n - 1))
+        res.append(math.sqrt(variance / n))
+    return res
+
+
+def _sampling_param(n_cards_in_deck, n_to_draw, limit, tolerance=None, **exact_params) -> str:
+    """
+    :param exact_params: see _is_exact.
+    returns: how the equities of a spot are calculated, which is part of its cache key.
+    """
+    if _is_exact(enumeration.count_runouts(n_cards_in_deck, n_to_draw), limit, tolerance, **exact_params):
+        return "exact"
+    return f"n={int(limit)},{SAMPLING}" if tolerance is None else f"tol={tolerance},{ADAPTIVE_SAMPLING}"
+
+
+def _equities_cache_key(h_list, board, limit) -> typing.Tuple[str, typing.List[int]]:
+    """returns: (equity_cache key of the spot, index of each hand in the cached results)."""
+    canonical, order = equity_cache.canonicalize([evaluator.to_ints(h) for h in h_list], evaluator.to_ints(board))
+    sampling = _sampling_param(52 - len(board) - 2 * len(h_list), 5 - len(board), limit)
+    return equity_cache.spot_key("equities", canonical, sampling), order
+
+
+def _to_canonical_order(values, order) -> typing.List[float]:
+    res = [0.] * len(values)
+    for v, idx in zip(values, order):
+        res[idx] = v
+    return res
+
+
+def generate_possible_runouts(board, cards_in_deck, draw_to=5, limit=float('inf'), sampling=SAMPLING, rng=None) \
+        -> typing.Generator[typing.List[str], None, None]:
+    """
+    yields: every combination of cards that could be drawn to complete the board, or if there are more
+            than limit of them, limit of them picked by the sampling method:
+            "shuffled": uniformly at random without repeats (random indices, see enumeration.unrank_combination)
+            "balanced": dealt from a shuffled deck, reshuffling when it runs out, so every card is drawn
+                        (almost) equally often. Less variance than independent samples, but run-outs can
+                        repeat across decks.
+            "random": uniformly and independently at random (so run-outs can repeat)
+    """
+    to_draw = draw_to - len(board)
+    n_possible_outcomes = enumeration.count_runouts(len(cards_in_deck), to_draw)
+    rng = rng if rng is not None else random
 
     def gen() -> typing.Generator[typing.List[str], None, None]:
         if limit >= n_possible_outcomes:
             for res in itertools.combinations(cards_in_deck, to_draw):
                 yield res
-        else:
+        elif sampling == "balanced":
+            yield from itertools.islice(_balanced_runouts(cards_in_deck, to_draw, rng), int(limit))
+        elif sampling == "shuffled":
+            for idx in rng.sample(range(n_possible_outcomes), int(limit)):
+                yield [cards_in_deck[i] for i in enumeration.unrank_combination(idx, len(cards_in_deck), to_draw)]
+        elif sampling == "random":
             for _ in range(int(limit)):
-                yield random.sample(cards_in_deck, to_draw)
+                yield rng.sample(cards_in_deck, to_draw)
+        else:
+            raise ValueError(f"Unrecognized sampling method: {sampling}")
 
     for draws in gen():
         yield draws
 
 
+def _balanced_runouts(cards_in_deck, to_draw, rng) -> typing.Generator[typing.List, None, None]:
+    """yields: an endless stream of run-outs, dealt without replacement from repeatedly shuffled decks."""
+    deck = list(cards_in_deck)
+    while True:
+        rng.shuffle(deck)
+        for i in range(0, len(deck) - to_draw + 1, max(1, to_draw)):
+            yield deck[i:i + to_draw]
+
+
 def calc_wins(h_list, board, limit=float('inf')) -> typing.List[float]:
-    wins = [0] * len(h_list)
-    if len(board) >= 5:
-        evals = [(EvalHand(h, board), idx) for (idx, h) in enumerate(h_list)]
-        evals.sort(reverse=True)
-        winners = []
-        for i in range(len(evals)):
-            if i == 0 or evals[i][0] >= evals[i - 1][0]:
-                winners.append(evals[i])
-            else:
-                break
-        for _, idx in winners:
-            wins[idx] += 1 / len(winners)
-    else:
-        used_cards = set()
-        for (c1, c2) in h_list:
-            used_cards.add(c1)
-            used_cards.add(c2)
-        for c in board:
-            used_cards.add(c)
+    """
+    :return: each hand's share of the pot, summed over the simulated run-outs. If every run-out can be
+             simulated within the limit, they're enumerated exactly (see poker.enumeration).
+    """
+    used_cards = set(board)
+    for (c1, c2) in h_list:
+        used_cards.add(c1)
+        used_cards.add(c2)
+    cards_in_deck = list(all_cards(ignore=used_cards))
 
-        cards_in_deck = list(all_cards(ignore=used_cards))
+    if limit >= enumeration.count_runouts(len(cards_in_deck), 5 - len(board)):
+        return enumeration.calc_exact_wins(h_list, board)
 
-        for draws in generate_possible_runouts(board, cards_in_deck, draw_to=5, limit=limit):
-            w = calc_wins(h_list, board + list(draws))
-            for i in range(len(wins)):
-                wins[i] += w[i]
+    known = evaluator.to_ints(board)
+    partials = [evaluator.PartialHand(evaluator.to_ints(h) + known) for h in h_list]
+    wins = [0] * len(h_list)
+    for draws in generate_possible_runouts(board, evaluator.to_ints(cards_in_deck), draw_to=5, limit=limit):
+        strengths = evaluator.evaluate_runout(partials, draws)
+        best = max(strengths)
+        n_winners = strengths.count(best)
+        for idx, st in enumerate(strengths):
+            if st == best:
+                wins[idx] += 1 / n_winners
 
     return wins
 
 
 def calc_payouts(hand: 'poker.hands.Hand') -> typing.Dict[str, float]:
-    return calc_payouts_from_components(hand.players, list(hand.all_actions()), hand.get_boards())
-
-
-def _calc_pots(player_objs: typing.List['poker.hands.Player'], action_list: typing.List['poker.actions.Action']):
-    antes = 0
-    amounts_put_in = {}
-    active_players = set()
-    players_and_cards = {}
-
-    for player in player_objs:
-        active_players.add(player.name_and_id)
-        amounts_put_in[player.name_and_id] = -round(player.street_nets['pre-flop'] * 100 +
-                                                    player.street_nets['flop'] * 100 +
-                                                    player.street_nets['turn'] * 100 +
-                                                    player.street_nets['river'] * 100)
-        antes += -round(player.street_nets['ante'] * 100)
-        if player.known_cards() == 2:
-            players_and_cards[player.name_and_id] = player.cards
-    all_in_players = set()
-
-    for a in action_list:
-        if a.is_fold():
-            active_players.remove(a.player_id)
-            continue
-        elif a.is_all_in():
-            active_players.remove(a.player_id)
-            all_in_players.add(a.player_id)
+    return hand.get_pot_structure().payout(hand.get_boards())
 
-    remaining_players = [pid for pid in active_players.union(all_in_players)]
-    remaining_players.sort(key=lambda pid: amounts_put_in[pid])
 
-    pots = []
-    for idx, cur_pid in enumerate(remaining_players):
-        limit = amounts_put_in[cur_pid]
-        if limit <= 0:
-            continue
-        pot = {"value": 0, "players": set()}
-        for pid in amounts_put_in:
-            if amounts_put_in[pid] >= limit:
-                pot["players"].add(pid)
-                pot["value"] += limit
-                amounts_put_in[pid] -= limit
-            else:
-                # player contributed to pot but later folded
-                pot["value"] += amounts_put_in[pid]
-                amounts_put_in[pid] = 0
-        pots.append(pot)
+class PotStructure:
+    """
+    A hand's pot and side pots, in integer cents. Only depends on how much each player put in and who
+    folded, so it's built once per hand (see Hand.get_pot_structure) and then reused to pay out every
+    board or simulated run-out.
+    """
 
-    pots[0]["value"] += antes
+    def __init__(self, pots, remaining_players, contenders, contender_cards):
+        self.pots = pots                            # (value in cents, frozenset of eligible player ids) of each pot,
+                                                    # with antes in the first
+        self.remaining_players = remaining_players  # ids of the players who didn't fold
+        self.contenders = contenders                # remaining players with known cards, in position order
+        self.contender_cards = contender_cards      # hole cards of each contender
 
-    return pots, players_and_cards, remaining_players
+        # indices (into contenders) of the players who can win each pot, earliest position first
+        self.eligible = tuple(tuple(i for i, pid in enumerate(contenders) if pid in players)
+                               for _, players in pots)
+        self._contender_ints = tuple(evaluator.to_ints(cards) for cards in contender_cards)
+
+    @staticmethod
+    def build(player_objs: typing.List['poker.hands.Player'], action_list: typing.List['poker.actions.Action']) \
+            -> 'PotStructure':
+        antes = 0
+        amounts_put_in = {}
+        active_players = set()
+        players_and_cards = {}
+
+        for player in player_objs:
+            active_players.add(player.name_and_id)
+            amounts_put_in[player.name_and_id] = -round(player.street_nets['pre-flop'] * 100 +
+                                                        player.street_nets['flop'] * 100 +
+                                                        player.street_nets['turn'] * 100 +
+                                                        player.street_nets['river'] * 100)
+            antes += -round(player.street_nets['ante'] * 100)
+            if player.known_cards() == 2:
+                players_and_cards[player.name_and_id] = player.cards
+        all_in_players = set()
+
+        for a in action_list:
+            if a.is_fold():
+                active_players.remove(a.player_id)
+                continue
+            elif a.is_all_in():
+                active_players.remove(a.player_id)
+                all_in_players.add(a.player_id)
+
+        remaining_players = [pid for pid in active_players.union(all_in_players)]
+        remaining_players.sort(key=lambda pid: amounts_put_in[pid])
+
+        pots = []
+        for idx, cur_pid in enumerate(remaining_players):
+            limit = amounts_put_in[cur_pid]
+            if limit <= 0:
+                continue
+            pot = {"value": 0, "players": set()}
+            for pid in amounts_put_in:
+                if amounts_put_in[pid] >= limit:
+                    pot["players"].add(pid)
+                    pot["value"] += limit
+                    amounts_put_in[pid] -= limit
+                else:
+                    # player contributed to pot but later folded
+                    pot["value"] += amounts_put_in[pid]
+                    amounts_put_in[pid] = 0
+            pots.append(pot)
+
+        pots[0]["value"] += antes
+
+        pid_to_pos = {p.name_and_id: p.position for p in player_objs}
+        contenders = [pid for pid in players_and_cards if pid in remaining_players]
+        contenders.sort(key=lambda pid: pid_to_pos[pid])  # odd cents go to earlier positions
+        return PotStructure(tuple((pot["value"], frozenset(pot["players"])) for pot in pots),
+                            tuple(remaining_players), tuple(contenders),
+                            tuple(players_and_cards[pid] for pid in contenders))
+
+    def total(self) -> int:
+        return sum(value for value, _ in self.pots)
+
+    def max_payout(self, player_id) -> int:
+        """returns: the most the given player could win, in cents."""
+        return sum(value for value, players in self.pots if player_id in players)
+
+    def split(self, n_boards) -> typing.List['PotStructure']:
+        """returns: the pots divided evenly between n_boards run-outs (extra pennies go into earlier boards)."""
+        res = []
+        for idx in range(n_boards):
+            pots = []
+            for value, players in self.pots:
+                sub_value = value // n_boards
+                if idx < value - n_boards * sub_value:
+                    sub_value += 1
+                pots.append((sub_value, players))
+            res.append(PotStructure(tuple(pots), self.remaining_players, self.contenders, self.contender_cards))
+        return res
+
+    def payout_cents(self, strengths: typing.Sequence[int]) -> typing.Dict[str, int]:
+        """
+        :param strengths: evaluator strength of each contender's hand.
+        :return: player id -> cents won, for each player who won (part of) a pot.
+        """
+        if len(self.remaining_players) == 1:
+            return {self.remaining_players[0]: self.total()}
+
+        res = {}
+        for (value, _), eligible in zip(self.pots, self.eligible):
+            if len(eligible) == 0:
+                raise ValueError(f"Couldn't find a winner for pot: {value}, {self.contenders}")
+            best = max(strengths[i] for i in eligible)
+            winners = [i for i in eligible if strengths[i] == best]
+
+            per_player = value // len(winners)
+            extra = value - per_player * len(winners)
+            for i in winners:
+                pid = self.contenders[i]
+                res[pid] = res.get(pid, 0) + per_player + (1 if extra > 0 else 0)
+                extra -= 1
+        return res
+
+    def strengths(self, board_ints: typing.List[int]) -> typing.List[int]:
+        return [evaluator.evaluate(h + board_ints) for h in self._contender_ints]
+
+    def partial_hands(self, board_ints: typing.List[int]) -> typing.List[evaluator.PartialHand]:
+        """returns: each contender's hole cards plus the given board, to be extended by evaluator.evaluate_runout."""
+        return [evaluator.PartialHand(h + board_ints) for h in self._contender_ints]
+
+    def payout(self, boards) -> typing.Dict[str, float]:
+        """returns: player id -> amount won, with the pots split evenly between the given boards."""
+        total = {}
+        uncontested = len(self.remaining_players) == 1
+        for pots, board in zip(self.split(len(boards)) if len(boards) > 1 else [self], boards):
+            strengths = pots.strengths(evaluator.to_ints(board)) if not uncontested else ()
+            for pid, cents in pots.payout_cents(strengths).items():
+                total[pid] = total.get(pid, 0) + cents / 100.
+        return total
 
 
 def calc_payouts_from_components(
         player_objs: typing.List['poker.hands.Player'],
         action_list: typing.List['poker.actions.Action'],
         boards):
+    return PotStructure.build(player_objs, action_list).payout(boards)
 
-    pots, players_and_cards, remaining_players = _calc_pots(player_objs, action_list)
-
-    payouts = []
-    for idx, b in enumerate(boards):
-        sub_pots = []
-        for p in pots:
-            sub_pot = {"players": p["players"], "value": p["value"] // len(boards)}
-            extra = p["value"] - len(boards) * sub_pot["value"]
-            if idx < extra:
-                sub_pot["value"] += 1  # extra pennies go into earlier pots
-            sub_pots.append(sub_pot)
-        payouts.append(_get_payout_for_board(player_objs, b, players_and_cards, remaining_players, sub_pots))
-
-    if len(payouts) == 1:
-        return payouts[0]
-    else:
-        # recombine split pots
-        total_payout = {}
-        for payout in payouts:
-            for pid, value in payout.items():
-                if pid not in total_payout:
-                    total_payout[pid] = 0
-                total_payout[pid] += value
-        return total_payout
-
-
-def _get_payout_for_board(player_objs, board, players_and_cards, remaining_players, pots):
-
-    if len(remaining_players) == 1:
-        return {next(iter(remaining_players)): sum(p["value"] for p in pots) / 100.}
-
-    made_hands = {pid: EvalHand(players_and_cards[pid], tuple(board)) for pid in players_and_cards if (pid in remaining_players)}
-    sorted_hands = [(mh, pid) for pid, mh in made_hands.items()]
-    sorted_hands.sort(reverse=True)
-
-    grouped_hands = []
-    for mh in sorted_hands:
-        if len(grouped_hands) == 0:
-            grouped_hands.append([mh])
-        elif grouped_hands[-1][0][0] == mh[0]:
-            grouped_hands[-1].append(mh)
-        else:
-            grouped_hands.append([mh])
-
-    def _split_up_pot(pot):
-        winners = []
-        for group in grouped_hands:
-            for mh, g_pid in group:
-                if g_pid in pot["players"]:
-                    winners.append(g_pid)
-            if len(winners) > 0:
-                break
 
-        if len(winners) == 0:
-            raise ValueError(f"Couldn't find a winner for pot: {pot}, {grouped_hands}")
+def calc_all_in_equities(hand, cur_board, cards_in_deck, limit=float('inf'), tolerance=None, rng=None) \
+        -> typing.Dict[str, typing.Tuple[float, float, float]]:
+    """
+    :param limit: how many run-outs to simulate (or inf, to simulate them all).
+    :param tolerance: if given, run-outs are sampled until the standard error of each player's equity is
+                      below it (or limit is reached, or const.EQUITY_CALC_MAX_ITERS if limit is inf), like
+                      estimate_equities.
+    :return: player id -> (average payout, max payout, equity).
+    """
+    pots = hand.get_pot_structure()
+    cache = equity_cache.get_cache()
+    key = _all_in_cache_key(pots, cur_board, cards_in_deck, limit, tolerance)
+    cached = cache.get(key)
+    if cached is not None:
+        return _all_in_equities_from_avg_payouts(hand, pots, equity_cache.from_values(cached))
+
+    deck = evaluator.to_ints(cards_in_deck)
+    partials = pots.partial_hands(evaluator.to_ints(cur_board))
+    n_possible = enumeration.count_runouts(len(deck), 5 - len(cur_board))
+    if tolerance is None or _is_exact(n_possible, limit, tolerance):
+        n = 0
+        total_payouts = {}
+        for draws in generate_possible_runouts(cur_board, deck, limit=limit if tolerance is None else n_possible, rng=rng):
+            payouts = pots.payout_cents(evaluator.evaluate_runout(partials, draws))
+            n += 1
+            for pid, cents in payouts.items():
+                total_payouts[pid] = total_payouts.get(pid, 0) + cents
+        avg_payouts = [total_payouts[pid] / n if pid in total_payouts else None for pid in pots.contenders]
+        met_tolerance = True
+    else:
+        # each contender's payout as a fraction of the most they could win is in [0, 1] like an equity,
+        # so the tolerance means the same thing as it does in estimate_equities.
+        max_payouts = [pots.max_payout(pid) for pid in pots.contenders]
 
-        per_player = pot["value"] // len(winners)
+        def payout_shares(draws):
+            payouts = pots.payout_cents(evaluator.evaluate_runout(partials, draws))
+            return [payouts.get(pid, 0) / max_pay if max_pay > 0 else 0. for pid, max_pay in zip(pots.contenders, max_payouts)]
 
-        # logic for splitting non-evenly divisible pots
-        extra = pot["value"] - per_player * len(winners)
-        if extra > 0:
-            pid_to_pos = {p.name_and_id: p.position for p in player_objs}
-            winners.sort(key=lambda w_pid: pid_to_pos[w_pid])
+        runouts = _balanced_runouts(deck, 5 - len(cur_board), rng if rng is not None else random)
+        sums, _, n, met_tolerance = _sample_until(runouts, payout_shares, len(pots.contenders), tolerance,
+                                                  max_runouts=_max_runouts(limit))
+        avg_payouts = [total / n * max_pay if total > 0 else None for total, max_pay in zip(sums, max_payouts)]
 
-        res = {}
-        for w_pid in winners:
-            res[w_pid] = per_player
-            if extra > 0:
-                res[w_pid] += 1
-                extra -= 1
-        return res
+    if met_tolerance:
+        cache.put(key, equity_cache.to_values(avg_payouts))
+    return _all_in_equities_from_avg_payouts(hand, pots, avg_payouts)
 
-    res = {}
-    for p in pots:
-        split = _split_up_pot(p)
-        for pid in split:
-            if pid not in res:
-                res[pid] = 0
-            res[pid] += split[pid]
 
-    return {pid: res[pid] / 100. for pid in res}
+def _all_in_cache_key(pots: PotStructure, cur_board, cards_in_deck, limit, tolerance=None) -> str:
+    # contenders stay in position order (odd cents go to earlier positions), and any other cards that
+    # aren't in the deck are included as an extra "hand", since they're dead.
+    hands = [evaluator.to_ints(cards) for cards in pots.contender_cards]
+    dead = set(range(evaluator.N_CARDS)).difference(evaluator.to_ints(cards_in_deck), evaluator.to_ints(cur_board), *hands)
+    canonical, _ = equity_cache.canonicalize(hands + [sorted(dead)], evaluator.to_ints(cur_board), sort_hands=False)
+    layout = ",".join(f"{value}/{''.join(str(i) for i in eligible)}" for (value, _), eligible in zip(pots.pots, pots.eligible))
+    sampling = _sampling_param(len(cards_in_deck), 5 - len(cur_board), limit, tolerance)
+    return equity_cache.spot_key("all_in", canonical, layout, sampling)
 
 
-def calc_all_in_equities(hand, cur_board, cards_in_deck, limit=float('inf')) \
+def _all_in_equities_from_avg_payouts(hand, pots: PotStructure, avg_payouts) \
         -> typing.Dict[str, typing.Tuple[float, float, float]]:
+    """avg_payouts: average cents won by each of the pot's contenders, or None if they never won anything."""
+    res = {p.name_and_id: (0., 0., 0.) for p in hand.players}
+    for pid, avg_cents in zip(pots.contenders, avg_payouts):
+        if avg_cents is not None:
+            avg_pay = avg_cents / 100.
+            max_pay = pots.max_payout(pid) / 100.
+            res[pid] = (avg_pay, max_pay, avg_pay / max_pay)
+    return res
 
-    n = 0
-    all_actions = list(hand.all_actions())
-    total_payouts = {}
 
-    def combine_payouts(pay):
-        for pid in pay:
-            if pid not in total_payouts:
-                total_payouts[pid] = 0
-            total_payouts[pid] += pay[pid]
+def calc_all_in_equities_batch(spots, limit=float('inf'), tolerance=None, rng=None) \
+        -> typing.List[typing.Dict[str, typing.Tuple[float, float, float]]]:
+    """
+    Same as calc_all_in_equities, but for many hands at once. All the run-outs are evaluated
+    together with NumPy, which is much faster than looping over them one hand at a time.
+    :param spots: list of (hand, cur_board, cards_in_deck).
+    :param rng: a numpy.random.Generator.
+    """
+    try:
+        import poker.vectorized as vectorized
+    except ImportError:
+        return [calc_all_in_equities(hand, cur_board, cards_in_deck, limit=limit, tolerance=tolerance)
+                for (hand, cur_board, cards_in_deck) in spots]
+
+    cache = equity_cache.get_cache()
+    results = [None] * len(spots)
+    to_batch = []  # (idx, cache key)
+    to_sample = []  # (idx, cache key), for spots that are sampled until they're within the tolerance
+    strength_spots = []
+    for idx, (hand, cur_board, cards_in_deck) in enumerate(spots):
+        pots = hand.get_pot_structure()
+        key = _all_in_cache_key(pots, cur_board, cards_in_deck, limit, tolerance)
+        cached = cache.get(key)
+        if cached is not None:
+            results[idx] = _all_in_equities_from_avg_payouts(hand, pots, equity_cache.from_values(cached))
+            continue
+        n_possible = enumeration.count_runouts(len(cards_in_deck), 5 - len(cur_board))
+        if tolerance is not None and not _is_exact(n_possible, limit, tolerance):
+            to_sample.append((idx, key))
+            continue
+        boards = vectorized.generate_runouts(evaluator.to_ints(cur_board), evaluator.to_ints(cards_in_deck),
+                                             limit=limit if tolerance is None else n_possible, rng=rng)
+        strength_spots.append(([evaluator.to_ints(cards) for cards in pots.contender_cards], boards))
+        to_batch.append((idx, key))
 
-    for draws in generate_possible_runouts(cur_board, cards_in_deck, limit=limit):
-        n += 1
-        payouts = calc_payouts_from_components(hand.players, all_actions, [cur_board + list(draws)])
-        combine_payouts(payouts)
+    for (idx, key), strengths in zip(to_batch, vectorized.calc_strengths_batch(strength_spots)):
+        hand = spots[idx][0]
+        pots = hand.get_pot_structure()
+        total_payouts = vectorized.calc_pot_payouts(strengths, _eligibility(pots))
+        avg_payouts = [int(total) / len(strengths) if total > 0 else None for total in total_payouts]
+        cache.put(key, equity_cache.to_values(avg_payouts))
+        results[idx] = _all_in_equities_from_avg_payouts(hand, pots, avg_payouts)
 
-    pots, _, _ = _calc_pots(hand.players, list(hand.all_actions()))
+    if len(to_sample) > 0:
+        _sample_all_in_equities_batch(spots, to_sample, results, limit, tolerance, rng)
+    return results
 
-    res = {p.name_and_id: (0., 0., 0.) for p in hand.players}
-    for pid in total_payouts:
-        avg_pay = total_payouts[pid] / n
-        max_pay = sum(pot["value"] / 100. for pot in pots if (pid in pot["players"]))
-        res[pid] = (avg_pay, max_pay, avg_pay / max_pay)
 
-    return res
+def _sample_all_in_equities_batch(spots, to_sample, results, limit, tolerance, rng):
+    """
+    Samples run-outs for the given spots in rounds, until each one's equities are within the tolerance (see
+    calc_all_in_equities). Every round deals more run-outs for all of the spots that aren't done yet at once.
+    :param to_sample: list of (idx in spots, cache key).
+    :param results: list to put each spot's results in.
+    """
+    import numpy
+    import poker.vectorized as vectorized
+
+    _check_tolerance(tolerance)
+    limit = _max_runouts(limit)
+    cache = equity_cache.get_cache()
+    state = {}  # idx -> (sums, sums of squares, number of run-outs) of each contender's share of their max payout
+    active = list(to_sample)
+    while len(active) > 0:
+        strength_spots = []
+        for idx, _ in active:
+            hand, cur_board, cards_in_deck = spots[idx]
+            n = state[idx][2] if idx in state else 0
+            n_to_draw = min(max(MIN_RUNOUTS, n // 2), limit - n)  # so there are O(log(n)) rounds
+            boards = vectorized.generate_runouts(evaluator.to_ints(cur_board), evaluator.to_ints(cards_in_deck),
+                                                 limit=n_to_draw, rng=rng, sampling=ADAPTIVE_SAMPLING)
+            strength_spots.append(([evaluator.to_ints(cards) for cards in hand.get_pot_structure().contender_cards], boards))
+
+        still_active = []
+        for (idx, key), strengths in zip(active, vectorized.calc_strengths_batch(strength_spots)):
+            hand = spots[idx][0]
+            pots = hand.get_pot_structure()
+            max_payouts = numpy.array([pots.max_payout(pid) for pid in pots.contenders], dtype=numpy.float64)
+            payouts = vectorized.calc_runout_payouts(strengths, _eligibility(pots))
+            shares = numpy.divide(payouts, max_payouts, out=numpy.zeros(payouts.shape), where=max_payouts > 0)
+            sums, sums_sq, n = state.get(idx, (0., 0., 0))
+            sums, sums_sq, n = sums + shares.sum(axis=0), sums_sq + (shares * shares).sum(axis=0), n + len(shares)
+            state[idx] = (sums, sums_sq, n)
+
+            met_tolerance = n >= MIN_RUNOUTS and max(_std_errors(sums, sums_sq, n)) <= tolerance
+            if not met_tolerance and n < limit:
+                still_active.append((idx, key))
+                continue
+            avg_payouts = [float(total / n * max_pay) if total > 0 else None for total, max_pay in zip(sums, max_payouts)]
+            if met_tolerance:
+                cache.put(key, equity_cache.to_values(avg_payouts))
+            results[idx] = _all_in_equities_from_avg_payouts(hand, pots, avg_payouts)
+        active = still_active
+
+
+def _eligibility(pots: PotStructure) -> typing.List[typing.Tuple[int, typing.List[bool]]]:
+    """returns: the pots in the format vectorized.calc_pot_payouts takes."""
+    return [(value, [pid in players for pid in pots.contenders]) for value, players in pots.pots]
+
+
+def calc_equities_batch(list_of_spots, limit=float('inf')) -> typing.List[typing.List[float]]:
+    """
+    Same as calc_equities, but for many spots at once (evaluated together with NumPy).
+    :param list_of_spots: list of (h_list, board), e.g. [([('Ad', 'Ks'), ('Qh', 'Qs')], ['4h', '4d', 'Jd']), ...]
+    :param limit: how many run-outs to simulate per spot (or inf, to simulate them all).
+    :return: list of each spot's equities.
+    """
+    import poker.vectorized as vectorized
+
+    cache = equity_cache.get_cache()
+    results = [None] * len(list_of_spots)
+    to_batch = []  # (idx, cache key, hand order in the cached results, spot)
+    for idx, (h_list, board) in enumerate(list_of_spots):
+        used_cards = set(board).union(*h_list)
+        n_runouts = enumeration.count_runouts(52 - len(used_cards), 5 - len(board))
+        if len(board) == 0 and (len(h_list) == 2 or limit >= n_runouts):
+            # pre-flop spots are cheaper to look up or enumerate than to deal out
+            results[idx] = calc_equities(h_list, board, limit=limit)
+            continue
+        key, order = _equities_cache_key(h_list, board, limit)
+        cached = cache.get(key)
+        if cached is not None:
+            results[idx] = [cached[i] for i in order]
+        else:
+            boards = vectorized.generate_runouts(evaluator.to_ints(board),
+                                                 evaluator.to_ints(all_cards(ignore=used_cards)), limit=limit)
+            to_batch.append((idx, key, order, ([evaluator.to_ints(h) for h in h_list], boards)))
+
+    all_strengths = vectorized.calc_strengths_batch([spot for _, _, _, spot in to_batch])
+    for (idx, key, order, _), strengths in zip(to_batch, all_strengths):
+        wins = vectorized.calc_win_shares(strengths)
+        results[idx] = [float(w / len(strengths)) for w in wins]
+        cache.put(key, _to_canonical_order(results[idx], order))
+
+    return results
 
 
 def format_pcnt(pcnt: float, cap=True) -> str:
@@ -701,7 +1000,7 @@ def safe_eq(coll1, coll2, thresh=0.00001):
                 if not safe_eq(coll1[k], coll2[k], thresh=thresh):
                     return False
         return True
-    elif isinstance(coll1, collections.Sequence):
+    elif isinstance(coll1, collections.abc.Sequence):
         if len(coll1) != len(coll2):
             return False
         for v1, v2 in zip(coll1, coll2):
@@ -0,0 +1,171 @@
+import typing
+
+import numpy
+
+from poker import actions, hands, players
+
+# Columnar (NumPy) view of a list of hands, with one row per (hand, player), so that HandGroup's stats
+# can be computed as array reductions instead of re-walking every hand.
+
+# bit flags for the `streets` column (see Hand.player_got_to_street)
+STREET_FLAGS = {
+    actions.PRE_FLOP: 1,
+    actions.FLOP: 2,
+    actions.TURN: 4,
+    actions.RIVER: 8,
+    actions.SHOWDOWN: 16
+}
+
+_COLUMN_TYPES = {
+    "hand": numpy.int32,               # index of the row's hand in the source list
+    "player": numpy.int32,             # index into player_ids
+    "is_hero": numpy.bool_,
+    "session": numpy.int32,            # index into logfiles
+    "position": numpy.int16,
+    "seat_labels": numpy.int16,        # positions.LABEL_BITS of the player's seat (SB, BTN, EP, etc.)
+    "seat": numpy.int8,                # the player's post-flop acting index, or -1 if they weren't dealt in
+    "is_hero_seat": numpy.bool_,       # whether the seat is one of positions.PositionIndex.hero_seats
+    "card_code": numpy.int16,          # index into ranges.CARD_CODES, or -1 if both cards aren't known
+    "net": numpy.float64,
+    "net_adj": numpy.float64,          # all-in adjusted net
+    "bb_cost": numpy.float64,
+    "all_in_adj_gain": numpy.float64,  # NaN if the player wasn't in an all-in run-out
+    "all_in_adj_max_gain": numpy.float64,
+    "vpip": numpy.bool_,               # pre-flop
+    "vpip_any": numpy.bool_,           # on any street
+    "streets": numpy.int8,             # STREET_FLAGS of every street the player got to
+    "three_bet_opp": numpy.bool_,
+    "three_bet": numpy.bool_,
+    "aggro": numpy.int16,              # number of aggressive actions
+    "passive": numpy.int16,            # number of passive actions
+    "showed": numpy.int8,
+    "vol_showed": numpy.int8,
+}
+
+
+class HandColumns:
+
+    def __init__(self, n_hands, player_ids, logfiles, cols: typing.Dict[str, numpy.ndarray]):
+        self.n_hands = n_hands
+        self.player_ids = player_ids  # unique Player.name_and_ids
+        self.logfiles = logfiles
+        self.cols = cols
+        self._player_rows_cache = {}
+
+    def __getitem__(self, name) -> numpy.ndarray:
+        return self.cols[name]
+
+    def __len__(self):
+        return len(self.cols["hand"])
+
+    @staticmethod
+    def build(hand_list: typing.Sequence['hands.Hand']) -> 'HandColumns':
+        import poker.ranges as ranges
+
+        player_codes = {}
+        sessions = {}
+        rows = {name: [] for name in _COLUMN_TYPES}
+
+        for hand_idx, h in enumerate(hand_list):
+            hero = h.get_hero()
+            session = sessions.setdefault(h.configs['logfile'], len(sessions))
+            bb_cost = h.get_bb_cost()
+            seats = h.get_position_index()
+            involved = {street: [(players.intern(n), n) for n in h.players_involved_at_street(street)]
+                        for street in STREET_FLAGS}
+
+            for p in h.players:
+                pid = p.name_and_id
+                m = players.matcher(pid)
+                streets = 0
+                for street, flag in STREET_FLAGS.items():
+                    if any(m.matches(idx, n) for idx, n in involved[street]):
+                        streets |= flag
+                three_bet_opp, three_bet_res = h.did_player_3bet_pre(pid)
+                aggro, passive = 0, 0
+                for a in h.all_actions(pid):
+                    if a.is_aggro():
+                        aggro += 1
+                    elif a.is_passive():
+                        passive += 1
+
+                rows["hand"].append(hand_idx)
+                rows["player"].append(player_codes.setdefault(pid, len(player_codes)))
+                rows["is_hero"].append(p is hero)
+                rows["session"].append(session)
+                rows["position"].append(p.position)
+                rows["seat_labels"].append(seats.hero_labels if p is hero else seats.labels_of(pid))
+                seat = seats.seats.get(pid, -1)
+                rows["seat"].append(seat)
+                rows["is_hero_seat"].append(seat >= 0 and (seats.hero_seats >> seat) & 1 == 1)
+                rows["card_code"].append(ranges.CARD_CODE_IDX[p.get_card_code()] if p.known_cards() == 2 else -1)
+                rows["net"].append(p.net())
+                rows["net_adj"].append(p.net(all_in_adj=True))
+                rows["bb_cost"].append(bb_cost)
+                rows["all_in_adj_gain"].append(p.all_in_adj_gain if p.all_in_adj_gain is not None else numpy.nan)
+                rows["all_in_adj_max_gain"].append(p.all_in_adj_max_gain if p.all_in_adj_gain is not None else numpy.nan)
+                rows["vpip"].append(h.did_player_vpip(pid, street=actions.PRE_FLOP))
+                rows["vpip_any"].append(h.did_player_vpip(pid, street=actions.ANY))
+                rows["streets"].append(streets)
+                rows["three_bet_opp"].append(three_bet_opp)
+                rows["three_bet"].append(three_bet_res == actions.RAISE)
+                rows["aggro"].append(aggro)
+                rows["passive"].append(passive)
+                rows["showed"].append(p.showed_cards)
+                rows["vol_showed"].append(p.voluntarily_showed_cards)
+
+        cols = {name: numpy.array(rows[name], dtype=dtype) for name, dtype in _COLUMN_TYPES.items()}
+        return HandColumns(len(hand_list), list(player_codes), list(sessions), cols)
+
+    def extended(self, hand_list: typing.Sequence['hands.Hand']) -> 'HandColumns':
+        """returns: the columns with rows for the given hands added to the end (only the new hands are read)."""
+        new = HandColumns.build(hand_list)
+        player_codes = {pid: i for i, pid in enumerate(self.player_ids)}
+        sessions = {f: i for i, f in enumerate(self.logfiles)}
+        player_map = numpy.array([player_codes.setdefault(pid, len(player_codes)) for pid in new.player_ids], dtype=numpy.int64)
+        session_map = numpy.array([sessions.setdefault(f, len(sessions)) for f in new.logfiles], dtype=numpy.int64)
+
+        new.cols["hand"] = new.cols["hand"] + self.n_hands
+        if len(new) > 0:
+            new.cols["player"] = player_map[new.cols["player"]]
+            new.cols["session"] = session_map[new.cols["session"]]
+        cols = {name: numpy.concatenate([arr, new.cols[name].astype(arr.dtype)]) for name, arr in self.cols.items()}
+        return HandColumns(self.n_hands + new.n_hands, list(player_codes), list(sessions), cols)
+
+    def take(self, hand_mask: numpy.ndarray) -> 'HandColumns':
+        """returns: the columns of only the hands where hand_mask is True (re-indexed to match)."""
+        hand_mask = numpy.asarray(hand_mask, dtype=bool)
+        row_mask = hand_mask[self.cols["hand"]]
+        cols = {name: arr[row_mask] for name, arr in self.cols.items()}
+        cols["hand"] = (numpy.cumsum(hand_mask) - 1)[cols["hand"]].astype(_COLUMN_TYPES["hand"])
+        return HandColumns(int(hand_mask.sum()), self.player_ids, self.logfiles, cols)
+
+    def reached_street(self, street) -> typing.Optional[numpy.ndarray]:
+        """returns: bool mask of the rows whose player got to the given street, or None if street isn't
+                    a single street (e.g. actions.POST_FLOP)."""
+        flag = STREET_FLAGS.get(street) if isinstance(street, str) else None
+        return None if flag is None else (self.cols["streets"] & flag) != 0
+
+    def seat_masks(self, row_mask: numpy.ndarray) -> numpy.ndarray:
+        """returns: for each hand, the bitmask of the seats (see positions.PositionIndex) of its rows where row_mask is True."""
+        rows = row_mask & (self.cols["seat"] >= 0)
+        res = numpy.zeros(self.n_hands, dtype=numpy.int64)
+        numpy.bitwise_or.at(res, self.cols["hand"][rows], numpy.left_shift(1, self.cols["seat"][rows].astype(numpy.int64)))
+        return res
+
+    def player_rows(self, player_id=None) -> numpy.ndarray:
+        """returns: bool mask of the rows that belong to the given player (or the hero, if None).
+                    Like Hand.get_player, only the first matching player in each hand is included."""
+        if player_id not in self._player_rows_cache:
+            if player_id is None:
+                match = self.cols["is_hero"]
+            else:
+                m = players.matcher(player_id)
+                codes = [i for i, pid in enumerate(self.player_ids) if m.matches(players.intern(pid), pid)]
+                match = numpy.isin(self.cols["player"], codes)
+            rows = numpy.flatnonzero(match)
+            _, first = numpy.unique(self.cols["hand"][rows], return_index=True)
+            res = numpy.zeros(len(self), dtype=bool)
+            res[rows[first]] = True
+            self._player_rows_cache[player_id] = res
+        return self._player_rows_cache[player_id]
@@ -0,0 +1,168 @@
+import math
+import typing
+import itertools
+
+import poker.evaluator as evaluator
+
+# Exact equity enumeration.
+#
+# Rather than dealing out every possible board, runouts are grouped into classes that are guaranteed
+# to produce the same hand strengths for every player:
+#
+#   * A full board can only make a flush for someone if 3+ of its cards share a suit, so at most one
+#     suit per board is "flush-live". For each live suit we enumerate the exact suited cards drawn,
+#     but only the ranks of the remaining (off-suit) draws.
+#   * Every other runout only matters by its ranks, so those are enumerated as rank multisets, each
+#     weighted by the number of ways to deal it (minus the flush-live boards already counted above).
+#   * Suits that play identical roles in the spot (e.g. suits nobody holds) are enumerated once and
+#     weighted by the number of suits sharing that role.
+
+
+def _binom(n, k) -> int:
+    return math.comb(n, k) if 0 <= k <= n else 0
+
+
+def _rank_multisets(avail: typing.Sequence[int], n: int) -> typing.List[typing.Tuple[int, int]]:
+    """
+    :param avail: number of cards still available for each rank.
+    :param n: number of cards to draw.
+    :return: list of (rank_key, number_of_ways_to_draw_it) for each possible multiset of drawn ranks.
+    """
+    partial = [(0, 1, n)]  # (rank_key, ways, cards left to draw)
+    for r in range(13):
+        nxt = []
+        for key, ways, left in partial:
+            for cnt in range(min(left, avail[r]) + 1):
+                if r == 12 and cnt != left:
+                    continue
+                nxt.append((key + cnt * evaluator.RANK_KEYS[r], ways * _binom(avail[r], cnt), left - cnt))
+        partial = nxt
+    return [(key, ways) for key, ways, left in partial if left == 0 and ways > 0]
+
+
+def iter_runout_classes(h_list, board) -> typing.Generator[typing.Tuple[typing.List[int], int], None, None]:
+    """
+    :param h_list: list of hands [('Ad', 'Ks'), ('Qh', 'Qs'), ...].
+    :param board: list of cards on board ['4h', '4d', 'Jd'].
+    :return: yields (each hand's strength, number of runouts that give those strengths), covering every
+             possible runout exactly once.
+    """
+    rank_table = evaluator.rank_table()
+    flush_table = evaluator.flush_table()
+
+    holes = [evaluator.to_ints(h) for h in h_list]
+    known = evaluator.to_ints(board)
+    to_draw = 5 - len(known)
+
+    if to_draw <= 0:
+        yield [evaluator.evaluate(h + known) for h in holes], 1
+        return
+
+    dead = set(known)
+    for h in holes:
+        dead.update(h)
+
+    avail = [0] * 13
+    avail_in_suit = [[] for _ in range(4)]  # suit -> ranks still in the deck
+    for c in range(evaluator.N_CARDS):
+        if c not in dead:
+            avail[c >> 2] += 1
+            avail_in_suit[c & 3].append(c >> 2)
+
+    n_players = len(holes)
+    base_keys = []
+    base_masks = []   # player -> suit -> rank mask of their hole + board cards
+    base_counts = []  # player -> suit -> count of their hole + board cards
+    for h in holes:
+        key = 0
+        masks = [0] * 4
+        counts = [0] * 4
+        for c in h + known:
+            key += evaluator.RANK_KEYS[c >> 2]
+            masks[c & 3] |= evaluator.RANK_BITS[c]
+            counts[c & 3] += 1
+        base_keys.append(key)
+        base_masks.append(masks)
+        base_counts.append(counts)
+
+    # group suits that are interchangeable in this spot
+    suit_groups = {}
+    for s in range(4):
+        board_mask = 0
+        for c in known:
+            if c & 3 == s:
+                board_mask |= evaluator.RANK_BITS[c]
+        signature = (tuple(base_masks[p][s] for p in range(n_players)), board_mask)
+        suit_groups.setdefault(signature, []).append(s)
+
+    flush_live_ways = {}  # drawn rank key -> number of runouts already covered by the flush-live pass
+
+    for group in suit_groups.values():
+        s = group[0]
+        multiplier = len(group)
+        max_count = max(base_counts[p][s] for p in range(n_players))
+        off_avail = list(avail)
+        for r in avail_in_suit[s]:
+            off_avail[r] -= 1
+
+        for n_suited in range(to_draw + 1):
+            if max_count + n_suited < 5:
+                continue  # nobody can make a flush in this suit
+            off_classes = _rank_multisets(off_avail, to_draw - n_suited)
+            live = [p for p in range(n_players) if base_counts[p][s] + n_suited >= 5]
+            for suited in itertools.combinations(avail_in_suit[s], n_suited):
+                suited_key = 0
+                suited_mask = 0
+                for r in suited:
+                    suited_key += evaluator.RANK_KEYS[r]
+                    suited_mask |= 1 << r
+                flushes = {p: flush_table[base_masks[p][s] | suited_mask] for p in live}
+                for off_key, ways in off_classes:
+                    drawn_key = suited_key + off_key
+                    ways *= multiplier
+                    flush_live_ways[drawn_key] = flush_live_ways.get(drawn_key, 0) + ways
+                    # note: with 7 cards, a flush always beats the best non-flush hand
+                    yield [flushes[p] if p in flushes else rank_table[base_keys[p] + drawn_key]
+                           for p in range(n_players)], ways
+
+    for drawn_key, ways in _rank_multisets(avail, to_draw):
+        ways -= flush_live_ways.get(drawn_key, 0)
+        if ways > 0:
+            yield [rank_table[k + drawn_key] for k in base_keys], ways
+
+
+def calc_exact_wins(h_list, board) -> typing.List[float]:
+    """returns: each hand's share of the pot, summed over every possible runout (ties are split evenly)."""
+    wins = [0.] * len(h_list)
+    for strengths, ways in iter_runout_classes(h_list, board):
+        best = max(strengths)
+        n_winners = strengths.count(best)
+        if n_winners == 1:
+            wins[strengths.index(best)] += ways
+        else:
+            share = ways / n_winners
+            for idx, st in enumerate(strengths):
+                if st == best:
+                    wins[idx] += share
+    return wins
+
+
+def count_runouts(n_cards_in_deck, n_to_draw) -> int:
+    return _binom(n_cards_in_deck, n_to_draw)
+
+
+def unrank_combination(index, n, k) -> typing.List[int]:
+    """
+    returns: the index-th k-combination of range(n) in colexicographic order (so every index in
+             range(count_runouts(n, k)) maps to a different combination), largest element first.
+    """
+    res = []
+    c = n - 1
+    for j in range(k, 0, -1):
+        while _binom(c, j) > index:
+            c -= 1
+        res.append(c)
+        index -= _binom(c, j)
+        c -= 1
+    return res
+
@@ -0,0 +1,145 @@
+import collections
+import itertools
+import math
+import os
+import sqlite3
+import struct
+import typing
+
+import poker.evaluator as evaluator
+
+# Cache of equity results, keyed by spot (hole cards + board). Spots are canonicalized up to suit
+# isomorphism, so e.g. AhAd vs KsKc and AsAc vs KhKd share an entry (as do hands listed in a different
+# order, for spots where hand order doesn't matter).
+#
+# Results live in a bounded in-memory LRU, optionally backed by an sqlite3 file so that they're shared
+# between runs and worker processes. The disk tier is best-effort: if the file can't be read or written
+# the cache just acts like it's memory-only.
+
+_SUIT_PERMS = list(itertools.permutations(range(4)))
+
+
+def canonicalize(hands: typing.Sequence[typing.Sequence[int]], board: typing.Sequence[int], sort_hands=True) \
+        -> typing.Tuple[typing.Tuple, typing.List[int]]:
+    """
+    :param hands: each player's integer hole cards (see evaluator.to_ints).
+    :param board: integer board cards.
+    :param sort_hands: whether the hands can be reordered (i.e. results don't depend on which player is which).
+    :return: (canonical (hands, board) tuple, index of each of the given hands in the canonical hands).
+    """
+    best = None
+    for perm in _SUIT_PERMS:
+        mapped = [tuple(sorted(((c & ~3) | perm[c & 3] for c in h), reverse=True)) for h in hands]
+        key = (tuple(sorted(mapped, reverse=True)) if sort_hands else tuple(mapped),
+               tuple(sorted(((c & ~3) | perm[c & 3] for c in board), reverse=True)))
+        if best is None or key < best[0]:
+            best = (key, mapped)
+    key, mapped = best
+    return key, [key[0].index(h) for h in mapped]
+
+
+def spot_key(kind: str, canonical, *params) -> str:
+    """returns: text key for a canonical spot (see canonicalize) and how it was calculated, like
+                'equities:AhAs,KcKd:9d7c2s|exact'."""
+    hands, board = canonical
+    cards = ",".join("".join(evaluator.to_str(c) for c in h) for h in hands) + ":" + "".join(evaluator.to_str(c) for c in board)
+    return f"{kind}:{cards}|{'|'.join(str(p) for p in params)}"
+
+
+class EquityCache:
+
+    def __init__(self, max_entries=100000, db_path=None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lru = collections.OrderedDict()  # key -> tuple of floats
+        self._conn = None
+        self._conn_pid = None
+
+    def _db(self) -> typing.Optional[sqlite3.Connection]:
+        if self.db_path is None:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():  # connections can't be shared with forked workers
+            self._conn, self._conn_pid = None, os.getpid()
+            try:
+                os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                conn = sqlite3.connect(self.db_path, timeout=30)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS equities (spot TEXT PRIMARY KEY, vals BLOB NOT NULL)")
+                conn.commit()
+                self._conn = conn
+            except (OSError, sqlite3.Error):
+                self.db_path = None  # don't keep retrying
+        return self._conn
+
+    def get(self, key: str) -> typing.Optional[typing.Tuple[float, ...]]:
+        res = self._lru.get(key)
+        if res is not None:
+            self._lru.move_to_end(key)
+        else:
+            conn = self._db()
+            if conn is not None:
+                try:
+                    row = conn.execute("SELECT vals FROM equities WHERE spot = ?", (key,)).fetchone()
+                except sqlite3.Error:
+                    row = None
+                if row is not None:
+                    res = struct.unpack(f"<{len(row[0]) // 8}d", row[0])
+                    self._remember(key, res)
+        if res is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return res
+
+    def put(self, key: str, values: typing.Sequence[float]):
+        values = tuple(float(v) for v in values)
+        self._remember(key, values)
+        conn = self._db()
+        if conn is not None:
+            try:
+                conn.execute("INSERT OR REPLACE INTO equities (spot, vals) VALUES (?, ?)",
+                             (key, struct.pack(f"<{len(values)}d", *values)))
+                conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def _remember(self, key, values):
+        self._lru[key] = values
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def clear(self):
+        """Empties the in-memory tier (the disk tier is kept)."""
+        self._lru.clear()
+
+
+_CACHE = EquityCache()
+
+
+def get_cache() -> EquityCache:
+    return _CACHE
+
+
+def configure(max_entries=None, db_path=None):
+    """Sets up the shared cache used by cardutils. db_path=None means memory-only."""
+    global _CACHE
+    if db_path != _CACHE.db_path or (max_entries is not None and max_entries != _CACHE.max_entries):
+        _CACHE.close()
+        _CACHE = EquityCache(max_entries=max_entries if max_entries is not None else _CACHE.max_entries, db_path=db_path)
+
+
+def to_values(optional_values: typing.Sequence[typing.Optional[float]]) -> typing.List[float]:
+    """returns: the values with Nones stored as NaN (see from_values)."""
+    return [float('nan') if v is None else v for v in optional_values]
+
+
+def from_values(values: typing.Sequence[float]) -> typing.List[typing.Optional[float]]:
+    return [None if math.isnan(v) else v for v in values]
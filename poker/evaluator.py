@@ -0,0 +1,252 @@
+import itertools
+import typing
+
+# Integer card encoding: card = rank * 4 + suit, where rank is 0 (deuce) through 12 (ace)
+# and suit is an index into cardutils.SUITS. Higher ranks are better, which lets us
+# pack a hand's strength into a single comparable int.
+
+_RANK_CHARS = '23456789TJQKA'
+_SUIT_CHARS = 'shdc'  # same order as cardutils.SUITS
+
+N_CARDS = 52
+
+# Hand categories (same ordering as cardutils.HandTypes.ORDERED_BY_STRENGTH)
+HIGH_CARD = 0
+PAIR = 1
+TWO_PAIR = 2
+TRIPS = 3
+STRAIGHT = 4
+FLUSH = 5
+FULL_HOUSE = 6
+QUADS = 7
+STRAIGHT_FLUSH = 8
+
+_CATEGORY_SHIFT = 20
+
+# Each card adds a 3-bit count to its rank's slot (bits 0-38) and to its suit's slot (bits 39-50),
+# so the sum of a hand's card keys encodes its rank multiset and its suit counts at the same time.
+_SUIT_SHIFT = 39
+_RANK_KEY_MASK = (1 << _SUIT_SHIFT) - 1
+
+CARD_TO_INT: typing.Dict[str, int] = {}
+INT_TO_CARD: typing.List[str] = []
+for _r in range(13):
+    for _s in range(4):
+        CARD_TO_INT[f"{_RANK_CHARS[_r]}{_SUIT_CHARS[_s]}"] = len(INT_TO_CARD)
+        INT_TO_CARD.append(f"{_RANK_CHARS[_r]}{_SUIT_CHARS[_s]}")
+
+CARD_KEYS = [(1 << (3 * (c >> 2))) + (1 << (_SUIT_SHIFT + 3 * (c & 3))) for c in range(N_CARDS)]
+RANK_KEYS = [1 << (3 * r) for r in range(13)]
+RANK_BITS = [1 << (c >> 2) for c in range(N_CARDS)]
+
+_RANK_TABLE: typing.Dict[int, int] = None  # rank key -> strength of best non-flush hand (see _RankTable)
+_FLUSH_TABLE: typing.List[int] = []       # 13-bit rank mask -> strength of best flush (or 0)
+_STRAIGHT_HIGH: typing.List[int] = []     # 13-bit rank mask -> rank of best straight's top card (or -1)
+_FLUSH_SUIT: typing.List[int] = []        # packed suit counts -> suit with 5+ cards (or -1)
+
+
+def to_int(card: str) -> int:
+    return CARD_TO_INT[card]
+
+
+def to_ints(cards: typing.Iterable[str]) -> typing.List[int]:
+    return [CARD_TO_INT[c] for c in cards]
+
+
+def to_str(card: int) -> str:
+    return INT_TO_CARD[card]
+
+
+def rank_of(card: int) -> int:
+    return card >> 2
+
+
+def suit_of(card: int) -> int:
+    return card & 3
+
+
+def category(strength: int) -> int:
+    return strength >> _CATEGORY_SHIFT
+
+
+def _pack(cat, ranks) -> int:
+    res = cat
+    for i in range(5):
+        res = (res << 4) | (ranks[i] if i < len(ranks) else 0)
+    return res
+
+
+def _calc_straight_high(mask) -> int:
+    for top in range(12, 3, -1):
+        window = 0b11111 << (top - 4)
+        if mask & window == window:
+            return top
+    wheel = 0b1000000001111  # A-5-4-3-2
+    if mask & wheel == wheel:
+        return 3
+    return -1
+
+
+def _calc_rank_strength(rank_key) -> int:
+    """returns: strength of the best hand that can be made from the given rank key, ignoring flushes"""
+    ranks_desc = []  # with multiplicity
+    groups = []  # (count, rank), for ranks that appear more than once
+    mask = 0
+    for r in range(12, -1, -1):
+        cnt = (rank_key >> (3 * r)) & 7
+        if cnt > 0:
+            mask |= 1 << r
+            ranks_desc.extend((r,) * cnt)
+            if cnt > 1:
+                groups.append((cnt, r))
+    groups.sort(reverse=True)  # biggest groups first, then highest ranks
+
+    def _with_kickers(made):
+        rest = [r for r in ranks_desc if r not in made]
+        return made + tuple(rest[:max(0, 5 - len(made))])
+
+    top_cnt = groups[0][0] if len(groups) > 0 else 1
+    if top_cnt == 4:
+        return _pack(QUADS, _with_kickers((groups[0][1],) * 4))
+    if top_cnt == 3 and len(groups) >= 2:
+        return _pack(FULL_HOUSE, (groups[0][1],) * 3 + (groups[1][1],) * 2)
+
+    high = _STRAIGHT_HIGH[mask]
+    if high >= 0:
+        return _pack(STRAIGHT, (high,))
+
+    if top_cnt == 3:
+        return _pack(TRIPS, _with_kickers((groups[0][1],) * 3))
+    if len(groups) >= 2:
+        return _pack(TWO_PAIR, _with_kickers((groups[0][1],) * 2 + (groups[1][1],) * 2))
+    if len(groups) == 1:
+        return _pack(PAIR, _with_kickers((groups[0][1],) * 2))
+    return _pack(HIGH_CARD, ranks_desc[:5])
+
+
+class _RankTable(dict):
+    """rank key -> strength of the best non-flush hand. Entries are computed on first use."""
+
+    def __missing__(self, rank_key):
+        res = _calc_rank_strength(rank_key)
+        self[rank_key] = res
+        return res
+
+
+def _build_tables():
+    global _RANK_TABLE
+    _STRAIGHT_HIGH.extend(_calc_straight_high(mask) for mask in range(1 << 13))
+
+    for mask in range(1 << 13):
+        if bin(mask).count('1') < 5:
+            _FLUSH_TABLE.append(0)
+        elif _STRAIGHT_HIGH[mask] >= 0:
+            _FLUSH_TABLE.append(_pack(STRAIGHT_FLUSH, (_STRAIGHT_HIGH[mask],)))
+        else:
+            _FLUSH_TABLE.append(_pack(FLUSH, [r for r in range(12, -1, -1) if mask & (1 << r)][:5]))
+
+    for packed in range(1 << 12):
+        suit = -1
+        for s in range(4):
+            if (packed >> (3 * s)) & 7 >= 5:
+                suit = s
+        _FLUSH_SUIT.append(suit)
+
+    _RANK_TABLE = _RankTable()
+
+
+def _ensure_tables():
+    if _RANK_TABLE is None:
+        _build_tables()
+
+
+def all_rank_keys(n_cards) -> typing.Generator[int, None, None]:
+    """yields: the rank key of every possible multiset of n_cards ranks (with at most 4 of each rank)"""
+    for ranks in itertools.combinations_with_replacement(range(13), n_cards):
+        key = 0
+        for r in ranks:
+            key += RANK_KEYS[r]
+        if all((key >> (3 * r)) & 7 <= 4 for r in set(ranks)):
+            yield key
+
+
+def evaluate(cards: typing.Sequence[int]) -> int:
+    """
+    :param cards: 1 to 7 integer cards (see to_ints).
+    :return: strength of the best hand that can be made, as a single int. Higher is better.
+    """
+    if _RANK_TABLE is None:
+        _build_tables()
+    key = 0
+    for c in cards:
+        key += CARD_KEYS[c]
+    suit = _FLUSH_SUIT[key >> _SUIT_SHIFT]
+    if suit < 0:
+        return _RANK_TABLE[key & _RANK_KEY_MASK]
+    mask = 0
+    for c in cards:
+        if c & 3 == suit:
+            mask |= RANK_BITS[c]
+    # with 7 or fewer cards, a flush rules out quads and full houses
+    return _FLUSH_TABLE[mask]
+
+
+class PartialHand:
+    """
+    Evaluation state of some known cards (e.g. a player's hole cards plus the board so far): their summed
+    card keys and each suit's rank mask. Run-outs only need to add the new cards' keys, instead of
+    re-evaluating all the cards from scratch.
+    """
+
+    __slots__ = ("key", "suit_masks")
+
+    def __init__(self, cards: typing.Sequence[int] = ()):
+        _ensure_tables()
+        self.key = 0
+        self.suit_masks = [0, 0, 0, 0]
+        for c in cards:
+            self.key += CARD_KEYS[c]
+            self.suit_masks[c & 3] |= RANK_BITS[c]
+
+    def evaluate_with(self, cards: typing.Sequence[int], cards_key: int) -> int:
+        """
+        :param cards: the cards to add (at most 7 cards in total).
+        :param cards_key: sum of the added cards' CARD_KEYS (shared by every hand in a run-out, see evaluate_runout).
+        :return: same as evaluate(known cards + cards).
+        """
+        key = self.key + cards_key
+        suit = _FLUSH_SUIT[key >> _SUIT_SHIFT]
+        if suit < 0:
+            return _RANK_TABLE[key & _RANK_KEY_MASK]
+        mask = self.suit_masks[suit]
+        for c in cards:
+            if c & 3 == suit:
+                mask |= RANK_BITS[c]
+        return _FLUSH_TABLE[mask]
+
+
+def evaluate_runout(hands: typing.Sequence[PartialHand], cards: typing.Sequence[int]) -> typing.List[int]:
+    """returns: the strength of each of the partial hands, with the given cards added to all of them."""
+    cards_key = 0
+    for c in cards:
+        cards_key += CARD_KEYS[c]
+    return [h.evaluate_with(cards, cards_key) for h in hands]
+
+
+def evaluate_strs(cards: typing.Iterable[str]) -> int:
+    return evaluate([CARD_TO_INT[c] for c in cards])
+
+
+def rank_table() -> typing.Dict[int, int]:
+    _ensure_tables()
+    return _RANK_TABLE
+
+
+def flush_table() -> typing.List[int]:
+    _ensure_tables()
+    return _FLUSH_TABLE
+
+
+def flush_suit_table() -> typing.List[int]:
+    _ensure_tables()
+    return _FLUSH_SUIT
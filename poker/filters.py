@@ -1,6 +1,37 @@
 import typing
 
-from poker import cardutils, actions, hands
+from poker import actions, hands, positions, ranges
+
+# Filters can be evaluated over a whole HandGroup at once, as a bitset (an int where bit i is set if the
+# group's i-th hand passes). HandGroup.filter_bits caches these by Filter.key, so a leaf filter that's
+# shared by many compound filters is only evaluated once per group, and compound filters are just
+# bitwise ops on their subfilters' bitsets.
+
+
+def bools_to_bits(bools: typing.Iterable[bool]) -> int:
+    return int("0" + "".join("1" if b else "0" for b in reversed(list(bools))), 2)
+
+
+def bits_to_bools(bits: int, n: int) -> typing.List[bool]:
+    if n == 0:
+        return []
+    return [c == "1" for c in reversed(format(bits, f"0{n}b"))]
+
+
+def _array_to_bits(mask) -> int:
+    import numpy
+    return int.from_bytes(numpy.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+def _key_of(value) -> typing.Hashable:
+    if isinstance(value, Filter):
+        return value.key()
+    elif isinstance(value, (list, tuple)):
+        return tuple(_key_of(v) for v in value)
+    elif isinstance(value, (set, frozenset)):
+        return frozenset(_key_of(v) for v in value)
+    else:
+        return value
 
 
 class Filter:
@@ -8,9 +39,18 @@ class Filter:
     def __init__(self):
         pass
 
+    def key(self) -> typing.Hashable:
+        """returns: the filter's type and parameters. Filters with equal keys must pass the same hands."""
+        return (type(self),) + tuple((name, _key_of(v)) for name, v in sorted(vars(self).items()))
+
     def test(self, hand: 'hands.Hand') -> bool:
         return True
 
+    def evaluate(self, group: 'hands.HandGroup') -> int:
+        """returns: bitset of the hands in the group that pass the filter. Use group.filter_bits instead,
+                    which caches the result."""
+        return bools_to_bits(self.test(h) for h in group.hands)
+
     def __or__(self, other: 'Filter'):
         return OrFilter([self, other])
 
@@ -29,15 +69,31 @@ class HeroPlayed(Filter):
 
 class HeroCardFilter(Filter):
 
-    def __init__(self, pattern):
+    def __init__(self, pattern: typing.Union[str, ranges.Range]):
         super().__init__()
         self.pattern = pattern
+        self.range = pattern if isinstance(pattern, ranges.Range) else ranges.Range.parse(pattern)
+
+    def key(self):
+        return type(self), self.range
 
     def test(self, hand: hands.Hand) -> bool:
         hero = hand.get_hero()
         if hero is None:
             return False
-        return cardutils.cards_match_pattern(hero.cards, self.pattern)
+        return self.range.contains_cards(hero.cards)
+
+    def evaluate(self, group: 'hands.HandGroup') -> int:
+        cols = group._get_columns()
+        if cols is None:
+            return super().evaluate(group)
+        import numpy
+        in_range = numpy.array([(self.range.mask >> i) & 1 for i in range(len(ranges.CARD_CODES))], dtype=bool)
+        hero_rows = cols.player_rows(None)
+        codes = cols["card_code"][hero_rows]
+        passed = numpy.zeros(cols.n_hands, dtype=bool)
+        passed[cols["hand"][hero_rows]] = (codes >= 0) & in_range[codes]
+        return _array_to_bits(passed)
 
 
 class HeroCardsKnown(Filter):
@@ -62,6 +118,17 @@ class HeroSawStreet(Filter):
     def test(self, hand: hands.Hand) -> bool:
         return hand.hero_got_to_street(self.street)
 
+    def evaluate(self, group: 'hands.HandGroup') -> int:
+        cols = group._get_columns()
+        reached = cols.reached_street(self.street) if cols is not None else None
+        if reached is None:
+            return super().evaluate(group)
+        import numpy
+        hero_rows = cols.player_rows(None)
+        passed = numpy.zeros(cols.n_hands, dtype=bool)
+        passed[cols["hand"][hero_rows]] = reached[hero_rows]
+        return _array_to_bits(passed)
+
 
 class EveryoneAndHeroAllInBy(Filter):
 
@@ -93,13 +160,22 @@ class HeroAtSpecificPosition(Filter):
         self.pos = pos if isinstance(pos, tuple) else (pos,)
 
     def test(self, hand: 'hands.Hand') -> bool:
-        pp = hand.get_position_to_player_mapping()
-        for pos in self.pos:
-            if pos in pp:
-                for p in pp[pos]:
-                    if hands.Player.names_eq(hand.hero_id, p):
-                        return True
-        return False
+        seats = hand.get_position_index()
+        if actions.ANY in self.pos and seats.hero_seats != 0:
+            return True  # any seat at all
+        return seats.hero_labels & positions.to_bits(self.pos) != 0
+
+    def evaluate(self, group: 'hands.HandGroup') -> int:
+        cols = group._get_columns()
+        if cols is None:
+            return super().evaluate(group)
+        import numpy
+        hero_rows = cols.player_rows(None)
+        passed = numpy.zeros(cols.n_hands, dtype=bool)
+        passed[cols["hand"][hero_rows]] = (cols["seat_labels"][hero_rows] & positions.to_bits(self.pos)) != 0
+        if actions.ANY in self.pos:
+            passed |= cols.seat_masks(cols["is_hero_seat"]) != 0
+        return _array_to_bits(passed)
 
 
 class HeroInPosition(Filter):
@@ -109,39 +185,29 @@ class HeroInPosition(Filter):
         self.street = street
 
     def test(self, hand: 'hands.Hand') -> bool:
-        ordered_players = hand.get_position_to_player_mapping()[actions.ANY]
-        active_players = hand.players_involved_at_street(self.street)
-
-        found_hero = False
-        for p in ordered_players:
-            if p in active_players:
-                if hands.Player.names_eq(p, hand.hero_id):
-                    found_hero = True
-                elif found_hero:
-                    return False  # there's an active player after the hero
-
-        return found_hero
-
-
-class HeroOutOfPosition(Filter):
+        seats = hand.get_position_index()
+        active = seats.active_seats.get(self.street)
+        if active is None:
+            active = seats.seat_mask(hand.players_involved_at_street(self.street))
+        return seats.hero_acts_last(active, reverse=self._reverse())
+
+    def evaluate(self, group: 'hands.HandGroup') -> int:
+        cols = group._get_columns()
+        reached = cols.reached_street(self.street) if cols is not None else None
+        if reached is None:
+            return super().evaluate(group)
+        hero_seats = cols.seat_masks(cols["is_hero_seat"])
+        active_seats = cols.seat_masks(reached)
+        return _array_to_bits(positions.hero_acts_last(hero_seats, active_seats, reverse=self._reverse()))
+
+    def _reverse(self) -> bool:
+        return False
 
-    def __init__(self, street=actions.FLOP):
-        super().__init__()
-        self.street = street
 
-    def test(self, hand: 'hands.Hand') -> bool:
-        ordered_players = hand.get_position_to_player_mapping()[actions.ANY]
-        active_players = hand.players_involved_at_street(self.street)
+class HeroOutOfPosition(HeroInPosition):
 
-        found_hero = False
-        for p in reversed(ordered_players):
-            if p in active_players:
-                if hands.Player.names_eq(p, hand.hero_id):
-                    found_hero = True
-                elif found_hero:
-                    return False  # there's an active player before the hero
-
-        return found_hero
+    def _reverse(self) -> bool:
+        return True
 
 
 class Multiway(Filter):
@@ -168,18 +234,36 @@ class AndFilter(CompoundFilter):
     def __init__(self, subfilters: typing.Sequence[Filter]):
         super().__init__(subfilters)
 
+    def key(self):
+        return type(self), frozenset(f.key() for f in self.subfilters)
+
     def test(self, hand: hands.Hand) -> bool:
         return all(f.test(hand) for f in self.subfilters)
 
+    def evaluate(self, group: 'hands.HandGroup') -> int:
+        res = (1 << len(group)) - 1
+        for f in self.subfilters:
+            res &= group.filter_bits(f)
+        return res
+
 
 class OrFilter(CompoundFilter):
 
     def __init__(self, subfilters: typing.Sequence[Filter]):
         super().__init__(subfilters)
 
+    def key(self):
+        return type(self), frozenset(f.key() for f in self.subfilters)
+
     def test(self, hand: hands.Hand) -> bool:
         return any(f.test(hand) for f in self.subfilters)
 
+    def evaluate(self, group: 'hands.HandGroup') -> int:
+        res = 0
+        for f in self.subfilters:
+            res |= group.filter_bits(f)
+        return res
+
 
 class NotFilter(Filter):
 
@@ -190,3 +274,6 @@ class NotFilter(Filter):
     def test(self, hand: 'hands.Hand') -> bool:
         return not self.subfilter.test(hand)
 
+    def evaluate(self, group: 'hands.HandGroup') -> int:
+        return ((1 << len(group)) - 1) & ~group.filter_bits(self.subfilter)
+
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import pickle
+import struct
+import typing
+import zlib
+
+from poker import hands
+
+# On-disk cache of parsed hands, one file per log.
+#
+# File layout: MAGIC, header length (uint32), pickled header, zlib-compressed pickled list of hands.
+# The header holds the log's path, size, mtime and content hash, plus the parameters the log was parsed
+# with. A cache entry is used if the log's size and mtime still match (no need to read the log at all),
+# or if its size and content hash match (e.g. the log was re-downloaded but is unchanged).
+
+MAGIC = b"PKRHANDS"
+CACHE_VERSION = 3  # bump whenever Hand/Player/Action change shape or the parser's output changes
+
+
+def make_params(hero_id, log_downloader_id, alias_lookup, limit, tolerance=None, sampling=None) -> typing.Tuple:
+    """
+    returns: everything (besides the log itself) that affects the parsed hands. limit, tolerance and sampling are
+             how all-in run-outs are sampled (see cardutils.calc_all_in_equities and cardutils.SAMPLING).
+    """
+    return (CACHE_VERSION, hero_id, log_downloader_id, tuple(sorted(dict(alias_lookup).items())), str(limit),
+            str(tolerance), str(sampling))
+
+
+def _entry_path(cache_dir, logfilepath) -> str:
+    name = hashlib.sha1(os.path.abspath(logfilepath).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{name}.hands")
+
+
+def _hash_file(filepath) -> str:
+    h = hashlib.sha1()
+    with open(filepath, mode='rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read_entry(entry_path) -> typing.Tuple[typing.Optional[dict], bytes]:
+    try:
+        with open(entry_path, mode='rb') as f:
+            data = f.read()
+    except OSError:
+        return None, b""
+    if not data.startswith(MAGIC):
+        return None, b""
+    offs = len(MAGIC)
+    (header_len,) = struct.unpack_from("<I", data, offs)
+    offs += 4
+    try:
+        header = pickle.loads(data[offs:offs + header_len])
+    except Exception:
+        return None, b""
+    return header, data[offs + header_len:]
+
+
+def _write_entry(entry_path, header, payload):
+    os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+    header_bytes = pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+    with open(tmp_path, mode='wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(payload)
+    os.replace(tmp_path, entry_path)
+
+
+def load(cache_dir, logfilepath, params) -> typing.Optional[typing.List[hands.Hand]]:
+    """returns: the cached hands for the given log, or None if there's no valid cache entry for it."""
+    entry_path = _entry_path(cache_dir, logfilepath)
+    header, payload = _read_entry(entry_path)
+    if header is None or header.get("params") != params:
+        return None
+
+    stat = os.stat(logfilepath)
+    if header["size"] != stat.st_size:
+        return None
+    if header["mtime_ns"] != stat.st_mtime_ns:
+        if header["sha1"] != _hash_file(logfilepath):
+            return None
+        # same contents, new timestamp. update the entry so next time we can skip the hashing
+        header["mtime_ns"] = stat.st_mtime_ns
+        _write_entry(entry_path, header, payload)
+
+    try:
+        return pickle.loads(zlib.decompress(payload))
+    except Exception:
+        return None
+
+
+def save(cache_dir, logfilepath, params, hand_list: typing.List[hands.Hand]):
+    stat = os.stat(logfilepath)
+    header = {
+        "path": os.path.abspath(logfilepath),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha1": _hash_file(logfilepath),
+        "params": params,
+    }
+    payload = zlib.compress(pickle.dumps(list(hand_list), protocol=pickle.HIGHEST_PROTOCOL))
+    _write_entry(_entry_path(cache_dir, logfilepath), header, payload)
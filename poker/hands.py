@@ -1,9 +1,41 @@
 import collections
+import functools
 import locale
+import types
 import typing
 import datetime
 
-from poker import cardutils, actions
+from poker import cardutils, actions, players, positions
+
+
+def _freeze_value(value):
+    if isinstance(value, set):
+        return frozenset(value)
+    elif isinstance(value, (list, tuple)):
+        return tuple(_freeze_value(v) for v in value)
+    elif isinstance(value, dict):
+        return types.MappingProxyType({k: _freeze_value(v) for k, v in value.items()})
+    else:
+        return value
+
+
+def _memoized_once_frozen(method):
+    """Once a hand is frozen (see Hand.freeze), caches the method's result for each set of arguments.
+       Cached results are made immutable (sets become frozensets, lists become tuples, etc.)."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        facts = self._facts
+        if facts is None:
+            return method(self, *args, **kwargs)
+        key = (method.__name__, args, tuple(kwargs.items()))
+        try:
+            return facts[key]
+        except KeyError:
+            res = facts[key] = _freeze_value(method(self, *args, **kwargs))
+            return res
+        except TypeError:
+            return method(self, *args, **kwargs)  # unhashable args, e.g. a list of streets
+    return wrapper
 
 
 class Hand:
@@ -31,6 +63,24 @@ class Hand:
         self.turn_actions = []
         self.river_actions = []
 
+        self._facts = None  # memoized results of the hand's queries, once it's frozen
+
+    def freeze(self):
+        """Marks the hand as finished (i.e. its actions, players and board won't change anymore), so that
+           facts derived from them (who saw each street, positions, VPIP, etc.) only need to be calculated once."""
+        if self._facts is None:
+            self._facts = {}
+            self.get_position_index()  # the position filters all need this
+
+    def is_frozen(self) -> bool:
+        return self._facts is not None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if state["_facts"] is not None:
+            state["_facts"] = {}  # cheap to recalculate, not worth storing
+        return state
+
     def __hash__(self):
         return hash((self.timestamp, self.hand_idx, self.hero_id))
 
@@ -93,26 +143,18 @@ class Hand:
 
     def all_actions(self, player_id=None, street=actions.ANY) -> typing.Generator[actions.Action, None, None]:
         streets = actions.unpack_street(street)
-        if actions.PRE_FLOP in streets:
-            for a in self.pre_flop_actions:
-                if player_id is None or Player.names_eq(a.player_id, player_id):
-                    yield a
-        if actions.FLOP in streets:
-            for a in self.flop_actions:
-                if player_id is None or Player.names_eq(a.player_id, player_id):
-                    yield a
-        if actions.TURN in streets:
-            for a in self.turn_actions:
-                if player_id is None or Player.names_eq(a.player_id, player_id):
-                    yield a
-        if actions.RIVER in streets:
-            for a in self.river_actions:
-                if player_id is None or Player.names_eq(a.player_id, player_id):
-                    yield a
+        m = players.matcher(player_id) if player_id is not None else None
+        for st, acts in ((actions.PRE_FLOP, self.pre_flop_actions), (actions.FLOP, self.flop_actions),
+                         (actions.TURN, self.turn_actions), (actions.RIVER, self.river_actions)):
+            if st in streets:
+                for a in acts:
+                    if m is None or m.matches(a.player_idx, a.player_id):
+                        yield a
 
     def did_hero_vpip(self, street=actions.PRE_FLOP):
         return self.did_player_vpip(None, street=street)
 
+    @_memoized_once_frozen
     def did_player_vpip(self, player_id, street=actions.PRE_FLOP):
         for a in self.all_actions(player_id=player_id or self.hero_id, street=street):
             if a.is_vpip():
@@ -125,19 +167,21 @@ class Hand:
         """returns: if player ever opened or raised pre-flop (PFR = pre-flop raise)"""
         return self.did_player_raise(player_id, street=actions.PRE_FLOP)
 
+    @_memoized_once_frozen
     def did_player_3bet_pre(self, player_id) -> typing.Tuple[bool, typing.Optional[str]]:
         """returns: (had_opportunity, 'raise'/'call'/'fold')"""
+        m = players.matcher(player_id)
         raise_cnt = 0
         for a in self.all_actions(street=actions.PRE_FLOP):
             if a.is_aggro():
-                if Player.names_eq(player_id, a.player_id):
+                if m.matches(a.player_idx, a.player_id):
                     if raise_cnt == 1:
                         return True, actions.RAISE  # player is 2nd raiser
                     else:
                         return False, None  # player didn't have opportunity
                 else:
                     raise_cnt += 1
-            elif Player.names_eq(player_id, a.player_id):
+            elif m.matches(a.player_idx, a.player_id):
                 if raise_cnt == 1:
                     return True, a.action_type  # player had opportunity but called or folded
                 else:
@@ -146,8 +190,9 @@ class Hand:
 
     def get_action_seq_string(self, street=actions.PRE_FLOP):
         res = []
+        hero = players.matcher(self.hero_id)
         for act in self.all_actions(street=street):
-            is_hero = Player.names_eq(self.hero_id, act.player_id)
+            is_hero = hero.matches(act.player_idx, act.player_id)
             if act.action_type == actions.FOLD:
                 if is_hero:
                     res.append('F')
@@ -180,6 +225,7 @@ class Hand:
                     if someone_raised:
                         return False, None  # two opponents took aggressive actions
 
+    @_memoized_once_frozen
     def get_player_aggro_and_passive_counts(self, player_id, after_vpip=True):
         """returns: (n_aggressive_actions, n_passive_actions)"""
         if self.get_player(player_id) is None:
@@ -190,7 +236,7 @@ class Hand:
         aggro_cnt = 0
         passive_cnt = 0
 
-        for a in self.all_actions(player_id):
+        for a in self.all_actions(player_id or self.hero_id):
             if a.is_aggro():
                 aggro_cnt += 1
             elif a.is_passive():
@@ -198,9 +244,11 @@ class Hand:
 
         return aggro_cnt, passive_cnt
 
+    @_memoized_once_frozen
     def did_player_raise(self, player_id, street=actions.ANY):
+        m = players.matcher(player_id)
         for a in self.all_actions(player_id=self.hero_id, street=street):
-            if Player.names_eq(player_id, a.player_id) and a.is_aggro():
+            if m.matches(a.player_idx, a.player_id) and a.is_aggro():
                 return True
 
     def get_payouts(self):
@@ -220,9 +268,11 @@ class Hand:
     def hero_got_to_street(self, street):
         return self.player_got_to_street(None, street)
 
+    @_memoized_once_frozen
     def player_got_to_street(self, player_id, street):
+        m = players.matcher(player_id or self.hero_id)
         for n in self.players_involved_at_street(street):
-            if Player.names_eq(n, player_id or self.hero_id):
+            if m.matches(players.intern(n), n):
                 return True
         return False
 
@@ -232,6 +282,7 @@ class Hand:
     def is_multiway(self, street=actions.FLOP):
         return len(self.players_involved_at_street(street)) > 2
 
+    @_memoized_once_frozen
     def get_street_and_players_where_everyone_is_all_in(self) \
             -> typing.Tuple[typing.Optional[str], typing.List[str], typing.Dict[str, str]]:
         """
@@ -273,19 +324,21 @@ class Hand:
         :param player_id: Only count it if this player was involved (optional)
         :param street: Street by which the all-ins/calls occurred (optional).
         """
-        all_in_street, players, _ = self.get_street_and_players_where_everyone_is_all_in()
+        all_in_street, all_in_players, _ = self.get_street_and_players_where_everyone_is_all_in()
         if all_in_street is None or street not in actions.street_range(all_in_street, actions.RIVER):
             return False
 
         if player_id is None:
             return True
         else:
-            for pid in players:
-                if Player.names_eq(pid, player_id):
+            m = players.matcher(player_id)
+            for pid in all_in_players:
+                if m.matches(players.intern(pid), pid):
                     return True
 
             return False
 
+    @_memoized_once_frozen
     def players_involved_at_street(self, street) -> typing.Set[str]:
         streets = actions.unpack_street(street)
         in_hand_pre = set()
@@ -323,6 +376,7 @@ class Hand:
         else:
             return set()
 
+    @_memoized_once_frozen
     def get_position_to_player_mapping(self) -> typing.Dict[str, typing.List[str]]:
         # semi-complicated due to dead/inactive players and arbitrary
         # groupings for EP, MP, LP at various table-sizes.
@@ -434,6 +488,17 @@ class Hand:
 
         return clean_res
 
+    @_memoized_once_frozen
+    def get_position_index(self) -> 'positions.PositionIndex':
+        """returns: each player's seat labels and post-flop acting order (see positions.PositionIndex)."""
+        involved = {street: self.players_involved_at_street(street) for street in positions.STREETS}
+        return positions.PositionIndex.build(self.get_position_to_player_mapping(), self.hero_id, involved=involved)
+
+    @_memoized_once_frozen
+    def get_pot_structure(self) -> 'cardutils.PotStructure':
+        """returns: the hand's pot and side pots (see cardutils.PotStructure)."""
+        return cardutils.PotStructure.build(self.players, list(self.all_actions()))
+
     def get_bb_cost(self):
         return self.configs['bb_cost']
 
@@ -443,13 +508,27 @@ class Hand:
     def get_ante_cost(self):
         return self.configs['ante_cost']
 
+    @_memoized_once_frozen
     def get_player(self, name) -> 'typing.Optional[Player]':
         if name is None:
             return self.get_hero()
-        for p in self.players:
-            if p.matches_name(name):
-                return p
-        return None
+        m = players.matcher(name)
+        by_idx = self._players_by_idx()
+        res = None
+        for idx in m.candidates:
+            for i, p in by_idx.get(idx, ()):
+                if (res is None or i < res[0]) and m.matches(idx, p.name_and_id):
+                    res = (i, p)
+                    break
+        return res[1] if res is not None else None
+
+    @_memoized_once_frozen
+    def _players_by_idx(self) -> typing.Dict[int, typing.List[typing.Tuple[int, 'Player']]]:
+        """returns: Player.idx -> [(index in self.players, player), ...]"""
+        res = {}
+        for i, p in enumerate(self.players):
+            res.setdefault(p.idx, []).append((i, p))
+        return res
 
     def get_hero(self) -> 'typing.Optional[Player]':
         return self.get_player(self.hero_id)
@@ -458,13 +537,26 @@ class Hand:
         """returns: wall-clock duration of hand in seconds"""
         return (self.end_timestamp - self.timestamp).total_seconds()
 
-    def calc_advanced_stats(self, limit=float('inf')):
-        self._calc_all_in_equities(limit=limit)
-
-    def _calc_all_in_equities(self, limit=float('inf')):
-        street, players, lookup = self.get_street_and_players_where_everyone_is_all_in()
+    def calc_advanced_stats(self, limit=float('inf'), tolerance=None):
+        """
+        :param limit: how many all-in run-outs to simulate (or inf, to simulate them all).
+        :param tolerance: if given, all-in run-outs are sampled until the equities are this accurate (see
+                          cardutils.calc_all_in_equities), up to limit of them.
+        """
+        self._calc_all_in_equities(limit=limit, tolerance=tolerance)
+
+    def _calc_all_in_equities(self, limit=float('inf'), tolerance=None):
+        spot = self._get_all_in_spot()
+        if spot is not None:
+            board, cards_in_deck = spot
+            self._apply_all_in_equities(cardutils.calc_all_in_equities(self, board, cards_in_deck, limit=limit,
+                                                                       tolerance=tolerance))
+
+    def _get_all_in_spot(self) -> typing.Optional[typing.Tuple[typing.List[str], typing.List[str]]]:
+        """returns: (board when everyone was all-in, cards left in the deck), or None if there was no all-in run-out"""
+        street, all_in_players, _ = self.get_street_and_players_where_everyone_is_all_in()
         if street is None or street == actions.RIVER:
-            return
+            return None
 
         if street == actions.PRE_FLOP:
             board = []
@@ -474,15 +566,16 @@ class Hand:
             board = self.board[:4]
 
         cards_used_up = list(board)
-        for pid in players:
+        for pid in all_in_players:
             cards = self.get_player(pid).cards
             if None in cards:
                 raise ValueError(f"Player is involved in all-in with unknown cards?: {cards} {self}")
             cards_used_up.extend(cards)
 
-        cards_in_deck = list(cardutils.all_cards(cards_used_up))
-        equity_lookup = cardutils.calc_all_in_equities(self, board, cards_in_deck, limit=limit)
+        return board, list(cardutils.all_cards(cards_used_up))
 
+    def _apply_all_in_equities(self, equity_lookup):
+        street, _, lookup = self.get_street_and_players_where_everyone_is_all_in()
         for pid in equity_lookup:
             avg_pay, max_pay, equity = equity_lookup[pid]
             if max_pay > 0 and (pid not in lookup or lookup[pid] == street):
@@ -491,10 +584,28 @@ class Hand:
                 player.all_in_adj_max_gain = max_pay
 
 
+def calc_advanced_stats_batch(hand_list: typing.Sequence[Hand], limit=float('inf'), tolerance=None, batch_size=256):
+    """
+    Same as calling calc_advanced_stats on each hand, but the all-in run-outs of the hands are evaluated together.
+    :param batch_size: max number of all-in spots to evaluate at once (memory use grows with it).
+    """
+    spots = []
+    for h in hand_list:
+        spot = h._get_all_in_spot()
+        if spot is not None:
+            spots.append((h, spot[0], spot[1]))
+
+    for start in range(0, len(spots), batch_size):
+        batch = spots[start:start + batch_size]
+        for (h, _, _), equity_lookup in zip(batch, cardutils.calc_all_in_equities_batch(batch, limit=limit, tolerance=tolerance)):
+            h._apply_all_in_equities(equity_lookup)
+
+
 class Player:
 
     def __init__(self, name, stack, position, cards):
         self.name_and_id = name
+        self.idx = players.intern(name)
         self.stack = stack
         self.position = position
         self.cards = cards
@@ -515,21 +626,21 @@ class Player:
         self.all_in_adj_gain = None
         self.all_in_adj_max_gain = None
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["idx"]  # only valid in this process
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.idx = players.intern(self.name_and_id)
+
     @staticmethod
     def names_eq(id1, id2) -> bool:
-        if ' @ ' in id1 and ' @ ' in id2:
-            return id1.split(' @ ')[1] == id2.split(' @ ')[1]  # Compare by IDs
-        elif ' @ ' in id1:
-            n1, n2 = id1.split(' @ ')
-            return id2 == n1 or id2 == n2
-        elif ' @ ' in id2:
-            n1, n2 = id2.split(' @ ')
-            return id1 == n1 or id1 == n2
-        else:
-            return id1 == id2
+        return players.names_eq(id1, id2)
 
     def matches_name(self, name):
-        return Player.names_eq(self.name_and_id, name)
+        return players.matcher(name).matches(self.idx, self.name_and_id)
 
     def known_cards(self) -> int:
         res = 0
@@ -581,15 +692,31 @@ class Player:
 
 class HandGroup(collections.abc.Sequence):
 
-    def __init__(self, list_of_hands: typing.Sequence[Hand], desc="Group"):
+    def __init__(self, list_of_hands: typing.Sequence[Hand], desc="Group", columns=None):
         self.desc = desc
         self.hands = list(list_of_hands)
+        self._columns = columns  # columns.HandColumns, built on demand (see _get_columns)
+        self._filter_bits = {}   # Filter.key() -> bitset of the hands that pass it (see filter_bits)
 
     def append(self, hand):
-        self.hands.append(hand)
+        self.extend([hand])
 
     def extend(self, hand_seq: typing.Sequence[Hand]):
+        hand_seq = list(hand_seq)
         self.hands.extend(hand_seq)
+        if self._columns is not None:
+            self._columns = self._columns.extended(hand_seq)  # only the new hands need to be read
+        self._filter_bits.clear()
+
+    def _get_columns(self):
+        """returns: columnar view of this group's hands, or None if NumPy isn't available."""
+        if self._columns is None:
+            try:
+                import poker.columns as columns
+            except ImportError:
+                return None
+            self._columns = columns.HandColumns.build(self.hands)
+        return self._columns
 
     def __len__(self):
         return len(self.hands)
@@ -650,13 +777,36 @@ class HandGroup(collections.abc.Sequence):
         return HandGroup(list(my_hands.union(other_hands)),
                          desc=f"({self.desc} u {other.desc})")
 
+    def filter_bits(self, filter: 'filters.Filter') -> int:
+        """returns: bitset of the hands that pass the filter (bit i is set if self.hands[i] passes).
+                    Results are cached by the filter's key, so each distinct filter (or subfilter of a
+                    compound filter) is only evaluated once per group."""
+        key = filter.key()
+        try:
+            res = self._filter_bits.get(key)
+        except TypeError:
+            return filter.evaluate(self)  # unhashable parameters, can't cache
+        if res is None:
+            res = self._filter_bits[key] = filter.evaluate(self)
+        return res
+
     def filter(self, filter: 'filters.Filter', desc=None) -> 'HandGroup':
-        new_hands = [h for h in self.hands if filter.test(h)]
-        return HandGroup(new_hands, desc=desc if desc is not None else f"F({self.desc})")
+        import poker.filters as filters
+        mask = filters.bits_to_bools(self.filter_bits(filter), len(self.hands))
+        new_hands = [h for h, keep in zip(self.hands, mask) if keep]
+        # if we've already built columns, the filtered group can just slice them
+        columns = self._columns.take(mask) if self._columns is not None else None
+        return HandGroup(new_hands, desc=desc if desc is not None else f"F({self.desc})", columns=columns)
 
     def vpip_pcnt(self, player_id=None, street=actions.PRE_FLOP):
         if len(self) == 0:
             return 0
+        cols = self._get_columns() if street in (actions.PRE_FLOP, actions.ANY) else None
+        if cols is not None:
+            rows = cols.player_rows(player_id)
+            hand_cnt = rows.sum()
+            vpip_cnt = (rows & cols["vpip" if street == actions.PRE_FLOP else "vpip_any"]).sum()
+            return vpip_cnt / hand_cnt if hand_cnt > 0 else float('nan')
         else:
             vpip_cnt = 0
             hand_cnt = 0
@@ -674,6 +824,12 @@ class HandGroup(collections.abc.Sequence):
         """ returns: number of 3bets / number of opportunities to 3bet"""
         if self.hands_played(player_id) == 0:
             return float('nan')
+        cols = self._get_columns()
+        if cols is not None:
+            rows = cols.player_rows(player_id)
+            had_opportunity = (rows & cols["three_bet_opp"]).sum()
+            cnt = (rows & cols["three_bet"]).sum()
+            return cnt / had_opportunity if had_opportunity > 0 else 0
         else:
             had_opportunity = 0
             cnt = 0
@@ -689,6 +845,13 @@ class HandGroup(collections.abc.Sequence):
                 return cnt / had_opportunity
 
     def get_saw_street_pcnt(self, player_id=None, street=actions.FLOP):
+        cols = self._get_columns()
+        if cols is not None and cols.reached_street(street) is not None:
+            rows = cols.player_rows(player_id)
+            played_hands = rows.sum()
+            saw_street = (rows & cols.reached_street(street)).sum()
+            return saw_street / played_hands if played_hands > 0 else float('nan')
+
         saw_street = 0
         played_hands = 0
         for h in self.hands:
@@ -700,6 +863,16 @@ class HandGroup(collections.abc.Sequence):
         return saw_street / played_hands if played_hands > 0 else float('nan')
 
     def get_voluntary_show_pcnt(self, player_id=None, after_vpip=True):
+        cols = self._get_columns()
+        if cols is not None:
+            rows = cols.player_rows(player_id)
+            if after_vpip:
+                rows = rows & cols["vpip_any"]
+            rows = rows & ~((cols["showed"] == 2) & (cols["vol_showed"] == 0))  # compelled to show
+            had_opportunity = 2 * rows.sum()
+            did_show = cols["vol_showed"][rows].sum()
+            return did_show / had_opportunity if had_opportunity > 0 else float('nan')
+
         had_opportunity = 0
         did_show = 0
         for h in self.hands:
@@ -717,12 +890,20 @@ class HandGroup(collections.abc.Sequence):
             return did_show / had_opportunity
 
     def get_aggression_factor(self, player_id=None, after_vpip=True) -> float:
-        aggro_cnt = 0
-        passive_cnt = 0
-        for h in self.hands:
-            aggro, passive = h.get_player_aggro_and_passive_counts(player_id, after_vpip=after_vpip)
-            aggro_cnt += aggro
-            passive_cnt += passive
+        cols = self._get_columns()
+        if cols is not None:
+            rows = cols.player_rows(player_id)
+            if after_vpip:
+                rows = rows & cols["vpip_any"]
+            aggro_cnt = cols["aggro"][rows].sum()
+            passive_cnt = cols["passive"][rows].sum()
+        else:
+            aggro_cnt = 0
+            passive_cnt = 0
+            for h in self.hands:
+                aggro, passive = h.get_player_aggro_and_passive_counts(player_id, after_vpip=after_vpip)
+                aggro_cnt += aggro
+                passive_cnt += passive
 
         if aggro_cnt + passive_cnt == 0:
             return float('nan')
@@ -730,6 +911,9 @@ class HandGroup(collections.abc.Sequence):
             return aggro_cnt / (aggro_cnt + passive_cnt)
 
     def net_gain(self, all_in_adj=False, player_id=None):
+        cols = self._get_columns()
+        if cols is not None:
+            return float(cols["net_adj" if all_in_adj else "net"][cols.player_rows(player_id)].sum())
         res = 0
         for h in self.hands:
             p = h.get_player(player_id)
@@ -738,6 +922,9 @@ class HandGroup(collections.abc.Sequence):
         return res
 
     def total_flux(self, player_id=None):
+        cols = self._get_columns()
+        if cols is not None:
+            return float(abs(cols["net"][cols.player_rows(player_id)]).sum())
         res = 0
         for h in self.hands:
             p = h.get_player(player_id)
@@ -748,6 +935,9 @@ class HandGroup(collections.abc.Sequence):
     def hands_played(self, player_id=None):
         if player_id is None:
             return len(self)
+        cols = self._get_columns()
+        if cols is not None:
+            return int(cols.player_rows(player_id).sum())
         else:
             return len([h for h in self.hands if h.get_player(player_id) is not None])
 
@@ -759,6 +949,10 @@ class HandGroup(collections.abc.Sequence):
             return self.net_gain(player_id=player_id) / hands_played
 
     def net_bbs(self, all_in_adj=False, player_id=None):
+        cols = self._get_columns()
+        if cols is not None:
+            rows = cols.player_rows(player_id)
+            return float((cols["net_adj" if all_in_adj else "net"][rows] / cols["bb_cost"][rows]).sum())
         res = 0
         for h in self.hands:
             p = h.get_player(player_id)
@@ -774,6 +968,14 @@ class HandGroup(collections.abc.Sequence):
             return self.net_bbs(player_id=player_id) / hands_played
 
     def win_pcnt(self, player_id=None, after_vpip=True):
+        cols = self._get_columns()
+        if cols is not None:
+            rows = cols.player_rows(player_id)
+            if after_vpip:
+                rows = rows & cols["vpip_any"]
+            total = rows.sum()
+            return (rows & (cols["net"] > 0)).sum() / total if total > 0 else float('nan')
+
         wins = 0
         losses = 0
         for h in self.hands:
@@ -790,6 +992,12 @@ class HandGroup(collections.abc.Sequence):
             return wins / (wins + losses)
 
     def win_at_showdown_pcnt(self, player_id=None):
+        cols = self._get_columns()
+        if cols is not None:
+            rows = cols.player_rows(player_id) & cols.reached_street(actions.SHOWDOWN)
+            total = rows.sum()
+            return (rows & (cols["net"] > 0)).sum() / total if total > 0 else float('nan')
+
         wins = 0
         losses = 0
         for h in self.hands:
@@ -810,13 +1018,20 @@ class HandGroup(collections.abc.Sequence):
         return self.net_gain(player_id=player_id) - self.net_gain(all_in_adj=True, player_id=player_id)
 
     def get_avg_all_in_equity(self, player_id=None):
-        max_winnings = 0
-        expected_winnings = 0
-        for h in self.hands:
-            p = h.get_player(player_id)
-            if p is not None and p.all_in_adj_gain is not None:
-                max_winnings += p.all_in_adj_max_gain
-                expected_winnings += p.all_in_adj_gain
+        cols = self._get_columns()
+        if cols is not None:
+            import numpy
+            rows = cols.player_rows(player_id) & ~numpy.isnan(cols["all_in_adj_gain"])
+            max_winnings = cols["all_in_adj_max_gain"][rows].sum()
+            expected_winnings = cols["all_in_adj_gain"][rows].sum()
+        else:
+            max_winnings = 0
+            expected_winnings = 0
+            for h in self.hands:
+                p = h.get_player(player_id)
+                if p is not None and p.all_in_adj_gain is not None:
+                    max_winnings += p.all_in_adj_max_gain
+                    expected_winnings += p.all_in_adj_gain
         if max_winnings == 0:
             return float('nan')
         else:
@@ -857,7 +1072,14 @@ class HandGroup(collections.abc.Sequence):
                         hands_to_keep.append(h)
                 return HandGroup(hands_to_keep, desc=desc)
 
-    def summary(self, player_id=None):
+    def summary(self, player_id=None, stats=None):
+        """
+        :param stats: the group's pre-calculated stats.StatsRecord for the player (optional).
+        """
+        if stats is None:
+            import poker.stats
+            stats = poker.stats.calc_stats(self, player_id=player_id)
+
         pid = ""
         if player_id is not None:
             p_name = player_id.split(' @ ')[0] if ' @ ' in player_id else player_id
@@ -866,19 +1088,19 @@ class HandGroup(collections.abc.Sequence):
             pid = f" ({p_name})"
 
         desc = f"{self.desc}{pid}: "
-        avg_bbs = f"{self.avg_bbs_per_play(player_id=player_id):.1f}bb"
-        total = f"{locale.currency(self.net_gain(player_id=player_id))}"
-        in_x_hands = f"in {self.hands_played(player_id=player_id)} hand(s)"
-
-        vpip_pcnt = cardutils.format_pcnt(self.vpip_pcnt(player_id=player_id))
-        win_pcnt = cardutils.format_pcnt(self.win_pcnt(player_id=player_id))
-        win_at_sd_pcnt = cardutils.format_pcnt(self.win_at_showdown_pcnt(player_id=player_id))
-        three_bet_pcnt = cardutils.format_pcnt(self.get_3bet_pcnt(player_id=player_id))
-        saw_flop = cardutils.format_pcnt(self.get_saw_street_pcnt(player_id=player_id, street=actions.FLOP))
-        show_pcnt = cardutils.format_pcnt(self.get_voluntary_show_pcnt(player_id=player_id, after_vpip=True))
-        aggro_pcnt = cardutils.format_pcnt(self.get_aggression_factor(player_id=player_id, after_vpip=True))
-        avg_all_in_eq = cardutils.format_pcnt(self.get_avg_all_in_equity(player_id=player_id))
-        luck = locale.currency(self.get_luck(player_id=player_id))
+        avg_bbs = f"{stats.avg_bbs_per_play():.1f}bb"
+        total = f"{locale.currency(stats.net_gain())}"
+        in_x_hands = f"in {stats.hands_played()} hand(s)"
+
+        vpip_pcnt = cardutils.format_pcnt(stats.vpip_pcnt())
+        win_pcnt = cardutils.format_pcnt(stats.win_pcnt())
+        win_at_sd_pcnt = cardutils.format_pcnt(stats.win_at_showdown_pcnt())
+        three_bet_pcnt = cardutils.format_pcnt(stats.three_bet_pcnt())
+        saw_flop = cardutils.format_pcnt(stats.saw_flop_pcnt())
+        show_pcnt = cardutils.format_pcnt(stats.voluntary_show_pcnt())
+        aggro_pcnt = cardutils.format_pcnt(stats.aggression_factor())
+        avg_all_in_eq = cardutils.format_pcnt(stats.avg_all_in_equity())
+        luck = locale.currency(stats.luck())
 
         return (f"{desc:<32}{avg_bbs:<12}{total:<12}{in_x_hands:<18}"
                 f"[VPIP={vpip_pcnt:>5}, 3BET={three_bet_pcnt}, SAW_FLOP={saw_flop}, WIN={win_pcnt}, "
@@ -886,6 +1108,13 @@ class HandGroup(collections.abc.Sequence):
                 f"LUCK={luck:<12}")
 
     def get_hole_card_freqs(self, player_id=None):
+        cols = self._get_columns()
+        if cols is not None:
+            import numpy
+            import poker.ranges as ranges
+            codes = cols["card_code"][cols.player_rows(player_id)]
+            counts = numpy.bincount(codes[codes >= 0], minlength=len(ranges.CARD_CODES))
+            return {ranges.CARD_CODES[i]: int(counts[i]) for i in numpy.flatnonzero(counts)}
         res = {}
         for h in self.hands:
             p = h.get_player(player_id)
@@ -0,0 +1,76 @@
+import collections
+
+# Registry that interns player ids ("Name @ id" strings, or bare names) to small ints, so that hands can
+# find a player's actions and seats with int lookups instead of splitting strings in names_eq.
+#
+# Ids are interned by their id part (or the whole string, for bare names), so "Bob @ b1" and "Robert @ b1"
+# get the same int. Interned ints are only meaningful within the process that made them, so Action and
+# Player re-intern their ids when they're unpickled.
+
+_KEYS = []                                  # idx -> key
+_KEY_IDX = {}                               # key -> idx
+_INTERNED = {}                              # player id -> idx
+_NAME_IDXS = collections.defaultdict(set)   # name part of a "Name @ id" -> idxs it has been seen with
+_MATCHERS = {}                              # query -> Matcher
+
+
+def names_eq(id1, id2) -> bool:
+    if ' @ ' in id1 and ' @ ' in id2:
+        return id1.split(' @ ')[1] == id2.split(' @ ')[1]  # Compare by IDs
+    elif ' @ ' in id1:
+        n1, n2 = id1.split(' @ ')
+        return id2 == n1 or id2 == n2
+    elif ' @ ' in id2:
+        n1, n2 = id2.split(' @ ')
+        return id1 == n1 or id1 == n2
+    else:
+        return id1 == id2
+
+
+def intern(player_id) -> int:
+    """returns: the int for the given player id (or -1 if it's None)."""
+    idx = _INTERNED.get(player_id)
+    if idx is None:
+        if player_id is None:
+            return -1
+        if ' @ ' in player_id:
+            parts = player_id.split(' @ ')
+            name, key = parts[0], parts[1]
+        else:
+            name, key = None, player_id
+        idx = _KEY_IDX.get(key)
+        if idx is None:
+            idx = _KEY_IDX[key] = len(_KEYS)
+            _KEYS.append(key)
+        if name is not None:
+            _NAME_IDXS[name].add(idx)
+        _INTERNED[player_id] = idx
+    return idx
+
+
+class Matcher:
+    """Tests whether interned player ids match a query, the same way names_eq(player_id, query) would."""
+
+    def __init__(self, query, exact, maybe):
+        self.query = query
+        self.exact = exact  # idxs that always match
+        self.maybe = maybe  # idxs that match for some of their ids (e.g. "Bob" matches "Bob @ b1" but not "Rob @ b1")
+        self.candidates = exact | maybe
+        self._n_interned = len(_INTERNED)
+
+    def matches(self, idx, player_id) -> bool:
+        return idx in self.exact or (idx in self.maybe and names_eq(player_id, self.query))
+
+
+def matcher(query) -> Matcher:
+    res = _MATCHERS.get(query)
+    if res is None or res._n_interned != len(_INTERNED):
+        if ' @ ' in query:
+            name, key = query.split(' @ ')[0:2]
+            exact = {_KEY_IDX[key]} if key in _KEY_IDX else set()
+            maybe = {_KEY_IDX[name]} if name in _KEY_IDX else set()  # a bare id equal to the query's name
+        else:
+            exact = {_KEY_IDX[query]} if query in _KEY_IDX else set()
+            maybe = set(_NAME_IDXS.get(query, ()))
+        res = _MATCHERS[query] = Matcher(query, frozenset(exact), frozenset(maybe - exact))
+    return res
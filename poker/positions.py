@@ -0,0 +1,103 @@
+import typing
+
+from poker import actions, players
+
+# Per-hand index of who sat where, built once from Hand.get_position_to_player_mapping (see
+# Hand.get_position_index), so position filters and stats don't need to walk the mapping's lists.
+#
+# Each player's seat is their post-flop acting index (0 acts first, i.e. the SB), and sets of seats (the
+# hero's, or the players still in the hand at a street) are bitmasks over those indices, so being in or
+# out of position is a couple of bit tests. Seat labels are bit flags too (a player can have several,
+# e.g. SB and EP and BLINDS).
+
+LABELS = [actions.SB, actions.BB, actions.UTG, actions.UTG_PLUS, actions.LJ, actions.HJ, actions.CO, actions.BTN,
+          actions.EARLY_POS, actions.MID_POS, actions.LATE_POS, actions.BLINDS]
+LABEL_BITS = {label: 1 << i for i, label in enumerate(LABELS)}
+
+STREETS = [actions.PRE_FLOP, actions.FLOP, actions.TURN, actions.RIVER, actions.SHOWDOWN]  # see PositionIndex.active_seats
+
+
+def to_bits(labels: typing.Iterable[str]) -> int:
+    res = 0
+    for label in labels:
+        res |= LABEL_BITS.get(label, 0)
+    return res
+
+
+class PositionIndex:
+
+    def __init__(self, seats, labels, hero_seats, hero_labels, active_seats):
+        self.seats = seats              # player id -> acting index, for the players who were dealt in
+        self.labels = labels            # player id -> LABEL_BITS of their seat
+        self.hero_seats = hero_seats    # bitmask of the seats that are the hero's (0 if they weren't dealt in)
+        self.hero_labels = hero_labels  # LABEL_BITS of the hero's seat
+        self.active_seats = active_seats  # street -> bitmask of the seats still in the hand, for each of STREETS
+
+    @staticmethod
+    def build(position_mapping: typing.Mapping[str, typing.Sequence[str]], hero_id,
+              involved: typing.Mapping[str, typing.Collection[str]] = None) -> 'PositionIndex':
+        """
+        :param position_mapping: see Hand.get_position_to_player_mapping.
+        :param involved: street -> the players still in the hand at that street (see Hand.players_involved_at_street).
+        """
+        labels = {}
+        for label, player_ids in position_mapping.items():
+            if label in LABEL_BITS:
+                for pid in player_ids:
+                    labels[pid] = labels.get(pid, 0) | LABEL_BITS[label]
+
+        hero = players.matcher(hero_id)
+        seats = {}
+        hero_seats = 0
+        for i, pid in enumerate(position_mapping.get(actions.ANY, ())):
+            seats.setdefault(pid, i)
+            if hero.matches(players.intern(pid), pid):
+                hero_seats |= 1 << i
+        hero_labels = 0
+        for pid, bits in labels.items():
+            if hero.matches(players.intern(pid), pid):
+                hero_labels |= bits
+        index = PositionIndex(seats, labels, hero_seats, hero_labels, {})
+        index.active_seats = {street: index.seat_mask(pids) for street, pids in (involved or {}).items()}
+        return index
+
+    def seat_mask(self, player_ids: typing.Iterable[str]) -> int:
+        """returns: bitmask of the seats of the given players (players who weren't dealt in are ignored)."""
+        res = 0
+        for pid in player_ids:
+            if pid in self.seats:
+                res |= 1 << self.seats[pid]
+        return res
+
+    def labels_of(self, player_id) -> int:
+        """returns: LABEL_BITS of the seats of every player matching the given id."""
+        m = players.matcher(player_id)
+        res = 0
+        for pid, bits in self.labels.items():
+            if m.matches(players.intern(pid), pid):
+                res |= bits
+        return res
+
+    def hero_acts_last(self, active_seats: int, reverse=False) -> bool:
+        """returns: whether one of the active seats is the hero's, and none of the other active seats act after
+                    it (or before it, if reverse is True)."""
+        return hero_acts_last(self.hero_seats, active_seats, reverse=reverse)
+
+
+def hero_acts_last(hero_seats, active_seats, reverse=False):
+    """Same as PositionIndex.hero_acts_last, but also works on NumPy arrays of bitmasks (one per hand)."""
+    hero_active = hero_seats & active_seats
+    others = active_seats & ~hero_seats
+    if not reverse:
+        first_hero = hero_active & -hero_active  # lowest set bit
+        return (hero_active != 0) & (others & ~(2 * first_hero - 1) == 0)
+    else:
+        last_hero = _highest_bit(hero_active)
+        return (hero_active != 0) & (others & (last_hero - 1) == 0)
+
+
+def _highest_bit(masks):
+    res = masks | (masks >> 1)
+    for shift in (2, 4, 8, 16, 32):
+        res |= res >> shift
+    return res - (res >> 1)
@@ -1,46 +1,118 @@
+import argparse
+import array
+import concurrent.futures
+import datetime
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
 import typing
 
 import poker.cardutils as cardutils
 import const
 
-_DB = {}
-
-# Looks like:
-# {
-#     'AhKh': {
-#         'AdAd': 0.5,
-#         'AcKc': 0.5,
-#         ...
-#     },
-#     ...
-# }
-
-
-def load_from_disk():
-    global _DB
-    with open(const.EQUITY_DB) as f:
-        n = 0
+# Pre-flop equities are stored in a flat array of float32s, memory-mapped straight from disk.
+#
+# Each normalized hand pair (see _normalize) maps to a unique slot: the rank pair of each hand (91 possible
+# each), times the pattern of suits across the four cards (15 possible, e.g. 'abcd' or 'abab'). Slots with
+# no equity hold NaN. The text file (const.EQUITY_DB) is still the source of truth, and the binary file
+# (const.EQUITY_DB_BIN) is rebuilt from it whenever it's missing or older than the text file.
+
+_DB: typing.Optional[typing.Sequence[float]] = None  # slot -> equity of the first hand
+_DB_PATH = None  # binary file _DB was loaded from
+
+_MAGIC = b"PFEQ"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHII")  # magic, version, bytes per value, number of values, (unused)
+
+_RANK_IDX = {r: i for i, r in enumerate(reversed(cardutils.RANKS))}  # '2' -> 0, ..., 'A' -> 12
+_N_RANK_PAIRS = 13 * 14 // 2
+_SUIT_PATTERNS = {}  # 'abac' -> idx, for every way to assign first-seen suit letters to four cards
+for _p in itertools.product("abcd", repeat=4):
+    if all(_p[i] <= "abcd"[len(set(_p[:i]))] for i in range(4)):
+        _SUIT_PATTERNS["".join(_p)] = len(_SUIT_PATTERNS)
+N_SLOTS = _N_RANK_PAIRS * _N_RANK_PAIRS * len(_SUIT_PATTERNS)
+
+# Average equities between card codes ('AKs', '77', ...) are derived from the DB and cached in const.EQUITY_MATRIX
+# (or next to the binary DB, if it isn't the default one), and rebuilt whenever it's older than the binary DB. Stored as (equities, combo counts, equities vs. all), where
+# the first two are indexed by card_code_idx1 * len(CARD_CODES) + card_code_idx2.
+CARD_CODES = list(cardutils.all_card_codes())
+CARD_CODE_IDX = {cc: i for i, cc in enumerate(CARD_CODES)}
+_CC_MATRIX = None
+_MATRIX_MAGIC = b"PFCC"
+
+
+def _rank_pair_idx(hi, lo) -> int:
+    return hi * (hi + 1) // 2 + lo
+
+
+def _slot_of(key1, key2) -> int:
+    """'AaKb', 'Kc9a' -> index into the binary DB."""
+    pair1 = _rank_pair_idx(_RANK_IDX[key1[0]], _RANK_IDX[key1[2]])
+    pair2 = _rank_pair_idx(_RANK_IDX[key2[0]], _RANK_IDX[key2[2]])
+    pattern = _SUIT_PATTERNS[key1[1] + key1[3] + key2[1] + key2[3]]
+    return (pair1 * _N_RANK_PAIRS + pair2) * len(_SUIT_PATTERNS) + pattern
+
+
+def read_text_db(path) -> typing.Dict[typing.Tuple[str, str], float]:
+    """returns: (key1, key2) -> equity, from a text file with lines like 'AaKb Kc9a 0.69150'."""
+    res = {}
+    with open(path) as f:
         for line in f:
             line = line.rstrip()
             if len(line) == 0:
                 continue
             cards1, cards2, eq = line.split(" ")
-            eq = float(eq)
-
-            if cards1 not in _DB:
-                _DB[cards1] = {}
-            _DB[cards1][cards2] = eq
-            n += 1
-        print(f"INFO: loaded {n} pre-flop hand equities from {const.EQUITY_DB}")
-
-
-def save_to_disk():
-    if _DB is not None:
-        with open(const.EQUITY_DB, 'w') as f:
-            for cards1 in _DB:
-                for cards2 in _DB[cards1]:
-                    equity = _DB[cards1][cards2]
-                    f.write(f"{cards1} {cards2} {equity:.5f}\n")
+            res[(cards1, cards2)] = float(eq)
+    return res
+
+
+def write_binary_db(equities: typing.Dict[typing.Tuple[str, str], float], path):
+    values = array.array('f', [float('nan')]) * N_SLOTS
+    for (key1, key2), eq in equities.items():
+        values[_slot_of(key1, key2)] = eq
+    if sys.byteorder != 'little':
+        values.byteswap()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, values.itemsize, N_SLOTS, 0))
+        f.write(values.tobytes())
+    os.replace(tmp_path, path)
+
+
+def convert_text_to_binary(text_path=None, bin_path=None):
+    text_path = text_path or const.EQUITY_DB
+    bin_path = bin_path or const.EQUITY_DB_BIN
+    equities = read_text_db(text_path)
+    write_binary_db(equities, bin_path)
+    print(f"INFO: converted {len(equities)} pre-flop hand equities from {text_path} to {bin_path}")
+
+
+def load_from_disk(bin_path=None, text_path=None):
+    global _DB, _DB_PATH, _CC_MATRIX
+    bin_path = bin_path or const.EQUITY_DB_BIN
+    text_path = text_path or const.EQUITY_DB
+    if os.path.exists(text_path) and (not os.path.exists(bin_path)
+                                      or os.path.getmtime(bin_path) < os.path.getmtime(text_path)):
+        convert_text_to_binary(text_path, bin_path)
+
+    with open(bin_path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, itemsize, count, _ = _HEADER.unpack_from(mm)
+    if magic != _MAGIC or version != _VERSION or itemsize != 4 or count != N_SLOTS:
+        raise ValueError(f"Unrecognized pre-flop equity DB format: {bin_path}")
+
+    if sys.byteorder == 'little':
+        _DB = memoryview(mm)[_HEADER.size:_HEADER.size + itemsize * count].cast('f')
+    else:
+        values = array.array('f', mm[_HEADER.size:_HEADER.size + itemsize * count])
+        values.byteswap()
+        _DB = values
+    _DB_PATH = bin_path
+    _CC_MATRIX = None  # derived from whichever DB was loaded before
+    print(f"INFO: loaded pre-flop hand equities from {bin_path}")
 
 
 def add_line_to_disk(cards1, cards2, equity):
@@ -49,44 +121,110 @@ def add_line_to_disk(cards1, cards2, equity):
 
 
 def get_equity(h1, h2, no_fail=False):
-    if len(_DB) == 0:
+    if _DB is None:
         load_from_disk()
     orig_h1c1 = h1[0]
     h1, h2, key1, key2 = _normalize(h1, h2)
-    if key1 in _DB and key2 in _DB[key1]:
-        return _DB[key1][key2] if orig_h1c1 in h1 else 1 - _DB[key1][key2]
+    eq = _DB[_slot_of(key1, key2)]
+    if eq == eq:  # not NaN
+        return eq if orig_h1c1 in h1 else 1 - eq
     elif no_fail:
         return None
     else:
         raise ValueError(f"Failed to find pre-flop equity for: {h1} vs {h2}")
 
 
-def get_avg_equity_by_cardcode(cc1, cc2) -> typing.Tuple[float, int]:
-    combos1 = cardutils.all_combos_of_card_code(cc1)
-    combos2 = cardutils.all_combos_of_card_code(cc2)
+def _build_card_code_matrix():
+    n = len(CARD_CODES)
+    equities = array.array('d', [0.]) * (n * n)
+    counts = array.array('i', [0]) * (n * n)
+    combos = [list(cardutils.all_combos_of_card_code(cc)) for cc in CARD_CODES]
+    for i1 in range(n):
+        # the DB doesn't distinguish between suits, so every combo of cc1 has the same average equity (and the
+        # same number of possible opposing combos) as its first one
+        h1 = combos[i1][0]
+        for i2 in range(i1, n):
+            total, cnt = 0, 0
+            for h2 in combos[i2]:
+                if cardutils.are_unique(h1 + h2):
+                    total += get_equity(h1, h2)
+                    cnt += 1
+            equities[i2 * n + i1] = 1 - total / cnt
+            equities[i1 * n + i2] = total / cnt
+            counts[i1 * n + i2] = counts[i2 * n + i1] = cnt * len(combos[i1])
+
+    vs_all = array.array('d', [0.]) * n
+    for i1 in range(n):
+        row = range(i1 * n, (i1 + 1) * n)
+        vs_all[i1] = sum(equities[i] * counts[i] for i in row) / sum(counts[i] for i in row)
+    return equities, counts, vs_all
+
+
+def _write_card_code_matrix(path, equities, counts, vs_all):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MATRIX_MAGIC, _VERSION, 0, len(CARD_CODES), 0))
+        for arr in (equities, counts, vs_all):
+            if sys.byteorder != 'little':
+                arr = array.array(arr.typecode, arr)
+                arr.byteswap()
+            f.write(arr.tobytes())
+    os.replace(tmp_path, path)
+
+
+def _read_card_code_matrix(path):
+    n = len(CARD_CODES)
+    with open(path, 'rb') as f:
+        magic, version, _, count, _ = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MATRIX_MAGIC or version != _VERSION or count != n:
+            return None
+        res = []
+        for typecode, size in (('d', n * n), ('i', n * n), ('d', n)):
+            arr = array.array(typecode)
+            arr.fromfile(f, size)
+            if sys.byteorder != 'little':
+                arr.byteswap()
+            res.append(arr)
+    return tuple(res)
+
+
+def _ensure_card_code_matrix():
+    global _CC_MATRIX
+    if _CC_MATRIX is not None:
+        return
+    if _DB is None:
+        load_from_disk()
+    path = _card_code_matrix_path(_DB_PATH)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(_DB_PATH):
+        _CC_MATRIX = _read_card_code_matrix(path)
+    if _CC_MATRIX is None:
+        _CC_MATRIX = _build_card_code_matrix()
+        _write_card_code_matrix(path, *_CC_MATRIX)
 
-    n = 0
-    sum1, sum2 = 0, 0
 
-    for h1 in combos1:
-        for h2 in combos2:
-            if cardutils.are_unique(h1 + h2):
-                eq = get_equity(h1, h2)
-                sum1 += eq
-                sum2 += 1 - eq
-                n += 1
+def _card_code_matrix_path(bin_path) -> str:
+    if os.path.abspath(bin_path) == os.path.abspath(const.EQUITY_DB_BIN):
+        return const.EQUITY_MATRIX
+    return f"{os.path.splitext(bin_path)[0]}_cardcode_matrix.bin"
 
-    return sum1 / (sum1 + sum2), n
+
+def get_avg_equity_by_cardcode(cc1, cc2) -> typing.Tuple[float, int]:
+    """returns: average equity of cc1 vs. cc2 (e.g. 'AKs' vs. '77'), and the number of combos it's averaged over."""
+    _ensure_card_code_matrix()
+    equities, counts, _ = _CC_MATRIX
+    i = CARD_CODE_IDX[cc1] * len(CARD_CODES) + CARD_CODE_IDX[cc2]
+    return equities[i], counts[i]
+
+
+def get_card_code_matrix() -> typing.Tuple[typing.Sequence[float], typing.Sequence[int]]:
+    """returns: (average equities, combo counts) of every pair of card codes, indexed like get_avg_equity_by_cardcode."""
+    _ensure_card_code_matrix()
+    return _CC_MATRIX[0], _CC_MATRIX[1]
 
 
 def get_avg_equity_vs_all(cc):
-    total_eq = 0
-    total_n = 0
-    for cc2 in cardutils.all_card_codes():
-        eq, n = get_avg_equity_by_cardcode(cc, cc2)
-        total_eq += eq * n
-        total_n += n
-    return total_eq / total_n
+    _ensure_card_code_matrix()
+    return _CC_MATRIX[2][CARD_CODE_IDX[cc]]
 
 
 def _normalize(h1, h2):
@@ -120,21 +258,129 @@ def _normalize(h1, h2):
     return h1, h2, key1, key2
 
 
+def iter_matchups() -> typing.Generator[typing.Tuple[str, str, typing.Tuple[str, str], typing.Tuple[str, str]], None, None]:
+    """yields: (key1, key2, h1, h2) for every distinct pre-flop matchup (up to suit isomorphism), where
+               h1 and h2 are example hands that normalize to key1 and key2."""
+    ranks = sorted(_RANK_IDX, key=lambda r: _RANK_IDX[r])
+    suit_of_letter = dict(zip("abcd", cardutils.SUITS))
+    rank_pairs = [(hi, lo) for hi in range(13) for lo in range(hi + 1)]
+    for (hi1, lo1), (hi2, lo2) in itertools.product(rank_pairs, repeat=2):
+        for pattern in _SUIT_PATTERNS:
+            cards = [ranks[r] + suit_of_letter[s] for r, s in zip((hi1, lo1, hi2, lo2), pattern)]
+            if len(set(cards)) < 4:
+                continue
+            key1 = f"{ranks[hi1]}{pattern[0]}{ranks[lo1]}{pattern[1]}"
+            key2 = f"{ranks[hi2]}{pattern[2]}{ranks[lo2]}{pattern[3]}"
+            h1, h2, norm_key1, norm_key2 = _normalize((cards[0], cards[1]), (cards[2], cards[3]))
+            if (norm_key1, norm_key2) == (key1, key2):
+                yield key1, key2, tuple(h1), tuple(h2)
+
+
+def _calc_matchup_equities(matchups, n_samples=None) -> typing.List[typing.Tuple[str, str, float]]:
+    """
+    :param matchups: list of (key1, key2, h1, h2), see iter_matchups.
+    :param n_samples: number of random runouts per matchup, or None to enumerate every runout.
+    :return: list of (key1, key2, equity of h1).
+    """
+    res = []
+    if n_samples is None:
+        import poker.enumeration as enumeration
+        for key1, key2, h1, h2 in matchups:
+            wins = enumeration.calc_exact_wins([h1, h2], [])
+            res.append((key1, key2, wins[0] / sum(wins)))
+    else:
+        import numpy
+        import poker.evaluator as evaluator
+        import poker.vectorized as vectorized
+        rng = numpy.random.default_rng()
+        for key1, key2, h1, h2 in matchups:
+            holes = [evaluator.to_ints(h1), evaluator.to_ints(h2)]
+            deck = [c for c in range(evaluator.N_CARDS) if c not in holes[0] + holes[1]]
+            boards = vectorized.generate_runouts([], deck, limit=n_samples, rng=rng)
+            shares = vectorized.calc_win_shares(vectorized.calc_strengths_batch([(holes, boards)])[0])
+            res.append((key1, key2, float(shares[0] / len(boards))))
+    return res
+
+
+def _trim_partial_line(path):
+    # if a previous run was killed mid-write, drop its incomplete last line
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if len(data) > 0 and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def generate(out_path, n_samples=None, workers=1, batch_size=256):
+    """
+    Calculates the equity of every pre-flop matchup and appends it to a text file (in the same format as
+    const.EQUITY_DB). Matchups already in the file are skipped, so an interrupted run can be resumed.
+    :param n_samples: number of random runouts per matchup, or None to enumerate every runout.
+    """
+    done = set()
+    if os.path.exists(out_path):
+        _trim_partial_line(out_path)
+        done = set(read_text_db(out_path))
+    todo = [m for m in iter_matchups() if (m[0], m[1]) not in done]
+    n_total = len(done) + len(todo)
+    print(f"INFO: {len(done)} of {n_total} matchups already in {out_path}, {len(todo)} to go "
+          f"({'exact' if n_samples is None else f'{n_samples} samples each'}, {workers} worker(s))")
+
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    start_time = time.time()
+    n_done = 0
+
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is not None:
+            results = executor.map(_calc_matchup_equities, batches, itertools.repeat(n_samples))
+        else:
+            results = map(_calc_matchup_equities, batches, itertools.repeat(n_samples))
+        with open(out_path, 'a') as f:
+            for batch_res in results:
+                f.write("".join(f"{key1} {key2} {eq:.6f}\n" for key1, key2, eq in batch_res))
+                f.flush()
+                n_done += len(batch_res)
+                elapsed = time.time() - start_time
+                rate = n_done / elapsed if elapsed > 0 else 0
+                eta = (len(todo) - n_done) / rate if rate > 0 else 0
+                print(f"{(len(done) + n_done) / n_total * 100:.2f}% DONE ({len(done) + n_done}/{n_total}), "
+                      f"{rate:.1f} matchups/sec, ETA {datetime.timedelta(seconds=int(eta))}")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _print_rankings():
+    for cc in sorted(CARD_CODES, key=get_avg_equity_vs_all, reverse=True):
+        print(f"{cc:<3} vs All: {get_avg_equity_vs_all(cc) * 100:.2f}%")
+
+
 if __name__ == "__main__":
-    all_codes = list(cardutils.all_card_codes())
-    avg_equities = {}
-    for cc in all_codes:
-        total_eq1, total_eq2 = 0, 0
-        total_n = 0
-        for cc2 in all_codes:
-            eq, n = get_avg_equity_by_cardcode(cc, cc2)
-            total_eq1 += eq * n
-            total_eq2 += (1 - eq) * n
-            total_n += n
-        avg_equities[cc] = total_eq1 / total_n
-
-    for cc in sorted(all_codes, key=lambda _cc: avg_equities[_cc], reverse=True):
-        print(f"{cc:<3} vs All: {avg_equities[cc] * 100:.2f}%")
+    parser = argparse.ArgumentParser(description="Tools for the pre-flop equity DB. With no command, prints "
+                                                 "every starting hand's average equity vs. all others.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    gen_parser = subparsers.add_parser("generate", help="calculate the equity of every pre-flop matchup (resumable)")
+    mode = gen_parser.add_mutually_exclusive_group()
+    mode.add_argument("--exact", action="store_true", help="enumerate every runout")
+    mode.add_argument("--samples", type=int, default=const.EQUITY_CALC_N_ITERS,
+                      help=f"random runouts per matchup (default: {const.EQUITY_CALC_N_ITERS})")
+    gen_parser.add_argument("--workers", type=int, default=1, help="number of processes to use (default: 1)")
+    gen_parser.add_argument("--batch-size", type=int, default=256, help="matchups per write (default: 256)")
+    gen_parser.add_argument("--out", help="text file to write to (default: assets/preflop_equities_<exact|nN>.txt)")
+
+    conv_parser = subparsers.add_parser("convert", help="convert a text DB to the binary format")
+    conv_parser.add_argument("--text", default=const.EQUITY_DB, help=f"(default: {const.EQUITY_DB})")
+    conv_parser.add_argument("--out", default=const.EQUITY_DB_BIN, help=f"(default: {const.EQUITY_DB_BIN})")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        out = args.out or os.path.join("assets", f"preflop_equities_{'exact' if args.exact else f'n{args.samples}'}.txt")
+        generate(out, n_samples=None if args.exact else args.samples, workers=args.workers, batch_size=args.batch_size)
+    elif args.command == "convert":
+        convert_text_to_binary(args.text, args.out)
+    else:
+        _print_rankings()
 
 
 if __name__ == "__main__" and False:
@@ -155,45 +401,3 @@ if __name__ == "__main__" and False:
                     uniques[key].append((h1, h2))
     for key in uniques:
         print(f"{key}: ({len(uniques[key])}) {uniques[key]}")
-
-
-if __name__ == "__main__" and False:
-    load_from_disk()
-    all_cards = list(cardutils.all_cards())
-    n_iters = 270725
-    n = 0
-    last_pcnt = 0
-
-    for i0 in range(len(all_cards)):
-        for i1 in range(i0 + 1, len(all_cards)):
-            for i2 in range(i1 + 1, len(all_cards)):
-                for i3 in range(i2 + 1, len(all_cards)):
-                    c1 = all_cards[i0]
-                    c2 = all_cards[i1]
-                    c3 = all_cards[i2]
-                    c4 = all_cards[i3]
-                    n += 1
-
-                    combos = [((c1, c2), (c3, c4)),
-                              ((c1, c3), (c2, c4)),
-                              ((c1, c4), (c2, c3))]
-
-                    for (h1, h2) in combos:
-                        h1, h2, key1, key2 = _normalize(h1, h2)
-                        if key1 in _DB and key2 in _DB[key1]:
-                            continue
-
-                        if key1 not in _DB:
-                            _DB[key1] = {}
-                        if key2 not in _DB[key1]:
-                            _DB[key1][key2] = None
-
-                        h1_eq, h2_eq = cardutils.calc_equities([h1, h2], [], limit=const.EQUITY_CALC_N_ITERS)
-                        _DB[key1][key2] = h1_eq
-                        add_line_to_disk(key1, key2, h1_eq)
-
-                        pcnt = n / n_iters * 100
-                        if int(last_pcnt * 100) < int(pcnt * 100):
-                            last_pcnt = pcnt
-                            pcnt_done = f"{pcnt:.2f}% DONE"
-                            print(f"{pcnt_done} {key1} vs {key2}: {h1_eq * 100.:.5f}%")
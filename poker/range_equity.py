@@ -0,0 +1,184 @@
+import typing
+
+import numpy
+
+import poker.cardutils as cardutils
+import poker.evaluator as evaluator
+import poker.ranges as ranges
+import poker.vectorized as vectorized
+
+# Heads-up equity of a hand or range against a range (like "22+, A2s+, KTo+").
+#
+# Every pair of combos (one from each side) that doesn't share a card with the other or with the board is
+# counted once, so card removal is weighted exactly. Pre-flop, equities come from the pre-flop DB (straight
+# from its card code matrix when both sides are whole ranges). Post-flop, each combo is evaluated once per
+# run-out, and the results are compared for every pair of combos at once with NumPy.
+#
+# Results are usually reported as a 169x169 matrix over (hero's card code, villain's card code), indexed
+# like ranges.CARD_CODES, along with how many combo pairs each entry is averaged over.
+
+N_CARD_CODES = len(ranges.CARD_CODES)
+_MAX_RUNOUTS_PER_SUM = (1 << 15) - 1  # run-out results are summed in int16s
+
+
+def to_combos(hands, board=()) -> typing.List[typing.Tuple[int, int]]:
+    """
+    :param hands: a Range, a range pattern like "22+, A2s+, KTo+", hole cards like ('Ah', 'Kd'), or a list of hole cards.
+    :param board: cards that can't be in the combos.
+    :return: the integer hole cards of every combo of the hands that doesn't use a board card.
+    """
+    if isinstance(hands, str):
+        hands = ranges.Range.parse(hands)
+    if isinstance(hands, ranges.Range):
+        hands = [h for cc in hands.card_codes() for h in cardutils.all_combos_of_card_code(cc)]
+    elif len(hands) > 0 and isinstance(hands[0], str):
+        hands = [hands]
+    used = set(evaluator.to_ints(board))
+    res = []
+    for h in hands:
+        combo = tuple(evaluator.to_ints(h))
+        if not used.intersection(combo):
+            res.append(combo)
+    return res
+
+
+def calc_range_equity(hero, villain, board=(), limit=float('inf'), rng: numpy.random.Generator = None) -> float:
+    """
+    :param hero: hole cards like ('Ah', 'Kd'), or a range (see to_combos).
+    :param villain: a range, or hole cards.
+    :param board: list of cards on board ['4h', '4d', 'Jd'].
+    :param limit: how many run-outs to simulate post-flop (or inf, to simulate them all).
+    :return: hero's equity against villain, averaged over every possible pair of their combos (or NaN, if
+             there are no such pairs).
+    """
+    equities, weights = calc_equity_matrix(hero, villain, board=board, limit=limit, rng=rng)
+    total = weights.sum()
+    return float(numpy.where(weights > 0, equities * weights, 0).sum() / total) if total > 0 else float('nan')
+
+
+def calc_equity_matrix(hero, villain, board=(), limit=float('inf'), rng: numpy.random.Generator = None) \
+        -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Same as calc_range_equity, but broken down by card code.
+    :return: (equities, weights), two 169x169 arrays indexed by [hero card code idx, villain card code idx]
+             (see ranges.CARD_CODE_IDX). equities holds hero's average equity in that matchup (NaN where there
+             are no combos), and weights holds the number of combo pairs it's averaged over.
+    """
+    if len(board) == 0 and _is_range(hero) and _is_range(villain):
+        return _card_code_matrix(_to_range(hero), _to_range(villain))
+
+    hero_combos = to_combos(hero, board=board)
+    villain_combos = to_combos(villain, board=board)
+    if len(board) == 0:
+        wins, counts = _preflop_sums(hero_combos, villain_combos)
+    else:
+        wins, counts = _postflop_sums(hero_combos, villain_combos, evaluator.to_ints(board), limit, rng)
+
+    # pairs don't all have the same number of valid run-outs when they're sampled, so each one counts
+    # in proportion to how many it got
+    hero_ccs = numpy.array([_card_code_idx(h) for h in hero_combos], dtype=numpy.int64)
+    villain_ccs = numpy.array([_card_code_idx(h) for h in villain_combos], dtype=numpy.int64)
+    cells = (hero_ccs[:, None] * N_CARD_CODES + villain_ccs[None, :]).ravel()
+    paired = (counts > 0).ravel()
+    weights = numpy.bincount(cells, weights=paired, minlength=N_CARD_CODES ** 2)
+    totals = numpy.bincount(cells, weights=wins.ravel(), minlength=N_CARD_CODES ** 2)
+    n_runouts = numpy.bincount(cells, weights=counts.ravel(), minlength=N_CARD_CODES ** 2)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        equities = totals / n_runouts
+    return equities.reshape(N_CARD_CODES, N_CARD_CODES), weights.reshape(N_CARD_CODES, N_CARD_CODES)
+
+
+def _is_range(hands) -> bool:
+    return isinstance(hands, (str, ranges.Range))
+
+
+def _to_range(hands) -> ranges.Range:
+    return ranges.Range.parse(hands) if isinstance(hands, str) else hands
+
+
+def _card_code_idx(combo) -> int:
+    return ranges.CARD_CODE_IDX[cardutils.to_card_code([evaluator.to_str(c) for c in combo])]
+
+
+def _card_code_matrix(hero: ranges.Range, villain: ranges.Range) -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+    import poker.preflop_db as preflop_db
+
+    all_equities, all_counts = preflop_db.get_card_code_matrix()
+    all_equities = numpy.frombuffer(all_equities, dtype=numpy.float64).reshape(N_CARD_CODES, N_CARD_CODES)
+    all_counts = numpy.frombuffer(all_counts, dtype=numpy.int32).reshape(N_CARD_CODES, N_CARD_CODES)
+    in_range = numpy.outer(_range_mask(hero), _range_mask(villain)) & (all_counts > 0)
+    return numpy.where(in_range, all_equities, numpy.nan), numpy.where(in_range, all_counts, 0).astype(numpy.float64)
+
+
+def _range_mask(r: ranges.Range) -> numpy.ndarray:
+    return numpy.array([(r.mask >> i) & 1 == 1 for i in range(N_CARD_CODES)], dtype=bool)
+
+
+def _combo_bits(combos) -> numpy.ndarray:
+    combos = numpy.asarray(combos, dtype=numpy.int64).reshape(-1, 2)
+    return (numpy.int64(1) << combos[:, 0]) | (numpy.int64(1) << combos[:, 1])
+
+
+def _preflop_sums(hero_combos, villain_combos) -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+    """returns: (hero's equity, 1) for every pair of combos that don't overlap, and (0, 0) for the rest."""
+    import poker.preflop_db as preflop_db
+
+    wins = numpy.zeros((len(hero_combos), len(villain_combos)))
+    counts = numpy.zeros((len(hero_combos), len(villain_combos)))
+    hero_strs = [tuple(evaluator.to_str(c) for c in h) for h in hero_combos]
+    villain_strs = [tuple(evaluator.to_str(c) for c in h) for h in villain_combos]
+    for i, h1 in enumerate(hero_strs):
+        for j, h2 in enumerate(villain_strs):
+            if cardutils.are_unique(h1 + h2):
+                wins[i, j] = preflop_db.get_equity(h1, h2)
+                counts[i, j] = 1
+    return wins, counts
+
+
+def _postflop_sums(hero_combos, villain_combos, board: typing.Sequence[int], limit, rng) \
+        -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+    """returns: (hero's wins, number of run-outs) for every pair of combos, with ties counting as half a win.
+                Pairs that overlap get (0, 0), and run-outs that overlap either combo are skipped."""
+    deck = [c for c in range(evaluator.N_CARDS) if c not in board]
+    boards = vectorized.generate_runouts(board, deck, limit=limit, rng=rng)
+
+    hero_strengths, hero_ok = _strengths(hero_combos, boards)
+    villain_strengths, villain_ok = _strengths(villain_combos, boards)
+
+    # replace strengths with their rank among all the strengths (so they fit in an int16), and make every
+    # comparison with an impossible combo a loss for hero. then, summing the sign of (hero - villain) over
+    # all the run-outs gives 2 * wins + ties - (number of run-outs), without having to mask anything.
+    levels = numpy.unique(numpy.concatenate([hero_strengths[hero_ok], villain_strengths[villain_ok]]))
+    hero_levels = numpy.where(hero_ok, numpy.searchsorted(levels, hero_strengths), -1).astype(numpy.int16)
+    villain_levels = numpy.where(villain_ok, numpy.searchsorted(levels, villain_strengths), len(levels)).astype(numpy.int16)
+
+    shape = (len(hero_combos), len(villain_combos))
+    total = numpy.full(shape, len(boards), dtype=numpy.int64)
+    signs = numpy.zeros(shape, dtype=numpy.int16)
+    diff = numpy.empty(shape, dtype=numpy.int16)
+    for i in range(len(boards)):
+        numpy.subtract(hero_levels[i, :, None], villain_levels[i, None, :], out=diff)
+        numpy.sign(diff, out=diff)
+        signs += diff
+        if i % _MAX_RUNOUTS_PER_SUM == _MAX_RUNOUTS_PER_SUM - 1:  # before it can overflow
+            total += signs
+            signs[:] = 0
+    total += signs
+    counts = hero_ok.T.astype(numpy.float64) @ villain_ok.astype(numpy.float64)
+
+    disjoint = (_combo_bits(hero_combos)[:, None] & _combo_bits(villain_combos)[None, :]) == 0
+    return numpy.where(disjoint, total / 2, 0), numpy.where(disjoint, counts, 0)
+
+
+def _strengths(combos, boards: numpy.ndarray) -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+    """returns: (n_runouts, n_combos) arrays of each combo's strength on each run-out, and whether the combo
+                is possible on that run-out (its strength is 0 when it isn't)."""
+    board_bits = numpy.bitwise_or.reduce(numpy.int64(1) << boards, axis=1) if boards.shape[1] > 0 \
+        else numpy.zeros(len(boards), dtype=numpy.int64)
+    ok = (board_bits[:, None] & _combo_bits(combos)[None, :]) == 0
+    strengths = numpy.zeros(ok.shape, dtype=numpy.int32)
+    runout_idx, combo_idx = numpy.nonzero(ok)
+    if len(runout_idx) > 0:
+        cards = numpy.concatenate([numpy.asarray(combos, dtype=numpy.int64)[combo_idx], boards[runout_idx]], axis=1)
+        strengths[runout_idx, combo_idx] = vectorized.evaluate_chunked(cards)
+    return strengths, ok
@@ -0,0 +1,167 @@
+import re
+import typing
+
+import poker.cardutils as cardutils
+
+# A Range is a set of starting hands (card codes like 'AKs', '77', 'T9o'), stored as a 169-bit mask.
+# Bit i is set if CARD_CODES[i] is in the range.
+
+CARD_CODES = list(cardutils.all_card_codes())
+CARD_CODE_IDX = {cc: i for i, cc in enumerate(CARD_CODES)}
+_ALL_MASK = (1 << len(CARD_CODES)) - 1
+
+_COMPILED = {}  # pattern_code -> Range
+
+
+class Range:
+
+    def __init__(self, mask=0):
+        self.mask = mask & _ALL_MASK
+
+    @staticmethod
+    def parse(pattern_code: str) -> 'Range':
+        """
+        Compiles a pattern like "JJ+, AQ+", "T9-76s" or "66-33%" into a Range. Compiled ranges are cached.
+        See cardutils.cards_match_pattern for the pattern syntax.
+        """
+        if pattern_code not in _COMPILED:
+            res = Range()
+            for pattern in re.split(r'[ ,]+', pattern_code.strip()):
+                if len(pattern) > 0:
+                    res = res | Range.from_card_codes(_expand_pattern(pattern))
+            _COMPILED[pattern_code] = res
+        return _COMPILED[pattern_code]
+
+    @staticmethod
+    def from_card_codes(codes: typing.Iterable[str]) -> 'Range':
+        mask = 0
+        for cc in codes:
+            mask |= 1 << CARD_CODE_IDX[cc]
+        return Range(mask)
+
+    @staticmethod
+    def everything() -> 'Range':
+        return Range(_ALL_MASK)
+
+    def contains_code(self, cc: str) -> bool:
+        idx = CARD_CODE_IDX.get(cc)
+        return idx is not None and (self.mask >> idx) & 1 == 1
+
+    def contains_cards(self, cards) -> bool:
+        """cards: hole cards like ('Ah', 'Kh'). Hands with unknown cards are never in a range."""
+        return self.contains_code(cardutils.to_card_code(cards))
+
+    def __contains__(self, item):
+        return self.contains_code(item) if isinstance(item, str) else self.contains_cards(item)
+
+    def card_codes(self) -> typing.List[str]:
+        return [cc for i, cc in enumerate(CARD_CODES) if (self.mask >> i) & 1]
+
+    def n_combos(self) -> int:
+        return sum(cardutils.number_of_combos(cc) for cc in self.card_codes())
+
+    def __or__(self, other: 'Range') -> 'Range':
+        return Range(self.mask | other.mask)
+
+    def __and__(self, other: 'Range') -> 'Range':
+        return Range(self.mask & other.mask)
+
+    def __sub__(self, other: 'Range') -> 'Range':
+        return Range(self.mask & ~other.mask)
+
+    def __invert__(self) -> 'Range':
+        return Range(~self.mask)
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+    def __eq__(self, other):
+        return isinstance(other, Range) and self.mask == other.mask
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(self.card_codes())})"
+
+
+def _expand_pattern(pattern) -> typing.List[str]:
+    """returns: the card codes matched by a single pattern (e.g. "A5+", "66-TT", "AK")."""
+    RANKS = cardutils.RANKS
+
+    def _with_suitedness(ranks, suit):
+        if ranks[0] == ranks[1]:
+            return [ranks]
+        elif suit != "":
+            return [ranks + suit]
+        else:
+            return [ranks + "s", ranks + "o"]
+
+    if "%" in pattern:
+        # "33%" (means best 33% of pre-flop hands)
+        # "60-20%" (means best 60-20% of pre-flop hands)
+        pattern = pattern.replace('%', '')
+        if "-" in pattern:
+            min_pcnt = 1 - float(pattern.split("-")[0]) / 100.
+            max_pcnt = 1 - float(pattern.split("-")[1]) / 100.
+        else:
+            min_pcnt = 1 - float(pattern) / 100.
+            max_pcnt = 1.0
+        return cardutils.get_best_preflop_card_codes(min_pcnt, max_pcnt=max_pcnt)
+
+    elif "+" not in pattern and "-" not in pattern:
+        if pattern in CARD_CODE_IDX:
+            return [pattern]  # exact match
+        elif len(pattern) == 2 and pattern[0] in RANKS and pattern[1] in RANKS:
+            return _with_suitedness(pattern, "")  # AK should match AKo and AKs
+        else:
+            raise ValueError(f"Invalid pattern: {pattern}")
+
+    elif "+" in pattern:
+        pattern = pattern.replace("+", "")
+        idx1 = RANKS.index(pattern[0])
+        idx2 = RANKS.index(pattern[1])
+        if idx1 == idx2:
+            # a 66+ type pattern (66, 77, ... AA)
+            return [f"{r}{r}" for r in RANKS[0:idx1 + 1]]
+        else:
+            # an A5+ style pattern (meaning A5, A6, ... AK)
+            suit = pattern[2] if len(pattern) > 2 else ""
+            res = []
+            for i in range(idx1 + 1, idx2 + 1):
+                res.extend(_with_suitedness(f"{pattern[0]}{RANKS[i]}", suit))
+            return res
+
+    else:
+        p1, p2 = pattern.split("-")
+        if (p1.endswith("s") and p2.endswith("o")) or (p1.endswith("o") and p2.endswith("s")):
+            raise ValueError(f"Non-uniform suitedness codes in range-based pattern: {pattern}")
+        suit = "o" if (p1.endswith("o") or p2.endswith("o")) else ("s" if (p1.endswith("s") or p2.endswith("s")) else "")
+        res = []
+        if p1[0] == p1[1]:
+            if p2[0] != p2[1]:
+                raise ValueError(f"Invalid range-based pattern: {pattern}")
+            # 66-TT type pattern (pairs)
+            idx1 = RANKS.index(p1[0])
+            idx2 = RANKS.index(p2[0])
+            for i in range(min(idx1, idx2), max(idx1, idx2) + 1):
+                res.append(f"{RANKS[i]}{RANKS[i]}")
+        elif p1[0] == p2[0]:
+            # A5-A9 type range (kickers)
+            idx1 = RANKS.index(p1[1])
+            idx2 = RANKS.index(p2[1])
+            for i in range(min(idx1, idx2), max(idx1, idx2) + 1):
+                res.extend(_with_suitedness(f"{p1[0]}{RANKS[i]}", suit))
+        else:
+            # JTs-87s type range (gappers)
+            p1_idx1 = RANKS.index(p1[0])
+            p1_idx2 = RANKS.index(p1[1])
+            p2_idx1 = RANKS.index(p2[0])
+            p2_idx2 = RANKS.index(p2[1])
+            if p1_idx1 - p1_idx2 != p2_idx1 - p2_idx2:
+                raise ValueError(f"Invalid range-based pattern: {pattern}")
+            gap = p1_idx1 - p1_idx2
+
+            for i in range(min(p1_idx1, p2_idx1), max(p1_idx1, p2_idx1) + 1):
+                res.extend(_with_suitedness(f"{RANKS[i]}{RANKS[i - gap]}", suit))
+        return res
@@ -1,23 +1,127 @@
 import datetime
 
 import const
-from poker import hands, actions
+from poker import hands, actions, hand_cache, equity_cache, cardutils
 
 import typing
 import os
 import csv
+import concurrent.futures
+import heapq
+import itertools
 import re
 import locale
 
 
-def scrape_directory(hero_id, log_downloader_id, dirpath, desc="All Hands", aliases=()) -> hands.HandGroup:
+# Pre-compiled patterns for the log's lines.
+_RE_INTRO = re.compile(r'-- starting hand #(\d+).*')
+_RE_ENDING = re.compile(r'-- ending hand #(\d+).*')
+_RE_PLAYER_STACKS = re.compile(r'Player stacks: (.*)')
+_RE_YOUR_HAND_LINE = re.compile(r'Your hand is.*')
+_RE_PLAYER_STACK = re.compile(r'"(.*)" \((.*)\)')
+_RE_YOUR_HAND = re.compile(r'Your hand is (.+), (.+)')
+_RE_COLLECTED = re.compile(r'"(.*)" collected ([\d\.]+) from pot.*')
+_RE_FLOP = re.compile(r'Flop:[ ]+\[(.*)\]')
+_RE_TURN = re.compile(r'Turn:[ ]+.* \[(.*)\]')
+_RE_RIVER = re.compile(r'River:[ ]+.* \[(.*)\]')
+_RE_FLOP_LINE = re.compile(r'Flop:[ ]+.*')
+_RE_TURN_LINE = re.compile(r'Turn:[ ]+.*')
+_RE_RIVER_LINE = re.compile(r'River:[ ]+.*')
+_RE_RIVER2_LINE = re.compile(r'River \(second run\):.*')
+_RE_RIVER2 = re.compile(r'River \(second run\):[ ]+([^,]*), ([^,]*), ([^,]*), ([^,]*) \[(.*)\].*')
+_RE_PID_SWITCH = re.compile(r'The player "(.*)" changed the ID from (.*) to (.*) because.*')
+_RE_CONFIG_CHANGES = [
+    ('sb_cost', re.compile(r'The game\'s small blind was changed from (.*) to (.*)\.')),
+    ('bb_cost', re.compile(r'The game\'s big blind was changed from (.*) to (.*)\.')),
+    ('ante_cost', re.compile(r'The game\'s ante was changed from (.*) to (.*)\.'))
+]
+
+# Line kinds that aren't action types.
+_MISSED_BLIND = "missed_blind"
+_UNCALLED = "uncalled"
+_COLLECTED = "collected"
+_SHOWS = "shows"
+_NEXT_STREET = "next_street"
+
+# Rules for classifying a hand's action lines: (kind, text the line must contain, pattern). A line gets
+# the kind of the first rule whose text is in the line and whose pattern matches, so the keyword check
+# skips most of the regex searches without changing which rule wins.
+_ACTION_RULES = [
+    (actions.SB, '" posts a small blind of ', re.compile(r'"(.*)" posts a small blind of ([\d\.]+)( and go all in)?')),
+    (actions.BB, '" posts a big blind of ', re.compile(r'"(.*)" posts a big blind of ([\d\.]+)( and go all in)?')),
+    (actions.STRADDLE, '" posts a straddle of ', re.compile(r'"(.*)" posts a straddle of ([\d\.]+)( and go all in)?')),
+    (_MISSED_BLIND, '" posts a miss', re.compile(r'"(.*)" posts a miss(.*) of ([\d\.]+)( and go all in)?')),
+    (actions.CALL, '" calls ', re.compile(r'"(.*)" calls ([\d\.]+)( and go all in)?')),
+    (actions.OPEN, '" bets ', re.compile(r'"(.*)" bets ([\d\.]+)( and go all in)?')),
+    (actions.CHECK, '" checks', re.compile(r'"(.*)" checks')),
+    (actions.FOLD, '" folds', re.compile(r'"(.*)" folds')),
+    (actions.RAISE, '" raises to ', re.compile(r'"(.*)" raises to ([\d\.]+)( and go all in)?')),
+    (_UNCALLED, 'Uncalled bet of ', re.compile(r'Uncalled bet of (.*) returned to "(.*)"')),
+    (_COLLECTED, '" collected ', _RE_COLLECTED),
+    (_SHOWS, '" shows a ', re.compile(r'"(.*)" shows a (.*)\.')),
+]
+_PRE_FLOP_RULES = _ACTION_RULES + [(_NEXT_STREET, 'Flop:', _RE_FLOP_LINE)]
+_POST_FLOP_RULES = {
+    actions.FLOP: _ACTION_RULES[4:] + [(_NEXT_STREET, 'Turn:', _RE_TURN_LINE)],
+    actions.TURN: _ACTION_RULES[4:] + [(_NEXT_STREET, 'River:', _RE_RIVER_LINE)],
+    actions.RIVER: _ACTION_RULES[4:] + [(_NEXT_STREET, '-- ending hand ', re.compile(r'-- ending hand .*'))],
+}
+_BETS = (actions.SB, actions.BB, actions.STRADDLE, actions.CALL, actions.OPEN, actions.RAISE)
+
+
+def _classify_line(text, rules) -> typing.Tuple[typing.Optional[str], typing.Optional[typing.Tuple]]:
+    """returns: (kind, fields) of the first rule that matches the text, or (None, None)."""
+    for kind, keyword, pattern in rules:
+        if keyword in text:
+            result = pattern.search(text)
+            if result is not None:
+                return kind, result.groups()
+    return None, None
+
+
+def scrape_directory(hero_id, log_downloader_id, dirpath, desc="All Hands", aliases=(), workers=1,
+                     cache_dir=const.HAND_CACHE_DIR, equity_cache_db=const.EQUITY_CACHE_DB) -> hands.HandGroup:
+    """
+    :param workers: number of processes to parse the log files with. Each worker also calculates the
+                    all-in equities for the files it parses. Hands are merged in the same order either way.
+    :param cache_dir: directory to cache parsed hands in (see hand_cache), so that only new or changed
+                      logs need to be parsed. None to disable caching.
+    :param equity_cache_db: file to cache all-in equities in (see equity_cache), shared with the workers.
+                            None to only cache them in memory.
+    """
     locale.setlocale(locale.LC_ALL, '')
+    equity_cache.configure(db_path=equity_cache_db)
     all_hands = hands.HandGroup([], desc=desc)
     all_groups = []
     filenames = os.listdir(dirpath)
-    for f in filenames:
-        hl = scrape(hero_id, log_downloader_id, os.path.join(dirpath, f),
-                    alias_lookup=_invert_alias_map(hero_id, aliases))
+    alias_lookup = _invert_alias_map(hero_id, aliases)
+    filepaths = [os.path.join(dirpath, f) for f in filenames]
+
+    cache_params = hand_cache.make_params(hero_id, log_downloader_id, alias_lookup, const.EQUITY_CALC_MAX_ITERS,
+                                          const.EQUITY_CALC_TOLERANCE, cardutils.ADAPTIVE_SAMPLING)
+    hand_lists = [None] * len(filepaths)
+    if cache_dir is not None:
+        hand_lists = [hand_cache.load(cache_dir, fp, cache_params) for fp in filepaths]
+    to_parse = [i for i in range(len(filepaths)) if hand_lists[i] is None]
+
+    if workers is not None and workers > 1 and len(to_parse) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = list(executor.map(_scrape_with_stats, itertools.repeat(hero_id), itertools.repeat(log_downloader_id),
+                                       [filepaths[i] for i in to_parse], itertools.repeat(alias_lookup),
+                                       itertools.repeat(equity_cache_db)))
+    else:
+        parsed = [scrape(hero_id, log_downloader_id, filepaths[i], alias_lookup=alias_lookup, calc_stats=False)
+                  for i in to_parse]
+        # all-in equities for the whole directory are calculated together (a bounded number of spots at a time)
+        hands.calc_advanced_stats_batch([h for hl in parsed for h in hl], limit=const.EQUITY_CALC_MAX_ITERS,
+                                        tolerance=const.EQUITY_CALC_TOLERANCE)
+
+    for i, hl in zip(to_parse, parsed):
+        hand_lists[i] = hl
+        if cache_dir is not None:
+            hand_cache.save(cache_dir, filepaths[i], cache_params, hl)
+
+    for f, hl in zip(filenames, hand_lists):
         group = hands.HandGroup(hl)
         all_groups.append((group, f))
         all_hands.extend(hl)
@@ -59,58 +163,315 @@ def _invert_alias_map(hero_id, aliases):
     return res
 
 
-def scrape(hero_id, log_downloader_id, logfilepath, alias_lookup=()) -> typing.List[hands.Hand]:
+def _scrape_with_stats(hero_id, log_downloader_id, logfilepath, alias_lookup, equity_cache_db=None) -> typing.List[hands.Hand]:
+    # (module-level so it can be sent to worker processes)
+    equity_cache.configure(db_path=equity_cache_db)
+    return scrape(hero_id, log_downloader_id, logfilepath, alias_lookup=alias_lookup, calc_stats=True)
+
+
+def scrape(hero_id, log_downloader_id, logfilepath, alias_lookup=(), calc_stats=True) -> typing.List[hands.Hand]:
     res = []
     with open(logfilepath, mode='r') as csvfile:
         reader = csv.reader(csvfile)
-        lines = [l for l in reader if (len(l) == 3 and l != ["entry", "at", "order"])]
+        lines = [l for l in reader if _is_log_line(l)]
         lines.sort(key=lambda l: int(l[2]))  # sort lines by "order" field
 
-        configs = {
-            "logfile": os.path.basename(logfilepath),
-            "sb_cost": 0.10,
-            "bb_cost": 0.20,
-            "ante_cost": 0.0,
-        }
-
-        cur_hand_lines = []
-        cur_hand_configs = configs.copy()
-        started_first = False
-        for i in range(len(lines)):
-            _update_configs(configs, lines[i])
-            if lines[i][0].startswith("-- starting hand #"):
-                started_first = True
-                cur_hand_configs = configs.copy()
-                cur_hand_lines.clear()
-            cur_hand_lines.append(lines[i])
-            if i >= len(lines) - 1 or (started_first and lines[i + 1][0].startswith("-- starting hand #")):
-                hand = _create_hand_from_lines(
-                        hero_id,
-                        log_downloader_id,
-                        cur_hand_configs,
-                        cur_hand_lines,
-                        alias_lookup=alias_lookup,
-                        must_include_hero=False)
+    for configs, hand_lines in _split_into_hands(lines, _default_configs(logfilepath)):
+        hand = _create_hand_from_lines(hero_id, log_downloader_id, configs, hand_lines, alias_lookup=alias_lookup,
+                                       must_include_hero=False)
+        if hand is not None:
+            res.append(hand)
+    if calc_stats:
+        hands.calc_advanced_stats_batch(res, limit=const.EQUITY_CALC_MAX_ITERS,
+                                        tolerance=const.EQUITY_CALC_TOLERANCE)
+    return res
+
+
+def iter_scrape(hero_id, log_downloader_id, logfilepath, alias_lookup=(), calc_stats=True, sort_window=1024,
+                batch_size=256) -> typing.Generator[hands.Hand, None, None]:
+    """
+    Streaming version of scrape, for logs too big to hold in memory (e.g. many logs merged together).
+    Instead of sorting the whole log by its "order" field, lines are read in whichever direction the log
+    is already in (Poker Now writes them newest-first) and only re-ordered within a window of sort_window
+    lines. If the file is several logs concatenated together, each log (starting at its header line) is
+    sorted separately.
+    :param batch_size: number of hands to calculate advanced stats for at a time.
+    """
+    configs = _default_configs(logfilepath)
+    lines = _sorted_within_window(_iter_log_lines(logfilepath), sort_window)
+    batch = []
+    for hand_configs, hand_lines in _split_into_hands(lines, configs):
+        hand = _create_hand_from_lines(hero_id, log_downloader_id, hand_configs, hand_lines, alias_lookup=alias_lookup,
+                                       must_include_hero=False)
+        if hand is not None:
+            batch.append(hand)
+        if len(batch) >= batch_size:
+            yield from _finish_batch(batch, calc_stats)
+            batch = []
+    yield from _finish_batch(batch, calc_stats)
+
+
+class LogFollower:
+    """
+    Incrementally parses logs that are still being added to (e.g. re-downloaded during a live session).
+    For each log, it remembers the "order" of the last line it processed, so each poll only parses the
+    hands that have finished (i.e. have an "-- ending hand" line) since the previous poll.
+    """
+
+    def __init__(self, hero_id, log_downloader_id, aliases=(), calc_stats=True):
+        self.hero_id = hero_id
+        self.log_downloader_id = log_downloader_id
+        self.alias_lookup = _invert_alias_map(hero_id, aliases)
+        self.calc_stats = calc_stats
+
+        self.last_orders = {}  # logfilepath -> "order" of the last line that's been processed
+        self._configs = {}     # logfilepath -> game configs as of that line
+        self._file_stats = {}  # logfilepath -> (size, mtime) when it was last polled
+
+    def poll(self, logfilepath, skip=False) -> typing.List[hands.Hand]:
+        """
+        :param skip: if True, marks the log's finished hands as processed without parsing them (e.g. if
+                     they've already been scraped some other way).
+        :return: hands that finished since the last poll of the log.
+        """
+        stat = os.stat(logfilepath)
+        if self._file_stats.get(logfilepath) == (stat.st_size, stat.st_mtime_ns):
+            return []
+        self._file_stats[logfilepath] = (stat.st_size, stat.st_mtime_ns)
+
+        last_order = self.last_orders.get(logfilepath)
+        with open(logfilepath, mode='r') as csvfile:
+            lines = [l for l in csv.reader(csvfile) if _is_log_line(l) and (last_order is None or int(l[2]) > last_order)]
+        lines.sort(key=lambda l: int(l[2]))
+        if len(lines) == 0:
+            return []
+
+        configs = dict(self._configs.get(logfilepath) or _default_configs(logfilepath))
+        res = []
+        split = list(_split_into_hands(lines, configs))
+        last_hand_configs, last_hand_lines = split[-1]
+        if not any("-- ending hand #" in l[0] for l in last_hand_lines):
+            # the last hand isn't finished yet, so pick up from the start of it next time
+            split.pop()
+            self.last_orders[logfilepath] = int(last_hand_lines[0][2]) - 1
+            self._configs[logfilepath] = last_hand_configs
+        else:
+            self.last_orders[logfilepath] = int(lines[-1][2])
+            self._configs[logfilepath] = configs
+
+        if not skip:
+            for hand_configs, hand_lines in split:
+                hand = _create_hand_from_lines(self.hero_id, self.log_downloader_id, hand_configs, hand_lines,
+                                               alias_lookup=self.alias_lookup, must_include_hero=False)
                 if hand is not None:
-                    hand.calc_advanced_stats(limit=const.EQUITY_CALC_N_ITERS)
                     res.append(hand)
-    return res
+
+        return _finish_batch(res, self.calc_stats)
+
+    def poll_directory(self, dirpath, skip=False) -> typing.List[hands.Hand]:
+        res = []
+        for f in sorted(os.listdir(dirpath)):
+            res.extend(self.poll(os.path.join(dirpath, f), skip=skip))
+        return res
+
+
+def _finish_batch(batch, calc_stats):
+    if calc_stats:
+        hands.calc_advanced_stats_batch(batch, limit=const.EQUITY_CALC_MAX_ITERS,
+                                        tolerance=const.EQUITY_CALC_TOLERANCE)
+    return batch
+
+
+def _default_configs(logfilepath):
+    return {
+        "logfile": os.path.basename(logfilepath),
+        "sb_cost": 0.10,
+        "bb_cost": 0.20,
+        "ante_cost": 0.0,
+    }
+
+
+def _is_log_line(line) -> bool:
+    return len(line) == 3 and line != ["entry", "at", "order"]
+
+
+def _split_into_hands(lines: typing.Iterable[typing.List[str]], configs) \
+        -> typing.Generator[typing.Tuple[typing.Dict, typing.List[typing.List[str]]], None, None]:
+    """
+    :param lines: log lines, in order.
+    :param configs: the game's configs at the start of the log (updated as lines are read).
+    :return: (configs at the start of the hand, lines of the hand) for each hand.
+    """
+    cur_hand_lines = []
+    cur_hand_configs = configs.copy()
+    started_first = False
+    for line in lines:
+        _update_configs(configs, line)
+        if line[0].startswith("-- starting hand #"):
+            if started_first:
+                yield cur_hand_configs, cur_hand_lines
+            started_first = True
+            cur_hand_configs = configs.copy()
+            cur_hand_lines = []
+        cur_hand_lines.append(line)
+    if len(cur_hand_lines) > 0:
+        yield cur_hand_configs, cur_hand_lines
+
+
+def _iter_log_lines(logfilepath) -> typing.Generator[typing.List[str], None, None]:
+    """returns: the log's lines and header lines, read forwards or backwards (whichever is closer to
+                ascending "order")."""
+    with open(logfilepath, mode='r') as csvfile:
+        first_orders = [int(l[2]) for l in itertools.islice(filter(_is_log_line, csv.reader(csvfile)), 2)]
+
+    if len(first_orders) == 2 and first_orders[1] < first_orders[0]:
+        yield from (l for l in csv.reader(_read_lines_reversed(logfilepath)) if len(l) == 3)
+    else:
+        with open(logfilepath, mode='r') as csvfile:
+            yield from (l for l in csv.reader(csvfile) if len(l) == 3)
+
+
+def _read_lines_reversed(filepath, chunk_size=1 << 20) -> typing.Generator[str, None, None]:
+    """returns: the file's lines, last to first. Assumes no fields span multiple lines (true of Poker Now logs)."""
+    encoding = locale.getpreferredencoding(False)  # same as open(mode='r')
+    with open(filepath, mode='rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        partial = b""
+        while pos > 0:
+            n = min(chunk_size, pos)
+            pos -= n
+            f.seek(pos)
+            parts = (f.read(n) + partial).split(b"\n")
+            partial = parts[0]  # may continue in the previous chunk
+            for part in reversed(parts[1:]):
+                yield part.rstrip(b"\r").decode(encoding)
+        yield partial.rstrip(b"\r").decode(encoding)
+
+
+def _sorted_within_window(lines: typing.Iterable[typing.List[str]], window) \
+        -> typing.Generator[typing.List[str], None, None]:
+    """returns: the lines sorted by their "order" field, as long as no line is more than window lines out of
+                place. Header lines, and lines that are further out of place than that, start a new sorted run
+                (header lines themselves are dropped)."""
+    heap = []
+    last_order = None
+    for seq, line in enumerate(lines):
+        is_header = not _is_log_line(line)
+        order = None if is_header else int(line[2])
+        if is_header or (last_order is not None and order < last_order):
+            while len(heap) > 0:
+                yield heapq.heappop(heap)[2]
+            last_order = None
+            if is_header:
+                continue
+        heapq.heappush(heap, (order, seq, line))
+        if len(heap) > window:
+            last_order, _, popped = heapq.heappop(heap)
+            yield popped
+    while len(heap) > 0:
+        yield heapq.heappop(heap)[2]
 
 
 def _update_configs(configs, line):
-    if old_new := _find_text(line[0], r'The game\'s small blind was changed from (.*) to (.*)\.', allow_fail=True):
-        configs['sb_cost'] = float(old_new[1])
-    elif old_new := _find_text(line[0], r'The game\'s big blind was changed from (.*) to (.*)\.', allow_fail=True):
-        configs['bb_cost'] = float(old_new[1])
-    elif old_new := _find_text(line[0], r'The game\'s ante was changed from (.*) to (.*)\.', allow_fail=True):
-        configs['ante_cost'] = float(old_new[1])
+    if "The game's " not in line[0]:
+        return
+    for key, pattern in _RE_CONFIG_CHANGES:
+        if old_new := _find_text(line[0], pattern, allow_fail=True):
+            configs[key] = float(old_new[1])
+            break
 
 
 def _create_hand_from_lines(hero_id, log_downloader_id, configs, lines, alias_lookup=(), must_include_hero=True) -> typing.Optional[hands.Hand]:
-    pid_switches = _get_pid_switches(lines)
+    hand = _parse_hand_from_lines(hero_id, log_downloader_id, configs, lines, alias_lookup=alias_lookup,
+                                  must_include_hero=must_include_hero)
+    if hand is not None:
+        hand.freeze()
+    return hand
+
 
-    intro_line = _pop_line_matching(lines, r'-- starting hand #(\d+).*')
-    hand_idx = int(_find_text(intro_line[0], r'-- starting hand #(\d+).*')[0])
+class _HandLines:
+    """
+    A hand's lines, indexed in a single pass and then read front-to-back with a cursor.
+    Lines before the intro line are dropped, and the "-- ending hand" lines are moved to the end (they
+    sometimes get logged before the final hand-shows).
+    """
+
+    # lines that get looked up before the cursor reaches them: (text the line must contain, pattern)
+    _INDEXED = [('Player stacks: ', _RE_PLAYER_STACKS),
+                ('Your hand is', _RE_YOUR_HAND_LINE),
+                ('River (second run):', _RE_RIVER2_LINE)]
+
+    def __init__(self, lines):
+        self.pid_switches = {}
+        self.intro_line = None
+        self.end_line = None
+        self.final_collect_line = None
+
+        body, endings = [], []
+        found = {pattern: ([], []) for _, pattern in _HandLines._INDEXED}  # indices in (body, endings)
+        last_collect = [None, None]  # in (body, endings)
+        for line in lines:
+            text = line[0]
+            if 'changed the ID from' in text:
+                _add_pid_switch(self.pid_switches, _find_text(text, _RE_PID_SWITCH, allow_fail=True))
+            if self.intro_line is None:
+                if _RE_INTRO.search(text) is not None:
+                    self.intro_line = line
+                continue
+
+            is_ending = "-- ending hand #" in text
+            dest = endings if is_ending else body
+            if is_ending and self.end_line is None and _RE_ENDING.search(text) is not None:
+                self.end_line = line
+            if '" collected ' in text and _RE_COLLECTED.search(text) is not None:
+                last_collect[is_ending] = line
+            for keyword, pattern in _HandLines._INDEXED:
+                if keyword in text and pattern.search(text) is not None:
+                    found[pattern][is_ending].append(len(dest))
+            dest.append(line)
+
+        self.final_collect_line = last_collect[1] or last_collect[0]
+        self.lines = body + endings
+        self.pos = 0
+        self._indices = {pattern: in_body + [len(body) + i for i in in_endings]
+                         for pattern, (in_body, in_endings) in found.items()}
+
+    def __len__(self):
+        """returns: number of lines left"""
+        return len(self.lines) - self.pos
+
+    def peek(self):
+        return self.lines[self.pos]
+
+    def advance(self):
+        self.pos += 1
+
+    def pop_matching(self, pattern, allow_fail=False):
+        """returns: the next line matching the pattern, skipping past it (and any lines before it)."""
+        indices = self._indices.get(pattern)
+        if indices is not None:
+            idx = next((i for i in indices if i >= self.pos), None)
+        else:
+            idx = next((i for i in range(self.pos, len(self.lines))
+                        if _find_text(self.lines[i][0], pattern, allow_fail=True) is not None), None)
+        if idx is not None:
+            self.pos = idx + 1
+            return self.lines[idx]
+        elif allow_fail:
+            return None
+        else:
+            msg_lines = '\n  '.join(list(str(s) for s in self.lines[self.pos:]))
+            raise ValueError(f"Failed to find line matching pattern: {pattern.pattern}\n  {msg_lines}")
+
+
+def _parse_hand_from_lines(hero_id, log_downloader_id, configs, lines, alias_lookup=(), must_include_hero=True) -> typing.Optional[hands.Hand]:
+    lines = _HandLines(lines)
+    pid_switches = lines.pid_switches
+
+    intro_line = lines.intro_line
+    if intro_line is None:
+        raise ValueError(f"Failed to find line matching pattern: {_RE_INTRO.pattern}")
+    hand_idx = int(_find_text(intro_line[0], _RE_INTRO)[0])
     timestamp = parse_utc_timestamp(intro_line[1])
 
     _alias_mappings = {}
@@ -128,23 +489,22 @@ def _create_hand_from_lines(hero_id, log_downloader_id, configs, lines, alias_lo
             _alias_mappings[pid] = alias
         return _alias_mappings[pid]
 
-    end_line = _find_line_matching(lines, r'-- ending hand #(\d+).*')
+    end_line = lines.end_line
     if end_line is None:
         # Incomplete hand, probably due to log-truncation (after 20k lines)
         # or the game ending while paused. Not much we can do.
         return None
     end_timestamp = parse_utc_timestamp(end_line[1])
 
-    # this sometimes gets logged before final hand-shows, just move it to the end for simplicity
-    lines.sort(key=lambda l: 1 if "-- ending hand #" in l[0] else 0)
+    if lines.final_collect_line is None:
+        raise ValueError(f"Failed to find line matching pattern: {_RE_COLLECTED.pattern}")
+    final_collect_line_order = int(lines.final_collect_line[2])
 
-    final_collect_line_order = int(_find_line_matching(lines, r'"(.*)" collected ([\d\.]+) from pot.*', first=False)[2])
-
-    players_line = _pop_line_matching(lines, r'Player stacks: (.*)')
+    players_line = lines.pop_matching(_RE_PLAYER_STACKS)
     player_list = []
-    raw_players = _find_text(players_line[0], r'Player stacks: (.*)')[0].split(" | ")
+    raw_players = _find_text(players_line[0], _RE_PLAYER_STACKS)[0].split(" | ")
     for p in raw_players:
-        pname, pstack = _find_text(p, r'"(.*)" \((.*)\)')
+        pname, pstack = _find_text(p, _RE_PLAYER_STACK)
         player_list.append(hands.Player(clean_pname(pname), float(pstack), -1, (None, None)))
 
     hand = hands.Hand(timestamp, end_timestamp, configs, hand_idx, hero_id, player_list)
@@ -156,28 +516,22 @@ def _create_hand_from_lines(hero_id, log_downloader_id, configs, lines, alias_lo
     if log_downloader_id in alias_lookup:
         log_downloader_id = alias_lookup[log_downloader_id]
 
-    your_hand_line = _pop_line_matching(lines, r'Your hand is.*', allow_fail=True)
+    your_hand_line = lines.pop_matching(_RE_YOUR_HAND_LINE, allow_fail=True)
     if hero is not None and hands.Player.names_eq(log_downloader_id, hero_id) and your_hand_line is not None:
-        c1, c2 = _find_text(your_hand_line[0], "Your hand is (.+), (.+)")
+        c1, c2 = _find_text(your_hand_line[0], _RE_YOUR_HAND)
         hero.cards = _convert_card(c1), _convert_card(c2)
 
     # Pre-Flop
     pos = 0
     while len(lines) > 0:
-        line = lines[0]
-        if fields := _find_text(line[0], r'"(.*)" posts a small blind of ([\d\.]+)( and go all in)?', allow_fail=True):
-            name, amt, all_in = clean_pname(fields[0]), float(fields[1]), fields[2] is not None
-            hand.pre_flop_actions.append(actions.Action(name, amt, actions.SB, actions.PRE_FLOP, all_in=all_in))
-            _get_player(player_list, name).street_nets['pre-flop'] = -amt
-        elif fields := _find_text(line[0], r'"(.*)" posts a big blind of ([\d\.]+)( and go all in)?', allow_fail=True):
-            name, amt, all_in = clean_pname(fields[0]), float(fields[1]), fields[2] is not None
-            hand.pre_flop_actions.append(actions.Action(name, amt, actions.BB, actions.PRE_FLOP, all_in=all_in))
-            _get_player(player_list, name).street_nets['pre-flop'] = -amt
-        elif fields := _find_text(line[0], r'"(.*)" posts a straddle of ([\d\.]+)( and go all in)?', allow_fail=True):
+        line = lines.peek()
+        kind, fields = _classify_line(line[0], _PRE_FLOP_RULES)
+        name = None
+        if kind in _BETS:
             name, amt, all_in = clean_pname(fields[0]), float(fields[1]), fields[2] is not None
-            hand.pre_flop_actions.append(actions.Action(name, amt, actions.STRADDLE, actions.PRE_FLOP, all_in=all_in))
+            hand.pre_flop_actions.append(actions.Action(name, amt, kind, actions.PRE_FLOP, all_in=all_in))
             _get_player(player_list, name).street_nets['pre-flop'] = -amt
-        elif fields := _find_text(line[0], r'"(.*)" posts a miss(.*) of ([\d\.]+)( and go all in)?', allow_fail=True):
+        elif kind == _MISSED_BLIND:
             # if you sit out during your blind(s) and then rejoin, it compels you to post a missing SB/BB.
             # note: a missing small blind is treated like an ante, whereas a missing bb is treated like a bet.
             name, bet_type, amt, all_in = clean_pname(fields[0]), fields[1], float(fields[2]), fields[3] is not None
@@ -187,71 +541,56 @@ def _create_hand_from_lines(hero_id, log_downloader_id, configs, lines, alias_lo
                 _get_player(player_list, name).street_nets['pre-flop'] = -amt
             else:
                 raise ValueError(f"Unrecognized missing bet type: {bet_type} (value={amt})")
-        elif fields := _find_text(line[0], r'"(.*)" calls ([\d\.]+)( and go all in)?', allow_fail=True):
-            name, amt, all_in = clean_pname(fields[0]), float(fields[1]), fields[2] is not None
-            hand.pre_flop_actions.append(actions.Action(name, amt, actions.CALL, actions.PRE_FLOP, all_in=all_in))
-            _get_player(player_list, name).street_nets['pre-flop'] = -amt
-        elif fields := _find_text(line[0], r'"(.*)" bets ([\d\.]+)( and go all in)?', allow_fail=True):
-            name, amt, all_in = clean_pname(fields[0]), float(fields[1]), fields[2] is not None
-            hand.pre_flop_actions.append(actions.Action(name, amt, actions.OPEN, actions.PRE_FLOP, all_in=all_in))
-            _get_player(player_list, name).street_nets['pre-flop'] = -amt
-        elif name := _find_text(line[0], r'"(.*)" checks', allow_fail=True):
-            name = clean_pname(name[0])
-            hand.pre_flop_actions.append(actions.Action(name, 0, actions.CHECK, actions.PRE_FLOP))
-        elif name := _find_text(line[0], r'"(.*)" folds', allow_fail=True):
-            name = clean_pname(name[0])
-            hand.pre_flop_actions.append(actions.Action(name, 0, actions.FOLD, actions.PRE_FLOP))
-        elif fields := _find_text(line[0], r'"(.*)" raises to ([\d\.]+)( and go all in)?', allow_fail=True):
-            name, amt, all_in = clean_pname(fields[0]), float(fields[1]), fields[2] is not None
-            hand.pre_flop_actions.append(actions.Action(name, amt, actions.RAISE, actions.PRE_FLOP, all_in=all_in))
-            _get_player(player_list, name).street_nets['pre-flop'] = -amt
-        elif name_amt := _find_text(line[0], r'Uncalled bet of (.*) returned to "(.*)"', allow_fail=True):
-            amt, name = float(name_amt[0]), clean_pname(name_amt[1])
+        elif kind in (actions.CHECK, actions.FOLD):
+            name = clean_pname(fields[0])
+            hand.pre_flop_actions.append(actions.Action(name, 0, kind, actions.PRE_FLOP))
+        elif kind == _UNCALLED:
+            amt, name = float(fields[0]), clean_pname(fields[1])
             _get_player(player_list, name).gain += amt
-        elif name_amt := _find_text(line[0], r'"(.*)" collected ([\d\.]+) from pot.*', allow_fail=True):
-            name, amt = clean_pname(name_amt[0]), float(name_amt[1])
+        elif kind == _COLLECTED:
+            name, amt = clean_pname(fields[0]), float(fields[1])
             _get_player(player_list, name).gain += amt
-        elif name_shows := _find_text(line[0], r'"(.*)" shows a (.*)\.', allow_fail=True):
-            name, shows = clean_pname(name_shows[0]), name_shows[1]
+        elif kind == _SHOWS:
+            name, shows = clean_pname(fields[0]), fields[1]
             _handle_player_shows_a_card(player_list, name, shows, voluntary=int(line[2]) > final_collect_line_order)
-        elif _find_text(line[0], r'Flop:[ ]+.*', allow_fail=True) is not None:
+        elif kind == _NEXT_STREET:
             break
 
         p = _get_player(player_list, name)
         if p is not None and p.position == -1:
             p.position = pos
             pos += 1
-        lines.pop(0)
+        lines.advance()
 
-    flop_line = _pop_line_matching(lines, r'Flop:[ ]+.*', allow_fail=True)
+    flop_line = lines.pop_matching(_RE_FLOP_LINE, allow_fail=True)
     if flop_line is not None:
-        flop_raw = _find_text(flop_line[0], r'Flop:[ ]+\[(.*)\]')[0].split(", ")
+        flop_raw = _find_text(flop_line[0], _RE_FLOP)[0].split(", ")
         hand.board = [_convert_card(c) for c in flop_raw] + [None, None]
     else:
         return hand
 
     hand.flop_actions = _process_post_flop_actions(hand, lines, player_list, actions.FLOP, final_collect_line_order, clean_pname)
 
-    turn_line = _pop_line_matching(lines, r'Turn:[ ]+.*', allow_fail=True)
+    turn_line = lines.pop_matching(_RE_TURN_LINE, allow_fail=True)
     if turn_line is not None:
-        turn_raw = _find_text(turn_line[0], r'Turn:[ ]+.* \[(.*)\]')[0]
+        turn_raw = _find_text(turn_line[0], _RE_TURN)[0]
         hand.board[3] = _convert_card(turn_raw)
     else:
         return hand
 
     hand.turn_actions = _process_post_flop_actions(hand, lines, player_list, actions.TURN, final_collect_line_order, clean_pname)
 
-    river_line = _pop_line_matching(lines, r'River:[ ]+.*', allow_fail=True)
+    river_line = lines.pop_matching(_RE_RIVER_LINE, allow_fail=True)
     if river_line is not None:
-        river_raw = _find_text(river_line[0], r'River:[ ]+.* \[(.*)\]')[0]
+        river_raw = _find_text(river_line[0], _RE_RIVER)[0]
         hand.board[4] = _convert_card(river_raw)
     else:
         return hand
 
     # find 2nd run-out if there was one.
-    river2_line = _pop_line_matching(lines, r'River \(second run\):.*', allow_fail=True)
+    river2_line = lines.pop_matching(_RE_RIVER2_LINE, allow_fail=True)
     if river2_line is not None:
-        river2_cards = _find_text(river2_line[0], r'River \(second run\):[ ]+([^,]*), ([^,]*), ([^,]*), ([^,]*) \[(.*)\].*')
+        river2_cards = _find_text(river2_line[0], _RE_RIVER2)
         hand.board2 = [_convert_card(c) for c in river2_cards]
 
     hand.river_actions = _process_post_flop_actions(hand, lines, player_list, actions.RIVER, final_collect_line_order, clean_pname)
@@ -260,43 +599,30 @@ def _create_hand_from_lines(hero_id, log_downloader_id, configs, lines, alias_lo
 
 def _process_post_flop_actions(hand, lines, player_list, street, final_collect_line_order, clean_pname):
     acts = []
+    rules = _POST_FLOP_RULES[street]
 
     while len(lines) > 0:
-        line = lines[0]
-        if fields := _find_text(line[0], r'"(.*)" calls ([\d\.]+)( and go all in)?', allow_fail=True):
+        line = lines.peek()
+        kind, fields = _classify_line(line[0], rules)
+        if kind in _BETS:
             name, amt, all_in = clean_pname(fields[0]), float(fields[1]), fields[2] is not None
-            acts.append(actions.Action(name, amt, actions.CALL, street, all_in=all_in))
+            acts.append(actions.Action(name, amt, kind, street, all_in=all_in))
             _get_player(hand.players, name).street_nets[street] = -amt
-        elif fields := _find_text(line[0], r'"(.*)" bets ([\d\.]+)( and go all in)?', allow_fail=True):
-            name, amt, all_in = clean_pname(fields[0]), float(fields[1]), fields[2] is not None
-            acts.append(actions.Action(name, amt, actions.OPEN, street, all_in=all_in))
-            _get_player(hand.players, name).street_nets[street] = -amt
-        elif name := _find_text(line[0], r'"(.*)" checks', allow_fail=True):
-            name = clean_pname(name[0])
-            acts.append(actions.Action(name, 0, actions.CHECK, street))
-        elif name := _find_text(line[0], r'"(.*)" folds', allow_fail=True):
-            name = clean_pname(name[0])
-            acts.append(actions.Action(name, 0, actions.FOLD, street))
-        elif fields := _find_text(line[0], r'"(.*)" raises to ([\d\.]+)( and go all in)?', allow_fail=True):
-            name, amt, all_in = clean_pname(fields[0]), float(fields[1]), fields[2] is not None
-            acts.append(actions.Action(name, amt, actions.RAISE, street, all_in=all_in))
-            _get_player(hand.players, name).street_nets[street] = -amt
-        elif name_amt := _find_text(line[0], r'Uncalled bet of (.*) returned to "(.*)"', allow_fail=True):
-            amt, name = float(name_amt[0]), clean_pname(name_amt[1])
+        elif kind in (actions.CHECK, actions.FOLD):
+            name = clean_pname(fields[0])
+            acts.append(actions.Action(name, 0, kind, street))
+        elif kind == _UNCALLED:
+            amt, name = float(fields[0]), clean_pname(fields[1])
             _get_player(hand.players, name).gain += amt
-        elif name_amt := _find_text(line[0], r'"(.*)" collected ([\d\.]+) from pot.*', allow_fail=True):
-            name, amt = clean_pname(name_amt[0]), float(name_amt[1])
+        elif kind == _COLLECTED:
+            name, amt = clean_pname(fields[0]), float(fields[1])
             _get_player(hand.players, name).gain += amt
-        elif name_shows := _find_text(line[0], r'"(.*)" shows a (.*)\.', allow_fail=True):
-            name, shows = clean_pname(name_shows[0]), name_shows[1]
+        elif kind == _SHOWS:
+            name, shows = clean_pname(fields[0]), fields[1]
             _handle_player_shows_a_card(player_list, name, shows, voluntary=int(line[2]) > final_collect_line_order)
-        elif street == actions.FLOP and _find_text(line[0], r'Turn:[ ]+.*', allow_fail=True) is not None:
-            break
-        elif street == actions.TURN and _find_text(line[0], r'River:[ ]+.*', allow_fail=True) is not None:
+        elif kind == _NEXT_STREET:
             break
-        elif street == actions.RIVER and _find_text(line[0], r'-- ending hand .*', allow_fail=True) is not None:
-            break
-        lines.pop(0)
+        lines.advance()
     return acts
 
 
@@ -327,26 +653,22 @@ def _handle_player_shows_a_card(player_list, name, shows, voluntary=False):
             raise ValueError(f"Player's current cards are {old_cards} and showed {cards}?")
 
 
-def _get_pid_switches(lines) -> typing.Dict[str, str]:
+def _add_pid_switch(switches: typing.Dict[str, str], fields):
     # deals with lines like: "The player ""Nick @ pvi7lGaAqX"" changed the ID from -MJHz7DZc1 to pvi7lGaAqX
     # because authenticated login."
-    switches = {}
-    for line in lines:
-        fields = _find_text(line[0], r'The player "(.*)" changed the ID from (.*) to (.*) because.*', allow_fail=True)
-        if fields is not None:
-            pid, old_id, new_id = fields
+    if fields is not None:
+        pid, old_id, new_id = fields
 
-            if old_id in switches.values():
-                # same player switched IDs multiple time in same hand...?
-                ks_to_remap = []
-                for k, v in switches:
-                    if v == old_id:
-                        ks_to_remap.append(k)
-                for k in ks_to_remap:
-                    switches[k] = new_id
+        if old_id in switches.values():
+            # same player switched IDs multiple time in same hand...?
+            ks_to_remap = []
+            for k, v in switches:
+                if v == old_id:
+                    ks_to_remap.append(k)
+            for k in ks_to_remap:
+                switches[k] = new_id
 
-            switches[old_id] = new_id
-    return switches
+        switches[old_id] = new_id
 
 
 def _convert_card(c: str):
@@ -378,37 +700,11 @@ def _assign_player_positions(players, sb_player_name, bb_player_name):
         players[(bb_index + i + 1) % len(players)].position = 2 + i
 
 
-def _pop_line_matching(lines, pattern, line_idx=0, allow_fail=False):
-    discarded = []
-    while len(lines) > 0:
-        cur = lines.pop(0)
-        if line_idx < len(cur) and _find_text(cur[line_idx], pattern, allow_fail=True) is not None:
-            return cur
-        else:
-            discarded.append(cur)
-    if allow_fail:
-        lines.extend(discarded)
-        return None
-    else:
-        msg_lines = '\n  '.join(list(str(s) for s in discarded))
-        raise ValueError(f"Failed to find line matching pattern: {pattern}\n  {msg_lines}")
-
-
-def _find_line_matching(lines, pattern, line_idx=0, first=True):
-    ordered_lines = lines if first else reversed(lines)
-    for cur in ordered_lines:
-        if line_idx < len(cur):
-            res = _find_text(cur[line_idx], pattern, allow_fail=True)
-            if res is not None:
-                return cur
-    return None
-
-
 def _find_text(search_domain, pattern, allow_fail=False):
     """
-    :param pattern: "Plain text {1} with more plain text {2}"
+    :param pattern: "Plain text {1} with more plain text {2}", or a compiled pattern
     """
-    result = re.search(pattern, search_domain)
+    result = pattern.search(search_domain) if isinstance(pattern, re.Pattern) else re.search(pattern, search_domain)
     if result is None:
         if not allow_fail:
             raise ValueError(f"Failed to find pattern '{pattern}' in: '{search_domain}'")
@@ -426,5 +722,30 @@ def parse_utc_timestamp(timestamp: str) -> datetime.datetime:
     return datetime.datetime(int(yyyy), int(mm), int(dd), int(hh), int(minute), int(ss), tzinfo=datetime.timezone.utc).astimezone()
 
 
+def benchmark_parser(hero_id, log_downloader_id, filepaths, repeats=3) -> typing.Tuple[int, float]:
+    """Times the parser (without the all-in equity calculations) over the given logs.
+    returns: (number of log lines, best throughput in lines/sec)"""
+    import time
+    n_lines = 0
+    for fp in filepaths:
+        with open(fp, mode='r') as csvfile:
+            n_lines += sum(1 for l in csv.reader(csvfile) if (len(l) == 3 and l != ["entry", "at", "order"]))
+    best = float('inf')
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        for fp in filepaths:
+            scrape(hero_id, log_downloader_id, fp, calc_stats=False)
+        best = min(best, time.perf_counter() - start_time)
+    return n_lines, n_lines / best if best > 0 else float('inf')
+
+
 if __name__ == "__main__":
-    print(parse_utc_timestamp("2025-01-28T03:22:32.149Z").astimezone().strftime("%Y-%m-%d"))
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmarks the log parser.")
+    parser.add_argument("logs", nargs="*", help=f"log files to parse (default: every log in {const.LOG_DIR})")
+    parser.add_argument("--repeats", type=int, default=3, help="number of timed runs (default: 3)")
+    args = parser.parse_args()
+
+    filepaths = args.logs or [os.path.join(const.LOG_DIR, f) for f in sorted(os.listdir(const.LOG_DIR)) if f.endswith(".csv")]
+    n_lines, lines_per_sec = benchmark_parser(const.HERO_ID, const.LOG_DOWNLOADER_ID, filepaths, repeats=args.repeats)
+    print(f"Parsed {n_lines} line(s) from {len(filepaths)} log(s) at {lines_per_sec:,.0f} lines/sec")
\ No newline at end of file
@@ -0,0 +1,192 @@
+import typing
+
+from poker import actions, hands
+
+# Computes all the stats in HandGroup.summary together, in one pass over a group's hands (or, with
+# calc_stats_by_player, one pass for every player at once). The results match HandGroup's individual
+# stat methods with their default arguments.
+
+
+class StatsRecord:
+
+    def __init__(self, player_id=None, group_size=0):
+        self.player_id = player_id
+        self.group_size = group_size  # len(group), which hands_played() uses when player_id is None
+
+        self.n_hands = 0              # hands the player was in
+        self.net = 0.
+        self.net_adj = 0.             # all-in adjusted
+        self.net_bbs = 0.
+        self.n_vpip = 0               # pre-flop
+        self.n_vpip_any = 0           # on any street
+        self.n_wins_after_vpip = 0
+        self.n_showdowns = 0
+        self.n_showdown_wins = 0
+        self.n_3bet_opps = 0
+        self.n_3bets = 0
+        self.n_saw_flop = 0
+        self.n_show_opps = 0          # number of cards the player could have voluntarily shown
+        self.n_shows = 0
+        self.n_aggro = 0              # after vpip
+        self.n_passive = 0            # after vpip
+        self.all_in_max = 0.
+        self.all_in_expected = 0.
+
+    def add_hand(self, hand: hands.Hand, p: hands.Player):
+        """adds the given player's (non-None) results from the given hand."""
+        pid = p.name_and_id
+        net = p.net()
+        vpip_any = hand.did_player_vpip(pid, street=actions.ANY)
+
+        self.n_hands += 1
+        self.net += net
+        self.net_adj += p.net(all_in_adj=True)
+        self.net_bbs += net / hand.get_bb_cost()
+        self.n_vpip += 1 if hand.did_player_vpip(pid, street=actions.PRE_FLOP) else 0
+        if vpip_any:
+            self.n_vpip_any += 1
+            self.n_wins_after_vpip += 1 if net > 0 else 0
+            aggro, passive = hand.get_player_aggro_and_passive_counts(pid, after_vpip=False)
+            self.n_aggro += aggro
+            self.n_passive += passive
+            if not (p.showed_cards == 2 and p.voluntarily_showed_cards == 0):  # compelled to show
+                self.n_show_opps += 2
+                self.n_shows += p.voluntarily_showed_cards
+        if hand.player_got_to_street(pid, actions.SHOWDOWN):
+            self.n_showdowns += 1
+            self.n_showdown_wins += 1 if net > 0 else 0
+        opp, res = hand.did_player_3bet_pre(pid)
+        if opp:
+            self.n_3bet_opps += 1
+            self.n_3bets += 1 if res == actions.RAISE else 0
+        self.n_saw_flop += 1 if hand.player_got_to_street(pid, actions.FLOP) else 0
+        if p.all_in_adj_gain is not None:
+            self.all_in_max += p.all_in_adj_max_gain
+            self.all_in_expected += p.all_in_adj_gain
+
+    def add_group_hand(self, hand: hands.Hand):
+        """updates the record for a hand that's been added to the group it was calculated over."""
+        self.group_size += 1
+        p = hand.get_player(self.player_id)
+        if p is not None:
+            self.add_hand(hand, p)
+
+    def hands_played(self) -> int:
+        return self.group_size if self.player_id is None else self.n_hands
+
+    def net_gain(self, all_in_adj=False) -> float:
+        return self.net_adj if all_in_adj else self.net
+
+    def avg_bbs_per_play(self) -> float:
+        return self.net_bbs / self.hands_played() if self.hands_played() > 0 else float('nan')
+
+    def vpip_pcnt(self) -> float:
+        if self.group_size == 0:
+            return 0
+        return self.n_vpip / self.n_hands if self.n_hands > 0 else float('nan')
+
+    def win_pcnt(self) -> float:
+        return self.n_wins_after_vpip / self.n_vpip_any if self.n_vpip_any > 0 else float('nan')
+
+    def win_at_showdown_pcnt(self) -> float:
+        return self.n_showdown_wins / self.n_showdowns if self.n_showdowns > 0 else float('nan')
+
+    def three_bet_pcnt(self) -> float:
+        if self.hands_played() == 0:
+            return float('nan')
+        return self.n_3bets / self.n_3bet_opps if self.n_3bet_opps > 0 else 0
+
+    def saw_flop_pcnt(self) -> float:
+        return self.n_saw_flop / self.n_hands if self.n_hands > 0 else float('nan')
+
+    def voluntary_show_pcnt(self) -> float:
+        return self.n_shows / self.n_show_opps if self.n_show_opps > 0 else float('nan')
+
+    def aggression_factor(self) -> float:
+        total = self.n_aggro + self.n_passive
+        return self.n_aggro / total if total > 0 else float('nan')
+
+    def avg_all_in_equity(self) -> float:
+        return self.all_in_expected / self.all_in_max if self.all_in_max != 0 else float('nan')
+
+    def luck(self) -> float:
+        """returns: net winnings - all-in adjusted net winnings"""
+        return self.net - self.net_adj
+
+
+def calc_stats(group: 'hands.HandGroup', player_id=None) -> StatsRecord:
+    """returns: the stats of the given player (or the hero, if None) over the group."""
+    return calc_stats_by_player(group, [player_id])[player_id]
+
+
+def calc_stats_by_player(group: 'hands.HandGroup', player_ids: typing.Sequence[typing.Optional[str]]) \
+        -> typing.Dict[typing.Optional[str], StatsRecord]:
+    """returns: player_id -> stats of that player over the group (None means the hero)."""
+    res = {pid: StatsRecord(player_id=pid, group_size=len(group)) for pid in player_ids}
+    cols = group._get_columns()
+    if cols is not None:
+        _calc_from_columns(cols, res)
+    else:
+        for h in group.hands:
+            for pid, record in res.items():
+                p = h.get_player(pid)
+                if p is not None:
+                    record.add_hand(h, p)
+    return res
+
+
+def _calc_from_columns(cols, records: typing.Dict[typing.Optional[str], StatsRecord]):
+    import numpy
+
+    # label each row with the index of the player it counts towards (or -1)
+    player_ids = list(records)
+    labels = numpy.full(len(cols), -1, dtype=numpy.int64)
+    for i, pid in enumerate(player_ids):
+        player_rows = cols.player_rows(pid)
+        if (labels[player_rows] >= 0).any():
+            # some rows count towards more than one of the players (e.g. None and the hero's id)
+            for other_pid in player_ids:
+                _calc_from_columns(cols, {other_pid: records[other_pid]})
+            return
+        labels[player_rows] = i
+    rows = labels >= 0
+    labels = labels[rows]
+
+    def _sum(values=None, mask=None):
+        weights = None if values is None else numpy.asarray(values)[rows]
+        if mask is not None:
+            mask = mask[rows]
+            weights = mask.astype(numpy.float64) if weights is None else numpy.where(mask, weights, 0)
+        return numpy.bincount(labels, weights=weights, minlength=len(player_ids))
+
+    vpip_any = cols["vpip_any"]
+    won = cols["net"] > 0
+    showdown = cols.reached_street(actions.SHOWDOWN)
+    compelled = (cols["showed"] == 2) & (cols["vol_showed"] == 0)
+    all_in = ~numpy.isnan(cols["all_in_adj_gain"])
+
+    sums = {
+        "n_hands": _sum(),
+        "net": _sum(cols["net"]),
+        "net_adj": _sum(cols["net_adj"]),
+        "net_bbs": _sum(cols["net"] / cols["bb_cost"]),
+        "n_vpip": _sum(mask=cols["vpip"]),
+        "n_vpip_any": _sum(mask=vpip_any),
+        "n_wins_after_vpip": _sum(mask=vpip_any & won),
+        "n_showdowns": _sum(mask=showdown),
+        "n_showdown_wins": _sum(mask=showdown & won),
+        "n_3bet_opps": _sum(mask=cols["three_bet_opp"]),
+        "n_3bets": _sum(mask=cols["three_bet"]),
+        "n_saw_flop": _sum(mask=cols.reached_street(actions.FLOP)),
+        "n_show_opps": 2 * _sum(mask=vpip_any & ~compelled),
+        "n_shows": _sum(cols["vol_showed"], mask=vpip_any & ~compelled),
+        "n_aggro": _sum(cols["aggro"], mask=vpip_any),
+        "n_passive": _sum(cols["passive"], mask=vpip_any),
+        "all_in_max": _sum(cols["all_in_adj_max_gain"], mask=all_in),
+        "all_in_expected": _sum(cols["all_in_adj_gain"], mask=all_in),
+    }
+    for i, pid in enumerate(player_ids):
+        record = records[pid]
+        for name, values in sums.items():
+            value = values[i]
+            setattr(record, name, int(round(value)) if name.startswith("n_") else float(value))
@@ -0,0 +1,184 @@
+import itertools
+import math
+import typing
+
+import numpy
+
+import poker.evaluator as evaluator
+
+# NumPy versions of the evaluator's lookups, for scoring many 7-card hands at once.
+#
+# Non-flush strengths live in a dense table indexed by the colex rank of the hand's sorted ranks
+# (a 7-card rank multiset r0 <= r1 <= ... <= r6 maps to the strictly increasing r0+0 < r1+1 < ... < r6+6).
+
+_ROWS_PER_CHUNK = 1 << 18
+
+_RANK_STRENGTHS_7 = None   # colex index -> strength
+_FLUSH_STRENGTHS = None    # 13-bit rank mask -> strength
+_COLEX_WEIGHTS = None      # [i][rank] -> C(rank + i, i + 1)
+
+_COMBO_CACHE = {}  # (n_cards_in_deck, n_to_draw) -> array of index combinations
+
+
+def _ensure_tables():
+    global _RANK_STRENGTHS_7, _FLUSH_STRENGTHS, _COLEX_WEIGHTS
+    if _RANK_STRENGTHS_7 is not None:
+        return
+
+    _COLEX_WEIGHTS = numpy.array([[math.comb(r + i, i + 1) for r in range(13)] for i in range(7)], dtype=numpy.int64)
+
+    rank_table = evaluator.rank_table()
+    strengths = numpy.zeros(math.comb(13 + 6, 7), dtype=numpy.int64)
+    for ranks in itertools.combinations_with_replacement(range(13), 7):
+        key = sum(evaluator.RANK_KEYS[r] for r in ranks)
+        if max(ranks.count(r) for r in ranks) <= 4:
+            strengths[sum(math.comb(r + i, i + 1) for i, r in enumerate(ranks))] = rank_table[key]
+
+    _FLUSH_STRENGTHS = numpy.array(evaluator.flush_table(), dtype=numpy.int64)
+    _RANK_STRENGTHS_7 = strengths
+
+
+def evaluate_batch(cards: numpy.ndarray) -> numpy.ndarray:
+    """
+    :param cards: (N, 7) array of integer cards (see evaluator.to_ints).
+    :return: (N,) array of hand strengths, identical to evaluator.evaluate on each row.
+    """
+    _ensure_tables()
+    cards = numpy.asarray(cards, dtype=numpy.int64)
+    ranks = cards >> 2
+    suits = cards & 3
+
+    sorted_ranks = numpy.sort(ranks, axis=1)
+    idx = numpy.zeros(len(cards), dtype=numpy.int64)
+    for i in range(7):
+        idx += _COLEX_WEIGHTS[i][sorted_ranks[:, i]]
+    res = _RANK_STRENGTHS_7[idx]
+
+    suit_counts = numpy.stack([(suits == s).sum(axis=1) for s in range(4)], axis=1)
+    has_flush = suit_counts.max(axis=1) >= 5
+    if has_flush.any():
+        flush_suit = suit_counts.argmax(axis=1)
+        # cards of the same suit all have different ranks, so summing the bits is the same as OR-ing them
+        masks = numpy.where(suits == flush_suit[:, None], 1 << ranks, 0).sum(axis=1)
+        res = numpy.where(has_flush, _FLUSH_STRENGTHS[masks], res)
+    return res
+
+
+def evaluate_chunked(cards: numpy.ndarray) -> numpy.ndarray:
+    """Same as evaluate_batch, but a chunk of rows at a time (to bound memory use)."""
+    return numpy.concatenate([evaluate_batch(cards[i:i + _ROWS_PER_CHUNK])
+                              for i in range(0, len(cards), _ROWS_PER_CHUNK)])
+
+
+def generate_runouts(board: typing.Sequence[int], cards_in_deck: typing.Sequence[int], limit=float('inf'),
+                     rng: numpy.random.Generator = None, sampling="shuffled") -> numpy.ndarray:
+    """returns: (n_runouts, 5) array of full boards. Every runout if there are no more than limit of them,
+                otherwise limit of them, chosen the same ways as cardutils.generate_possible_runouts."""
+    to_draw = 5 - len(board)
+    deck = numpy.asarray(cards_in_deck, dtype=numpy.int64)
+    n_possible = math.comb(len(deck), to_draw)
+
+    if to_draw <= 0:
+        draws = numpy.zeros((1, 0), dtype=numpy.int64)
+    elif limit >= n_possible:
+        key = (len(deck), to_draw)
+        if key not in _COMBO_CACHE:
+            _COMBO_CACHE[key] = numpy.array(list(itertools.combinations(range(len(deck)), to_draw)), dtype=numpy.int64)
+        draws = deck[_COMBO_CACHE[key]]
+    elif sampling == "random":
+        rng = rng or numpy.random.default_rng()
+        draws = deck[numpy.argsort(rng.random((int(limit), len(deck))), axis=1)[:, :to_draw]]
+    elif sampling == "balanced":
+        rng = rng or numpy.random.default_rng()
+        per_deck = len(deck) // to_draw
+        n_decks = -(-int(limit) // per_deck)
+        shuffled = numpy.argsort(rng.random((n_decks, len(deck))), axis=1)[:, :per_deck * to_draw]
+        draws = deck[shuffled.reshape(n_decks * per_deck, to_draw)[:int(limit)]]
+    elif sampling == "shuffled":
+        rng = rng or numpy.random.default_rng()
+        indices = rng.choice(n_possible, size=int(limit), replace=False)
+        draws = deck[_unrank_combinations(indices, len(deck), to_draw)]
+    else:
+        raise ValueError(f"Unrecognized sampling method: {sampling}")
+
+    known = numpy.broadcast_to(numpy.asarray(board, dtype=numpy.int64), (len(draws), len(board)))
+    return numpy.concatenate([known, draws], axis=1)
+
+
+def _unrank_combinations(indices: numpy.ndarray, n, k) -> numpy.ndarray:
+    """returns: (len(indices), k) array of the combinations of range(n) at the given colexicographic
+                indices (same as enumeration.unrank_combination)."""
+    indices = numpy.array(indices, dtype=numpy.int64)
+    res = numpy.empty((len(indices), k), dtype=numpy.int64)
+    for col, j in enumerate(range(k, 0, -1)):
+        combs = numpy.array([math.comb(c, j) for c in range(n)], dtype=numpy.int64)  # non-decreasing in c
+        res[:, col] = numpy.searchsorted(combs, indices, side='right') - 1
+        indices -= combs[res[:, col]]
+    return res
+
+
+def calc_strengths_batch(spots: typing.Sequence[typing.Tuple[typing.Sequence[typing.Sequence[int]], numpy.ndarray]]) \
+        -> typing.List[numpy.ndarray]:
+    """
+    :param spots: list of (hole cards of each player, (n_runouts, 5) array of boards), all as integer cards.
+    :return: for each spot, a (n_runouts, n_players) array of hand strengths.
+    """
+    rows = []
+    shapes = []
+    for holes, boards in spots:
+        holes = numpy.asarray(holes, dtype=numpy.int64)  # (n_players, 2)
+        n_runouts, n_players = len(boards), len(holes)
+        full = numpy.concatenate([
+            numpy.broadcast_to(holes[None, :, :], (n_runouts, n_players, 2)),
+            numpy.broadcast_to(boards[:, None, :], (n_runouts, n_players, 5))
+        ], axis=2)
+        rows.append(full.reshape(n_runouts * n_players, 7))
+        shapes.append((n_runouts, n_players))
+
+    if len(rows) == 0:
+        return []
+    strengths = evaluate_chunked(numpy.concatenate(rows, axis=0))
+
+    res = []
+    start = 0
+    for n_runouts, n_players in shapes:
+        end = start + n_runouts * n_players
+        res.append(strengths[start:end].reshape(n_runouts, n_players))
+        start = end
+    return res
+
+
+def calc_win_shares(strengths: numpy.ndarray) -> numpy.ndarray:
+    """returns: each player's share of the pot, summed over all runouts (ties are split evenly)."""
+    winners = strengths == strengths.max(axis=1, keepdims=True)
+    return (winners / winners.sum(axis=1, keepdims=True)).sum(axis=0)
+
+
+def calc_pot_payouts(strengths: numpy.ndarray, pots: typing.Sequence[typing.Tuple[int, typing.Sequence[bool]]]) \
+        -> numpy.ndarray:
+    """
+    :param strengths: (n_runouts, n_players) array of hand strengths, with players ordered by position.
+    :param pots: list of (value in cents, whether each player is eligible to win it).
+    :return: total amount (in cents) each player wins, summed over all runouts. Pots are split the same
+             way as cardutils.PotStructure.payout_cents, with odd cents going to the earliest positions.
+    """
+    return calc_runout_payouts(strengths, pots).sum(axis=0)
+
+
+def calc_runout_payouts(strengths: numpy.ndarray, pots: typing.Sequence[typing.Tuple[int, typing.Sequence[bool]]]) \
+        -> numpy.ndarray:
+    """Same as calc_pot_payouts, but not summed.
+    returns: (n_runouts, n_players) array of the amount (in cents) each player wins on each runout."""
+    res = numpy.zeros(strengths.shape, dtype=numpy.int64)
+    for value, eligible in pots:
+        eligible = numpy.asarray(eligible, dtype=bool)
+        if not eligible.any():
+            raise ValueError(f"Couldn't find a winner for pot: {value}, {eligible}")
+        masked = numpy.where(eligible[None, :], strengths, -1)
+        winners = (masked == masked.max(axis=1, keepdims=True)) & eligible[None, :]
+        n_winners = winners.sum(axis=1, keepdims=True)
+        per_player = value // n_winners
+        extra = value - per_player * n_winners
+        bonus = winners & (numpy.cumsum(winners, axis=1) <= extra)
+        res += winners * per_player + bonus
+    return res
@@ -1,9 +1,35 @@
 import typing
 import unittest
+import unittest.mock
+import os
 import poker.hands
+import poker.scraping as scraping
 import poker.actions as actions
 import poker.cardutils as cardutils
+import poker.evaluator as evaluator
+import poker.enumeration as enumeration
+import poker.hand_cache as hand_cache
+import poker.equity_cache as equity_cache
+import poker.preflop_db as preflop_db
+import poker.players as players
+import poker.positions as positions
+import poker.ranges as ranges
+import poker.range_equity as range_equity
+import poker.vectorized as vectorized
+import poker.filters as filters
+import poker.stats as stats
+import const
+import collections
+import copy
 import datetime
+import json
+import locale
+import shutil
+import tempfile
+import itertools
+import random
+import math
+import numpy
 
 
 def _create_hand(players, actions: typing.List[actions.Action], board, gains, sb_cost=0.05, bb_cost=0.1):
@@ -40,12 +66,675 @@ def _create_hand(players, actions: typing.List[actions.Action], board, gains, sb
     return hand
 
 
+SAMPLE_LOG = os.path.join(os.path.dirname(__file__), "testdata", "poker_now_log_sample.csv")
+SAMPLE_HERO_ID = "Ghast @ k-xm91OpZ6"
+SAMPLE_DOWNLOADER_ID = "k-xm91OpZ6"
+
+
+def _legacy_eval_key(cards):
+    """sort key matching the original string-based EvalHand.__lt__"""
+    made_type, made_cards, kickers = cardutils.EvalHand._calc_hand(cards)
+    return (cardutils.HandTypes.ORDERED_BY_STRENGTH.index(made_type),
+            tuple(-cardutils.RANKS.index(c[0]) for c in made_cards),
+            tuple(-cardutils.RANKS.index(c[0]) for c in kickers))
+
+
+def _parsed_hands_summary(hand_list):
+    """everything the parser reads out of a log, as plain lists (see testdata/poker_now_log_sample_parsed.json)"""
+    return [[h.hand_idx, list(h.board),
+             [[p.name_and_id, list(p.cards), round(p.stack, 2), round(p.gain, 2), p.showed_cards,
+               p.voluntarily_showed_cards, {k: round(v, 2) for k, v in p.street_nets.items()}] for p in h.players],
+             [[a.street, a.player_id, a.action_type, round(a.amount, 2), a.all_in] for a in h.all_actions()]]
+            for h in hand_list]
+
+
 class Testcases(unittest.TestCase):
 
+    def _assert_same_ordering(self, corpus):
+        keyed = [(_legacy_eval_key(cards), evaluator.evaluate_strs(cards), cards) for cards in corpus]
+        keyed.sort(key=lambda x: x[0])
+        for (k1, s1, c1), (k2, s2, c2) in zip(keyed, keyed[1:]):
+            if k1 == k2:
+                self.assertEqual(s1, s2, f"{c1} should tie {c2}")
+            else:
+                self.assertLess(s1, s2, f"{c1} should lose to {c2}")
+
+    def test_evaluator_matches_legacy_ordering_without_flushes(self):
+        # every 7-card rank multiset, with suits dealt round-robin so that no flush is possible
+        corpus = []
+        for ranks in itertools.combinations_with_replacement(cardutils.RANKS, 7):
+            if any(ranks.count(r) > 4 for r in ranks):
+                continue
+            corpus.append([f"{r}{cardutils.SUITS[i % 4]}" for i, r in enumerate(ranks)])
+        self._assert_same_ordering(corpus)
+
+    def test_evaluator_matches_legacy_ordering_with_flushes(self):
+        # every set of 5-7 suited ranks, plus random fillers, mixed in with some random non-flush hands
+        rand = random.Random(12345)
+        corpus = []
+        for n in range(5, 8):
+            for ranks in itertools.combinations(cardutils.RANKS, n):
+                suited = [f"{r}h" for r in ranks]
+                corpus.append(suited + rand.sample(list(cardutils.all_cards(ignore=suited)), 7 - n))
+        all_cards = list(cardutils.all_cards())
+        for _ in range(20000):
+            corpus.append(rand.sample(all_cards, 7))
+        self._assert_same_ordering(corpus)
+
+    def test_incremental_evaluator(self):
+        rand = random.Random(2024)
+        for _ in range(5000):
+            cards = rand.sample(range(evaluator.N_CARDS), 7)
+            known = rand.randint(0, 5)
+            partial = evaluator.PartialHand(cards[:known])
+            self.assertEqual([evaluator.evaluate(cards)], evaluator.evaluate_runout([partial], cards[known:]))
+
     def test_pf_equities(self):
         eqs = cardutils.calc_equities([('4h', '4d'), ('Jd', 'Js')], ['Ah', 'Kc', '3d'])
         self.assertEqual([0.1, 0.9], eqs)
 
+    def test_exact_enumeration(self):
+        spots = [
+            ([('Ah', '2h'), ('Kh', '3h'), ('7c', '7d')], ['9h', '7h', 'Qs']),
+            ([('As', 'Ks'), ('Qd', 'Qc'), ('5s', '4s')], ['Ts', '3d']),
+            ([('Ac', 'Kc'), ('Ad', 'Kd')], []),
+        ]
+        for h_list, board in spots:
+            dead = set(board).union(*h_list)
+            deck = list(cardutils.all_cards(ignore=dead))
+            n_runouts = sum(ways for _, ways in enumeration.iter_runout_classes(h_list, board))
+            self.assertEqual(enumeration.count_runouts(len(deck), 5 - len(board)), n_runouts)
+
+            if len(board) > 0:
+                expected = [0.] * len(h_list)
+                for draws in itertools.combinations(deck, 5 - len(board)):
+                    evals = [cardutils.EvalHand(h, board + list(draws)) for h in h_list]
+                    winners = [idx for idx, e in enumerate(evals) if e == max(evals)]
+                    for idx in winners:
+                        expected[idx] += 1 / len(winners)
+                self.assertTrue(cardutils.safe_eq(expected, enumeration.calc_exact_wins(h_list, board), thresh=1e-6))
+
+        eqs = cardutils.calc_wins([('Ac', 'Kc'), ('Ad', 'Kd')], [])
+        self.assertAlmostEqual(eqs[0], eqs[1])
+
+    def test_batch_all_in_equities(self):
+        hand_list = scraping.scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, SAMPLE_LOG, calc_stats=False)
+        spots = [(h,) + h._get_all_in_spot() for h in hand_list if h._get_all_in_spot() is not None]
+        post_flop_spots = [spot for spot in spots if len(spot[1]) > 0]
+        self.assertEqual(2, len(post_flop_spots))
+
+        equity_cache.get_cache().clear()
+        batched = cardutils.calc_all_in_equities_batch(post_flop_spots)
+        equity_cache.get_cache().clear()
+        for spot, res in zip(post_flop_spots, batched):
+            self.assertTrue(cardutils.safe_eq(cardutils.calc_all_in_equities(*spot), res))
+
+        # with a tolerance, post-flop all-ins are still enumerated, and pre-flop ones are sampled until they're accurate
+        equity_cache.get_cache().clear()
+        self.assertEqual(batched, cardutils.calc_all_in_equities_batch(post_flop_spots, tolerance=0.01))
+        pre_flop_spots = [spot for spot in spots if len(spot[1]) == 0][:2]
+        sampled = cardutils.calc_all_in_equities_batch(pre_flop_spots, limit=20000, tolerance=0.01,
+                                                       rng=numpy.random.default_rng(3))
+        for spot, res in zip(pre_flop_spots, sampled):
+            serial = cardutils.calc_all_in_equities(*spot, limit=20000, tolerance=0.01, rng=random.Random(3))
+            self.assertEqual(set(serial), set(res))
+            for pid in res:
+                self.assertEqual(serial[pid][1], res[pid][1])
+                self.assertLess(abs(serial[pid][2] - res[pid][2]), 0.06)
+
+        h_lists = [([p.cards for p in h.players if p.known_cards() == 2], board) for h, board, _ in post_flop_spots]
+        batched = cardutils.calc_equities_batch(h_lists)
+        equity_cache.get_cache().clear()
+        for eqs, (h_list, board) in zip(batched, h_lists):
+            self.assertTrue(cardutils.safe_eq(cardutils.calc_equities(h_list, board), eqs))
+
+        # spots are evaluated a bounded number at a time, with the same results
+        post_flop_hands = [h for h, _, _ in post_flop_spots]
+        poker.hands.calc_advanced_stats_batch(post_flop_hands)
+        gains = [p.all_in_adj_gain for h in post_flop_hands for p in h.players]
+        equity_cache.get_cache().clear()
+        poker.hands.calc_advanced_stats_batch(post_flop_hands, batch_size=1)
+        self.assertEqual(gains, [p.all_in_adj_gain for h in post_flop_hands for p in h.players])
+
+    def test_parallel_scrape_directory(self):
+        try:
+            locale.setlocale(locale.LC_ALL, '')
+            locale.currency(1.0)
+        except ValueError:
+            self.skipTest("scrape_directory needs a locale that supports currency formatting")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for i in range(3):
+                shutil.copy(SAMPLE_LOG, os.path.join(tmpdir, f"log_{i}.csv"))
+            serial = scraping.scrape_directory(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, tmpdir, workers=1,
+                                               cache_dir=None, equity_cache_db=None)
+            parallel = scraping.scrape_directory(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, tmpdir, workers=2,
+                                                 cache_dir=None, equity_cache_db=None)
+
+        self.assertEqual([(h.configs["logfile"], h.hand_idx) for h in serial.hands],
+                         [(h.configs["logfile"], h.hand_idx) for h in parallel.hands])
+        self.assertAlmostEqual(serial.net_gain(), parallel.net_gain())
+
+    def test_line_classifier(self):
+        self.assertEqual((actions.RAISE, ("Bob @ b1", "1.50", " and go all in")),
+                         scraping._classify_line('"Bob @ b1" raises to 1.50 and go all in', scraping._PRE_FLOP_RULES))
+        self.assertEqual((actions.FOLD, ("Bob @ b1",)),
+                         scraping._classify_line('"Bob @ b1" folds', scraping._POST_FLOP_RULES[actions.TURN]))
+        self.assertEqual(scraping._NEXT_STREET,
+                         scraping._classify_line('River: 2h, 3h, 4h, 5h [6h]', scraping._POST_FLOP_RULES[actions.TURN])[0])
+        self.assertEqual((None, None), scraping._classify_line('Flop:  [2h, 3h, 4h]', scraping._POST_FLOP_RULES[actions.FLOP]))
+
+        # same hands as the if/elif chain the rule table replaced (saved from its output on the sample log)
+        with open(os.path.join(os.path.dirname(SAMPLE_LOG), "poker_now_log_sample_parsed.json")) as f:
+            expected = json.load(f)
+        hand_list = scraping.scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, SAMPLE_LOG, calc_stats=False)
+        self.assertEqual(expected, json.loads(json.dumps(_parsed_hands_summary(hand_list))))
+
+        n_lines, _ = scraping.benchmark_parser(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, [SAMPLE_LOG], repeats=1)
+        self.assertEqual(104, n_lines)
+
+    def test_hand_lines_cursor(self):
+        raw = [["junk from the previous hand", "t", "1"],
+               ["-- starting hand #7 (id: x) --", "t", "2"],
+               ["Player stacks: #1 \"Bob @ b1\" (10.00)", "t", "3"],
+               ["-- ending hand #7 --", "t", "4"],
+               ["\"Bob @ b1\" collected 0.30 from pot", "t", "5"],
+               ["Your hand is A♠, K♠", "t", "6"]]
+        lines = scraping._HandLines(raw)
+        self.assertEqual(raw[1], lines.intro_line)
+        self.assertEqual(raw[3], lines.end_line)
+        self.assertEqual(raw[4], lines.final_collect_line)
+        self.assertEqual([raw[2], raw[4], raw[5], raw[3]], lines.lines)
+
+        self.assertEqual(raw[5], lines.pop_matching(scraping._RE_YOUR_HAND_LINE))
+        self.assertIsNone(lines.pop_matching(scraping._RE_PLAYER_STACKS, allow_fail=True))  # already passed it
+        self.assertEqual(1, len(lines))
+        self.assertEqual(raw[3], lines.peek())
+
+    def test_streaming_scrape(self):
+        def _summarize(hl):
+            return [(h.hand_idx, h.timestamp, h.board, [(p.name_and_id, p.cards, p.net()) for p in h.players]) for h in hl]
+        expected = _summarize(scraping.scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, SAMPLE_LOG, calc_stats=False))
+        streamed = scraping.iter_scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, SAMPLE_LOG, calc_stats=False, sort_window=8)
+        self.assertEqual(expected, _summarize(streamed))
+
+        # two (newest-first) logs concatenated together
+        with open(SAMPLE_LOG, mode='r') as f:
+            lines = f.read().splitlines()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            merged = os.path.join(tmpdir, "merged.csv")
+            with open(merged, mode='w') as f:
+                f.write("\n".join(lines + lines) + "\n")
+            hand_list = list(scraping.iter_scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, merged, calc_stats=False))
+            self.assertEqual(expected + expected, _summarize(hand_list))
+
+        lines = [["a", "t", str(order)] for order in [2, 1, 3, 5, 4, 9, 10, 6, 8]]
+        lines.insert(4, ["entry", "at", "order"])
+        self.assertEqual([1, 2, 3, 5, 4, 6, 8, 9, 10], [int(l[2]) for l in scraping._sorted_within_window(lines, 2)])
+
+    def test_log_follower(self):
+        def _summarize(hl):
+            return [(h.hand_idx, h.board, [(p.name_and_id, p.cards, p.net()) for p in h.players]) for h in hl]
+        with open(SAMPLE_LOG, mode='r') as f:
+            header, *lines = f.read().splitlines()
+        lines.reverse()  # oldest first, so the log can be "written" a bit at a time
+        expected = scraping.scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, SAMPLE_LOG, calc_stats=False)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            logfile = os.path.join(tmpdir, "log.csv")
+            follower = scraping.LogFollower(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, calc_stats=False)
+            group = poker.hands.HandGroup([])
+            group._get_columns()
+            record = stats.calc_stats(group)
+            for n_lines in [10, 11, 40, 41, 42, 80, len(lines)]:
+                with open(logfile, mode='w') as f:
+                    f.write("\n".join([header] + list(reversed(lines[:n_lines]))) + "\n")
+                os.utime(logfile, ns=(n_lines, n_lines))
+                new_hands = follower.poll(logfile)
+                group.extend(new_hands)
+                for h in new_hands:
+                    record.add_group_hand(h)
+            self.assertEqual(_summarize(expected), _summarize(group.hands))
+            self.assertEqual([], follower.poll(logfile))
+
+        rebuilt = poker.hands.HandGroup(group.hands)
+        for name in ["hand", "player", "net", "streets"]:
+            self.assertEqual(list(rebuilt._get_columns()[name]), list(group._get_columns()[name]))
+        self.assertAlmostEqual(stats.calc_stats(rebuilt).avg_bbs_per_play(), record.avg_bbs_per_play())
+        self.assertEqual(len(expected), record.hands_played())
+
+    def test_main_report(self):
+        import contextlib
+        import io
+        import runpy
+        import main
+
+        def _currency(value):  # the report formats money with the locale, which may not support it here
+            return f"${value:,.2f}"
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                unittest.mock.patch("locale.currency", _currency), \
+                unittest.mock.patch("locale.setlocale"), \
+                unittest.mock.patch.multiple(const, LOG_DIR=tmpdir, HERO_ID=SAMPLE_HERO_ID, LOG_DOWNLOADER_ID=SAMPLE_DOWNLOADER_ID,
+                                             ALIAS_FILENAME=os.path.join(tmpdir, "aliases.json")), \
+                unittest.mock.patch("sys.argv", ["main.py", "--no-cache"]):
+            shutil.copy(SAMPLE_LOG, os.path.join(tmpdir, "log.csv"))
+            with open(const.ALIAS_FILENAME, "w") as f:
+                f.write("{}")
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                runpy.run_path(os.path.join(os.path.dirname(__file__), "..", "main.py"), run_name="__main__")
+            for section in ["-- Summary of", "-- Player Breakdowns", "-- Situational Breakdowns", "-- Per-Hand Stats",
+                            "-- Per-Hand Profit Table --"]:
+                self.assertIn(section, out.getvalue())
+
+            # the report sections print the same thing when the stats are built up a few hands at a time (like
+            # in --follow mode) as when they're calculated all at once
+            hand_list = scraping.scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, SAMPLE_LOG, calc_stats=False)
+            hand_list.sort(key=lambda h: h.timestamp)
+
+            def _report(all_hands, hero_hands, hero_stats, player_stats, per_hand_stats):
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out):
+                    main.print_hero_summary(hero_hands, hero_stats)
+                    main.print_player_breakdowns(all_hands, player_stats)
+                    main.print_per_hand_stats(per_hand_stats)
+                return out.getvalue()
+
+            all_hands = poker.hands.HandGroup(hand_list)
+            hero_hands = all_hands.filter(filters.HeroPlayed())
+            per_hand_stats = {}
+            main.add_per_hand_stats(per_hand_stats, hero_hands)
+            expected = _report(all_hands, hero_hands, stats.calc_stats(hero_hands),
+                               stats.calc_stats_by_player(all_hands, all_hands.players()), per_hand_stats)
+
+            all_hands = poker.hands.HandGroup(hand_list[:10])
+            hero_hands = all_hands.filter(filters.HeroPlayed())
+            hero_stats = stats.calc_stats(hero_hands)
+            player_stats = stats.calc_stats_by_player(all_hands, all_hands.players())
+            per_hand_stats = {}
+            main.add_per_hand_stats(per_hand_stats, hero_hands)
+            for start in range(10, len(hand_list), 7):
+                new_hands = hand_list[start:start + 7]
+                all_hands.extend(new_hands)
+                main.add_new_players(all_hands, new_hands, player_stats)
+                for h in new_hands:
+                    for record in player_stats.values():
+                        record.add_group_hand(h)
+                new_hero_hands = poker.hands.HandGroup(new_hands).filter(filters.HeroPlayed())
+                hero_hands.extend(new_hero_hands.hands)
+                for h in new_hero_hands:
+                    hero_stats.add_group_hand(h)
+                main.add_per_hand_stats(per_hand_stats, new_hero_hands)
+            self.assertEqual(expected, _report(all_hands, hero_hands, hero_stats, player_stats, per_hand_stats))
+
+    def test_hand_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            logfile = os.path.join(tmpdir, "log.csv")
+            cache_dir = os.path.join(tmpdir, "cache")
+            shutil.copy(SAMPLE_LOG, logfile)
+            params = hand_cache.make_params(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, {}, 1000)
+            self.assertIsNone(hand_cache.load(cache_dir, logfile, params))
+
+            hand_list = scraping.scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, logfile)
+            hand_cache.save(cache_dir, logfile, params, hand_list)
+            cached = hand_cache.load(cache_dir, logfile, params)
+            def _summarize(hl):
+                return [(h.hand_idx, h.board, [(p.name_and_id, p.cards, p.net(), p.all_in_adj_gain) for p in h.players],
+                         [(a.player_id, a.action_type, a.amount, a.street) for a in h.all_actions()]) for h in hl]
+            self.assertEqual(_summarize(hand_list), _summarize(cached))
+
+            # different parse params, or changed contents -> cache miss
+            other_params = hand_cache.make_params(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, {"abc": "Bob @ abc"}, 1000)
+            self.assertIsNone(hand_cache.load(cache_dir, logfile, other_params))
+            other_params = hand_cache.make_params(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, {}, 1000, tolerance=0.01)
+            self.assertIsNone(hand_cache.load(cache_dir, logfile, other_params))
+            other_params = hand_cache.make_params(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, {}, 1000, sampling="shuffled")
+            self.assertIsNone(hand_cache.load(cache_dir, logfile, other_params))
+            os.utime(logfile, ns=(0, 0))
+            self.assertIsNotNone(hand_cache.load(cache_dir, logfile, params))  # same contents, only mtime changed
+            with open(logfile, "a") as f:
+                f.write("\n")
+            self.assertIsNone(hand_cache.load(cache_dir, logfile, params))
+
+    def test_runout_sampling(self):
+        combos = [tuple(sorted(enumeration.unrank_combination(i, 10, 3))) for i in range(enumeration.count_runouts(10, 3))]
+        self.assertEqual(sorted(itertools.combinations(range(10), 3)), sorted(combos))
+
+        board = ["2h", "7c", "9s"]
+        deck = list(cardutils.all_cards(ignore=board))
+        for sampling in ["balanced", "shuffled", "random"]:
+            runouts = [tuple(sorted(d)) for d in cardutils.generate_possible_runouts(
+                board, deck, limit=500, sampling=sampling, rng=random.Random(7))]
+            self.assertEqual(500, len(runouts))
+            self.assertTrue(all(len(set(d)) == 2 and set(d) <= set(deck) for d in runouts))
+            if sampling == "shuffled":
+                self.assertEqual(500, len(set(runouts)))
+            elif sampling == "balanced":
+                # each card is dealt at most once per shuffled deck (of 24 run-outs)
+                counts = collections.Counter(c for d in runouts for c in d)
+                self.assertLessEqual(max(counts.values()), math.ceil(500 / 24))
+
+        # by default, sampled run-outs don't repeat, and the sampling method is part of the equity cache keys
+        self.assertEqual(500, len(set(tuple(sorted(d)) for d in cardutils.generate_possible_runouts(board, deck, limit=500))))
+        boards = vectorized.generate_runouts(evaluator.to_ints(board), evaluator.to_ints(deck), limit=500)
+        self.assertEqual(500, len(set(tuple(sorted(b)) for b in boards.tolist())))
+        self.assertIn(cardutils.SAMPLING, cardutils._sampling_param(len(deck), 2, 500))
+        self.assertIn(cardutils.ADAPTIVE_SAMPLING, cardutils._sampling_param(len(deck), 2, 500, tolerance=0.01))
+        equity_cache.get_cache().clear()
+        with unittest.mock.patch.object(cardutils, "ADAPTIVE_SAMPLING", "other"):
+            other = cardutils.estimate_equities([("Ah", "Kd"), ("Qs", "Qc")], [], tolerance=0.02, rng=random.Random(1))
+        est = cardutils.estimate_equities([("Ah", "Kd"), ("Qs", "Qc")], [], tolerance=0.02, rng=random.Random(2))
+        self.assertNotEqual(other.equities, est.equities)  # not served from the cache
+
+        full = list(cardutils.generate_possible_runouts(board, deck, limit=2000))
+        self.assertEqual(enumeration.count_runouts(len(deck), 2), len(full))
+
+    def test_adaptive_equities(self):
+        rand = random.Random(99)
+        for h_list in [[("Ah", "Ad"), ("7c", "2d")], [("Ah", "Kd"), ("Qs", "Qc"), ("7h", "8h")]]:
+            est = cardutils.estimate_equities(h_list, [], tolerance=0.01, rng=rand)
+            self.assertFalse(est.exact)
+            self.assertLessEqual(max(est.std_errors), 0.01)
+            exact = enumeration.calc_exact_wins(h_list, [])
+            for eq, err, wins in zip(est.equities, est.std_errors, exact):
+                self.assertLess(abs(eq - wins / sum(exact)), 5 * err)
+
+        # lopsided spots need fewer samples than close ones
+        lopsided = cardutils.estimate_equities([("Ah", "Ad"), ("7c", "2d")], ["As", "Kd", "2h"], exact_threshold=0, rng=rand)
+        close = cardutils.estimate_equities([("Ah", "Kd"), ("Qs", "Qc")], [], tolerance=0.01, rng=rand)
+        self.assertLess(lopsided.n_runouts, close.n_runouts)
+
+        self.assertTrue(cardutils.estimate_equities([("Ah", "Kd"), ("Qs", "Qc")], ["2c", "9h", "Td"]).exact)
+        eqs = cardutils.calc_equities([("Ah", "Kd"), ("Qs", "Qc")], [], tolerance=0.01)
+        self.assertEqual(2, len(eqs))
+        self.assertAlmostEqual(1., sum(eqs))
+
+        # a tolerance that can't be met is an error (or stops at the cap), rather than sampling forever
+        self.assertRaises(ValueError, cardutils.calc_equities, [("Ah", "Kd"), ("Qs", "Qc")], [], tolerance=0)
+        hand_list = scraping.scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, SAMPLE_LOG, calc_stats=False)
+        spot = [(h,) + h._get_all_in_spot() for h in hand_list
+                if h._get_all_in_spot() is not None and len(h._get_all_in_spot()[0]) == 0][0]
+        self.assertRaises(ValueError, cardutils.calc_all_in_equities_batch, [spot], tolerance=0)
+        uncapped = cardutils.estimate_equities([("Ah", "Kd"), ("Qs", "Qc")], [], tolerance=1e-9, rng=rand)
+        self.assertEqual(const.EQUITY_CALC_MAX_ITERS, uncapped.n_runouts)
+        capped = cardutils.estimate_equities([("Ah", "Kd"), ("Qs", "Qc")], [], tolerance=0.0001, max_runouts=300, rng=rand)
+        self.assertEqual(300, capped.n_runouts)
+        self.assertGreater(max(capped.std_errors), 0.0001)
+
+    def test_equity_cache(self):
+        to_ints = evaluator.to_ints
+        key1, order1 = equity_cache.canonicalize([to_ints(["Ah", "Ad"]), to_ints(["Ks", "Kc"])], to_ints(["2h", "7c", "9s"]))
+        key2, order2 = equity_cache.canonicalize([to_ints(["Kh", "Kd"]), to_ints(["As", "Ac"])], to_ints(["9d", "7h", "2s"]))
+        self.assertEqual(key1, key2)
+        self.assertEqual(order1, order2[::-1])
+        self.assertNotEqual(key1, equity_cache.canonicalize([to_ints(["Ah", "Ad"]), to_ints(["Ks", "Kc"])],
+                                                            to_ints(["2h", "7h", "9s"]))[0])
+
+        spot = ([("Ah", "Ad"), ("Ks", "Kc")], ["2h", "7c", "9s"])
+        isomorphic = ([("Kh", "Kd"), ("As", "Ac")], ["9d", "7h", "2s"])
+        expected = cardutils.calc_equities(*spot)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            try:
+                equity_cache.configure(db_path=os.path.join(tmpdir, "equities.sqlite3"))
+                self.assertEqual(expected, cardutils.calc_equities(*spot))
+                self.assertEqual(expected[::-1], cardutils.calc_equities(*isomorphic))
+                self.assertEqual(1, equity_cache.get_cache().hits)
+
+                # new caches (e.g. in other processes) read what earlier ones wrote to disk
+                equity_cache.configure(db_path=None)
+                equity_cache.configure(db_path=os.path.join(tmpdir, "equities.sqlite3"))
+                self.assertEqual(expected[::-1], cardutils.calc_equities(*isomorphic))
+                self.assertEqual((1, 0), (equity_cache.get_cache().hits, equity_cache.get_cache().misses))
+            finally:
+                equity_cache.configure(db_path=None)
+
+        lru = equity_cache.EquityCache(max_entries=2)
+        for k in "abc":
+            lru.put(k, [0.5])
+        self.assertEqual([None, (0.5,), (0.5,)], [lru.get(k) for k in "abc"])
+
+    def test_binary_preflop_db(self):
+        equities = {("AaAb", "KaKb"): 0.8225, ("AaKa", "QbQc"): 0.46, ("7a2b", "7c2d"): 0.5}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bin_path = os.path.join(tmpdir, "equities.bin")
+            preflop_db.write_binary_db(equities, bin_path)
+            try:
+                preflop_db.load_from_disk(bin_path=bin_path, text_path=os.path.join(tmpdir, "missing.txt"))
+                self.assertAlmostEqual(0.8225, preflop_db.get_equity(("As", "Ah"), ("Ks", "Kh")), places=6)
+                self.assertAlmostEqual(1 - 0.8225, preflop_db.get_equity(("Kd", "Kc"), ("Ad", "Ac")), places=6)
+                self.assertAlmostEqual(0.46, preflop_db.get_equity(("Kh", "Ah"), ("Qs", "Qd")), places=6)
+                self.assertAlmostEqual(0.5, preflop_db.get_equity(("7h", "2d"), ("2c", "7s")), places=6)
+                self.assertIsNone(preflop_db.get_equity(("As", "Ah"), ("Kd", "Kh"), no_fail=True))
+                # the card code matrix is derived from (and stored next to) whichever DB was loaded
+                self.assertIsNone(preflop_db._CC_MATRIX)
+                self.assertEqual(os.path.join(tmpdir, "equities_cardcode_matrix.bin"),
+                                 preflop_db._card_code_matrix_path(bin_path))
+            finally:
+                preflop_db._DB = None  # memoryview over a file we're about to delete
+
+    def test_preflop_matchups(self):
+        matchups = list(preflop_db.iter_matchups())
+        self.assertEqual(48308, len(matchups))
+        self.assertEqual(len(matchups), len(set(preflop_db._slot_of(key1, key2) for key1, key2, _, _ in matchups)))
+
+        aa_vs_kk = [m for m in matchups if m[:2] == ("AaAb", "KcKd")]
+        (_, _, eq), = preflop_db._calc_matchup_equities(aa_vs_kk)
+        self.assertAlmostEqual(0.81255, eq, places=5)
+
+    def test_card_code_matrix(self):
+        self.assertEqual((6, 36, 12 * 12), tuple(preflop_db.get_avg_equity_by_cardcode(cc, cc2)[1]
+                                                 for cc, cc2 in [("AA", "AA"), ("AA", "KK"), ("AKo", "T9o")]))
+        eq, _ = preflop_db.get_avg_equity_by_cardcode("AKs", "QQ")
+        self.assertAlmostEqual(1 - eq, preflop_db.get_avg_equity_by_cardcode("QQ", "AKs")[0])
+        self.assertEqual("AA", max(preflop_db.CARD_CODES, key=preflop_db.get_avg_equity_vs_all))
+        self.assertEqual(["QQ", "KK", "AA"], cardutils.get_best_preflop_card_codes(0.98)[-3:])
+
+    def test_ranges(self):
+        premiums = ranges.Range.parse("JJ+, AQ+")
+        self.assertEqual(["AA", "AKs", "AQs", "AKo", "KK", "AQo", "QQ", "JJ"], premiums.card_codes())
+        self.assertEqual(4 * 6 + 2 * 16, premiums.n_combos())
+        self.assertTrue(premiums.contains_cards(("Qd", "Ah")))
+        self.assertFalse(premiums.contains_cards(("Th", "Td")))
+        self.assertFalse(premiums.contains_cards(("Ah", None)))
+
+        self.assertEqual(ranges.Range.parse("A5s-A2s"), ranges.Range.parse("A2s-A5s"))
+        self.assertEqual(["A9s", "A8s"], (ranges.Range.parse("A8s+") & ranges.Range.parse("A9-A2")).card_codes())
+        self.assertEqual(169 - 8, len(~premiums))
+        self.assertEqual(ranges.Range.parse("AQ+"), premiums - ranges.Range.parse("JJ+"))
+        self.assertEqual(ranges.Range.everything(), premiums | ~premiums)
+        self.assertRaises(ValueError, lambda: ranges.Range.parse("AKs-QJo"))
+
+    def test_range_equity(self):
+        # pre-flop, whole ranges come from the card code matrix and hands are looked up combo by combo
+        villain = "22+, A2s+, KTo+"
+        villain_combos = [tuple(evaluator.to_str(c) for c in h) for h in range_equity.to_combos(villain)]
+        expected = [preflop_db.get_equity(("Ah", "Kd"), h) for h in villain_combos if cardutils.are_unique(("Ah", "Kd") + h)]
+        self.assertAlmostEqual(sum(expected) / len(expected), range_equity.calc_range_equity(("Ah", "Kd"), villain))
+        qq_plus = [tuple(evaluator.to_str(c) for c in h) for h in range_equity.to_combos("QQ+")]
+        self.assertAlmostEqual(range_equity.calc_range_equity(qq_plus, villain), range_equity.calc_range_equity("QQ+", villain))
+
+        equities, weights = range_equity.calc_equity_matrix("AA", "AA, KK")
+        self.assertEqual((6, 36), (weights[0, 0], weights[0, ranges.CARD_CODE_IDX["KK"]]))
+        self.assertAlmostEqual(0.5, equities[0, 0], places=2)
+
+        # post-flop, every pair of combos that don't overlap (with each other or the board) counts equally
+        board = ["9d", "7c", "2s"]
+        self.assertAlmostEqual(cardutils.calc_equities([("Ah", "Kd"), ("Qs", "Qh")], board)[0],
+                               range_equity.calc_range_equity(("Ah", "Kd"), ("Qs", "Qh"), board=board))
+        expected = []
+        for h1 in range_equity.to_combos("AK", board=board):
+            for h2 in range_equity.to_combos("QQ, 99", board=board):
+                if not set(h1) & set(h2):
+                    h_list = [[evaluator.to_str(c) for c in h] for h in (h1, h2)]
+                    expected.append(cardutils.calc_equities(h_list, board)[0])
+        self.assertAlmostEqual(sum(expected) / len(expected), range_equity.calc_range_equity("AK", "QQ, 99", board=board))
+        equities, weights = range_equity.calc_equity_matrix("AK", "QQ, 99", board=board)
+        self.assertEqual(12 * 3, weights[ranges.CARD_CODE_IDX["AKo"], ranges.CARD_CODE_IDX["99"]])
+
+    def test_columnar_stats(self):
+        hand_list = scraping.scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, SAMPLE_LOG)
+        columnar = poker.hands.HandGroup(hand_list)
+        legacy = poker.hands.HandGroup(hand_list)
+        legacy._get_columns = lambda: None
+
+        def _stats(group, pid):
+            return [group.vpip_pcnt(pid), group.get_3bet_pcnt(pid), group.get_saw_street_pcnt(pid),
+                    group.get_voluntary_show_pcnt(pid), group.get_aggression_factor(pid), group.net_gain(player_id=pid),
+                    group.net_bbs(all_in_adj=True, player_id=pid), group.hands_played(pid), group.win_pcnt(pid),
+                    group.win_at_showdown_pcnt(pid), group.get_avg_all_in_equity(pid), group.total_flux(pid)]
+
+        def _assert_same_stats(group1, group2):
+            for pid in [None, "Bob", "Cat @ c1", "nobody"]:
+                for st1, st2 in zip(_stats(group1, pid), _stats(group2, pid)):
+                    if math.isnan(st1):
+                        self.assertTrue(math.isnan(st2))
+                    else:
+                        self.assertAlmostEqual(st1, st2)
+                self.assertEqual(group1.get_hole_card_freqs(pid), group2.get_hole_card_freqs(pid))
+
+        _assert_same_stats(columnar, legacy)
+        saw_flop = filters.HeroSawStreet(actions.FLOP)
+        filtered = columnar.filter(saw_flop)
+        self.assertIsNotNone(filtered._columns)  # sliced from the parent's columns
+        _assert_same_stats(filtered, legacy.filter(saw_flop))
+
+    def test_stats_records(self):
+        hand_list = scraping.scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, SAMPLE_LOG)
+        group = poker.hands.HandGroup(hand_list)
+        legacy = poker.hands.HandGroup(hand_list)
+        legacy._get_columns = lambda: None
+
+        pids = [None, SAMPLE_HERO_ID, "Bob", "Cat @ c1", "nobody"]
+        for records in (stats.calc_stats_by_player(group, pids), stats.calc_stats_by_player(legacy, pids)):
+            for pid in pids:
+                record = records[pid]
+                expected = [group.avg_bbs_per_play(pid), group.net_gain(player_id=pid), group.hands_played(pid),
+                            group.vpip_pcnt(pid), group.win_pcnt(pid), group.win_at_showdown_pcnt(pid),
+                            group.get_3bet_pcnt(pid), group.get_saw_street_pcnt(pid), group.get_voluntary_show_pcnt(pid),
+                            group.get_aggression_factor(pid), group.get_avg_all_in_equity(pid), group.get_luck(pid)]
+                actual = [record.avg_bbs_per_play(), record.net_gain(), record.hands_played(), record.vpip_pcnt(),
+                          record.win_pcnt(), record.win_at_showdown_pcnt(), record.three_bet_pcnt(),
+                          record.saw_flop_pcnt(), record.voluntary_show_pcnt(), record.aggression_factor(),
+                          record.avg_all_in_equity(), record.luck()]
+                for st1, st2 in zip(expected, actual):
+                    if math.isnan(st1):
+                        self.assertTrue(math.isnan(st2))
+                    else:
+                        self.assertAlmostEqual(st1, st2)
+
+    def test_filter_bitsets(self):
+        hand_list = scraping.scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, SAMPLE_LOG)
+        group = poker.hands.HandGroup(hand_list)
+        legacy = poker.hands.HandGroup(hand_list)
+        legacy._get_columns = lambda: None
+
+        saw_flop = filters.HeroSawStreet(actions.FLOP)
+        to_test = [filters.Filter(), filters.HeroCardFilter("JJ+, AQ+"), filters.HeroCardsKnown(counts=0),
+                   saw_flop & filters.Multiway(actions.FLOP, at_most=2),
+                   filters.HeroVPIP() & ~filters.HeroSawStreet(actions.SHOWDOWN),
+                   filters.HeroCardFilter("22+") | (saw_flop & ~filters.HeroInPosition()),
+                   filters.HeroAtSpecificPosition(actions.LATE_POS), filters.HeroAtSpecificPosition((actions.SB, actions.UTG))]
+        for f in to_test:
+            expected = [h for h in hand_list if f.test(h)]
+            self.assertEqual(expected, group.filter(f).hands)
+            self.assertEqual(expected, legacy.filter(f).hands)
+
+        # leaf filters are cached by their parameters, and shared between compound filters
+        self.assertIn(filters.HeroSawStreet(actions.FLOP).key(), group._filter_bits)
+        self.assertEqual(filters.HeroCardFilter("AQ+, JJ+").key(), filters.HeroCardFilter("JJ+, AQ+").key())
+        self.assertEqual((saw_flop & filters.HeroVPIP()).key(), (filters.HeroVPIP() & saw_flop).key())
+        self.assertNotEqual(filters.Multiway(actions.FLOP, at_most=2).key(), filters.Multiway(actions.FLOP).key())
+
+        group.extend(hand_list[:3])
+        self.assertEqual([h for h in group.hands if saw_flop.test(h)], group.filter(saw_flop).hands)
+
+        self.assertEqual([True, False, True, False], filters.bits_to_bools(0b101, 4))
+        self.assertEqual(0b101, filters.bools_to_bits([True, False, True, False]))
+
+    def test_position_index(self):
+        h = _create_hand([("A", 10, "AhAd"), ("B", 15, "KhKd")],
+                         [
+                             actions.Action("A", 0.05, actions.SB, actions.PRE_FLOP),
+                             actions.Action("B", 0.10, actions.BB, actions.PRE_FLOP),
+                             actions.Action("A", 0.05, actions.CALL, actions.PRE_FLOP),
+                             actions.Action("B", 0, actions.CHECK, actions.PRE_FLOP),
+                             actions.Action("A", 0, actions.CHECK, actions.FLOP),
+                             actions.Action("B", 0, actions.CHECK, actions.FLOP),
+                         ], ["Jh", "4c", "Td"], {"B": 0.2})
+        index = h.get_position_index()
+        self.assertEqual({"A": 0, "B": 1}, index.seats)
+        self.assertEqual((0b01, 0b11), (index.hero_seats, index.active_seats[actions.FLOP]))
+        self.assertEqual(positions.to_bits([actions.SB, actions.EARLY_POS, actions.BLINDS]), index.hero_labels)
+        self.assertEqual(positions.to_bits([actions.BB, actions.BTN, actions.LATE_POS, actions.BLINDS]),
+                         index.labels_of("B"))
+        self.assertTrue(filters.HeroAtSpecificPosition(actions.BLINDS).test(h))
+        self.assertTrue(filters.HeroAtSpecificPosition(actions.ANY).test(h))
+        self.assertFalse(filters.HeroAtSpecificPosition((actions.BTN, actions.LATE_POS)).test(h))
+        self.assertTrue(filters.HeroOutOfPosition().test(h))
+        self.assertFalse(filters.HeroInPosition().test(h))
+
+        # in/out of position are bit tests, which also work over whole arrays of hands
+        hero_seats, active_seats = numpy.array([0b0010, 0b0010, 0b1000, 0]), numpy.array([0b1011, 0b0110, 0b1001, 0b11])
+        self.assertEqual([False, False, True, False], list(positions.hero_acts_last(hero_seats, active_seats)))
+        self.assertEqual([False, True, False, False], list(positions.hero_acts_last(hero_seats, active_seats, reverse=True)))
+        group = poker.hands.HandGroup([h])
+        self.assertEqual([[], [h]], [group.filter(filters.HeroInPosition()).hands, group.filter(filters.HeroOutOfPosition()).hands])
+
+    def test_pot_structure(self):
+        h = _create_hand([("A", 5, "AhAd"), ("B", 10, "KhKd"), ("C", 10, "QhQd")],
+                         [
+                             actions.Action("A", 5, actions.OPEN, actions.PRE_FLOP, all_in=True),
+                             actions.Action("B", 10, actions.RAISE, actions.PRE_FLOP, all_in=True),
+                             actions.Action("C", 10, actions.CALL, actions.PRE_FLOP, all_in=True),
+                         ], ["2c", "7d", "9s", "3h", "4c"], {"A": 15, "B": 10})
+        pots = h.get_pot_structure()
+        self.assertEqual(((1500, frozenset(["A", "B", "C"])), (1000, frozenset(["B", "C"]))), pots.pots)
+        self.assertEqual(("A", "B", "C"), pots.contenders)
+        self.assertEqual([1500, 2500], [pots.max_payout("A"), pots.max_payout("C")])
+        self.assertEqual({"A": 1500, "B": 1000}, pots.payout_cents(pots.strengths(evaluator.to_ints(h.board))))
+        self.assertEqual({"A": 15, "B": 10}, cardutils.calc_payouts(h))
+
+        # split between boards, with the odd cents going to the earlier boards
+        self.assertEqual([(500, 334), (500, 333), (500, 333)], [tuple(v for v, _ in p.pots) for p in pots.split(3)])
+
+    def test_frozen_hand_facts(self):
+        for h in scraping.scrape(SAMPLE_HERO_ID, SAMPLE_DOWNLOADER_ID, SAMPLE_LOG):
+            self.assertTrue(h.is_frozen())
+            unfrozen = copy.copy(h)
+            unfrozen._facts = None
+
+            self.assertIs(h.get_position_to_player_mapping(), h.get_position_to_player_mapping())
+            self.assertEqual({pos: list(names) for pos, names in h.get_position_to_player_mapping().items()},
+                             unfrozen.get_position_to_player_mapping())
+            self.assertEqual(list(h.get_street_and_players_where_everyone_is_all_in()[1]),
+                             list(unfrozen.get_street_and_players_where_everyone_is_all_in()[1]))
+            for street in [actions.PRE_FLOP, actions.FLOP, actions.SHOWDOWN, actions.POST_FLOP]:
+                self.assertEqual(unfrozen.players_involved_at_street(street), h.players_involved_at_street(street))
+            for p in h.players:
+                pid = p.name_and_id
+                self.assertEqual((unfrozen.did_player_vpip(pid), unfrozen.did_player_pfr(pid),
+                                  unfrozen.did_player_3bet_pre(pid)),
+                                 (h.did_player_vpip(pid), h.did_player_pfr(pid), h.did_player_3bet_pre(pid)))
+
+    def test_player_registry(self):
+        ids = ["Bob @ b1", "Robert @ b1", "Bob @ b2", "b1", "Bob", "Cat @ Bob", "Cat", "Dan @ d1"]
+        for player_id in ids:
+            players.intern(player_id)
+        for query in ids + ["nobody", "x @ b1", "Bob @ zz"]:
+            m = players.matcher(query)
+            for player_id in ids:
+                self.assertEqual(poker.hands.Player.names_eq(player_id, query),
+                                 m.matches(players.intern(player_id), player_id), (query, player_id))
+
+        # interned ints are per-process, so they're re-interned when unpickled
+        a = actions.Action("Eve @ e1", 0.5, actions.CALL, actions.PRE_FLOP)
+        state = a.__getstate__()
+        self.assertNotIn("player_idx", state)
+        copied = actions.Action.__new__(actions.Action)
+        copied.__setstate__(state)
+        self.assertEqual(a.player_idx, copied.player_idx)
+
     def test_all_in_equities(self):
         h = _create_hand([("A", 10, "AhAd"), ("B", 15, "KhKd")],
                          [
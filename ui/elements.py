@@ -1,7 +1,7 @@
 import typing
 
 import pygame
-import poker.filters as filters
+import poker.ranges as ranges
 import poker.hands as hands
 import poker.cardutils as cardutils
 
@@ -181,12 +181,33 @@ class CardGrid(Element):
         self._squares = {}  # card_code -> ((x, y), CardSquare, subgroup)
         self._build_sub_elements()
 
+    @staticmethod
+    def _hands_by_card_code(hand_list) -> typing.Dict[str, typing.List[hands.Hand]]:
+        # sorts hands by the hero's card code in one pass, rather than filtering once per square
+        res = {cc: [] for cc in ranges.CARD_CODES}
+        for h in hand_list:
+            hero = h.get_hero()
+            if hero is not None:
+                cc = cardutils.to_card_code(hero.cards)
+                if cc in res:
+                    res[cc].append(h)
+        return res
+
     def _build_sub_elements(self):
+        hands_by_code = CardGrid._hands_by_card_code(self.group.hands)
         for idx, cc in enumerate(cardutils.all_card_codes()):
             y = idx // self.grid_dims[0]
             xy = (idx - (y * self.grid_dims[0]), y)
             square = _CardSquare(self, cc)
-            self._squares[cc] = xy, square, self.group.filter(filters.HeroCardFilter(cc))
+            self._squares[cc] = xy, square, hands.HandGroup(hands_by_code[cc], desc=f"F({self.group.desc})")
+
+    def add_hands(self, hand_list: typing.Sequence[hands.Hand]):
+        """adds new hands to the grid (e.g. from a live session), updating only the squares they belong to."""
+        hand_list = list(hand_list)
+        self.group.extend(hand_list)
+        for cc, new_hands in CardGrid._hands_by_card_code(hand_list).items():
+            if len(new_hands) > 0:
+                self._squares[cc][2].extend(new_hands)
 
     def get_title(self):
         return self.group.desc